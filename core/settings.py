@@ -63,6 +63,10 @@ AUTHENTICATION_BACKENDS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # serves collected static files with far-future caching and pre-built gzip/brotli
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # query counts, N+1 warnings and (in DEBUG) Server-Timing, see home/query_metrics.py
+    'home.query_metrics.QueryMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,6 +91,8 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 # 👇 Add your custom one
                 'home.context_processors.categories_context',
+                # CSRF token placeholder in pages rendered for the anonymous page cache
+                'home.page_cache.page_cache_csrf',
             ],
         },
     },
@@ -151,6 +157,22 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR,'staticfiles')
 
+# Production static pipeline: `collectstatic` writes content-hashed copies of every
+# file plus .gz and .br versions (brotli needs the Brotli package), and WhiteNoise
+# serves the hashed names with `Cache-Control: max-age=315360000, immutable`.
+# In DEBUG the plain storage is kept so pages render without running collectstatic.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+            else "core.storage.StaticStorage"
+        ),
+    },
+}
+
 PWA_SERVICE_WORKER_PATH = os.path.join(BASE_DIR, 'static/js', 'serviceworker.js')
 
 MEDIA_URL = '/media/'
@@ -0,0 +1,11 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticStorage(CompressedManifestStaticFilesStorage):
+    """
+    Hashed + gzip/brotli static files (see STORAGES in settings).
+
+    Strict on purpose: a url() or {% static %} pointing at a file that isn't
+    there fails collectstatic (or the render), instead of shipping an
+    unhashed URL that browsers would cache forever.
+    """
@@ -0,0 +1,116 @@
+"""
+Version counters for cache invalidation by tag.
+
+Cached values embed the current version of the tags they depend on in their
+key; bumping a tag makes every such key unreachable at once, and the stale
+entries simply expire.
+
+The counters live in the database (CacheVersion), not in the cache: the cache
+is per process (LocMem), and a bump made by one worker or by a cron command
+has to reach all of them. Reads are remembered in the process (at most
+CACHE_VERSION_MAX_REMEMBERED tags, least recently used dropped first) for
+CACHE_VERSION_TTL seconds, so a page costs at most one version query every
+couple of seconds; a bump is seen at once by the process that made it and
+within that delay by the others.
+
+In-process indexes (products.facets, home.suggest) pass the ids they changed to
+bump_version(); those land in CacheChange, and a worker that is a few versions
+behind replays them with changes_since() instead of rebuilding from scratch.
+Only the last CACHE_CHANGE_LOG_SIZE changes of a tag are kept.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+
+from .models import CacheChange, CacheVersion
+
+VERSION_TTL = getattr(settings, 'CACHE_VERSION_TTL', 2.0)
+CHANGE_LOG_SIZE = getattr(settings, 'CACHE_CHANGE_LOG_SIZE', 1000)
+# per-user tags (liked counts) would otherwise grow the memo with every user seen
+MAX_REMEMBERED = getattr(settings, 'CACHE_VERSION_MAX_REMEMBERED', 10000)
+
+_seen = OrderedDict()  # tag -> (version, read at), least recently read first
+_lock = threading.Lock()
+
+
+def get_versions(tags):
+    """Current version of each tag, in order; one query for whatever isn't remembered."""
+    now = time.monotonic()
+    known = {}
+    with _lock:
+        for tag in tags:
+            seen = _seen.get(tag)
+            if seen and now - seen[1] < VERSION_TTL:
+                known[tag] = seen[0]
+                _seen.move_to_end(tag)
+    missing = [tag for tag in tags if tag not in known]
+    if missing:
+        rows = dict(CacheVersion.objects.filter(name__in=missing).values_list('name', 'version'))
+        with _lock:
+            for tag in missing:
+                known[tag] = rows.get(tag, 0)
+                _seen[tag] = (known[tag], now)
+                _seen.move_to_end(tag)
+            while len(_seen) > MAX_REMEMBERED:
+                _seen.popitem(last=False)
+    return [known[tag] for tag in tags]
+
+
+def get_version(tag):
+    return get_versions([tag])[0]
+
+
+def bump_version(tag, changed=None):
+    """
+    Increment `tag` for every process and return its new version.
+
+    `changed` (a list of JSON-serializable ids) is logged with the new version
+    for changes_since(); a bump without it makes the others start over.
+    """
+    table = connection.ops.quote_name(CacheVersion._meta.db_table)
+    # one atomic upsert (PostgreSQL, SQLite 3.35+): concurrent bumps never share a number
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (name, version) VALUES (%s, 1) "
+            f"ON CONFLICT (name) DO UPDATE SET version = {table}.version + 1 "
+            f"RETURNING version",
+            [tag],
+        )
+        version = cursor.fetchone()[0]
+    if changed is not None:
+        # if this is lost the version simply has no log entry, and the others rebuild
+        CacheChange.objects.create(tag=tag, version=version, ids=list(changed))
+        CacheChange.objects.filter(tag=tag, version__lte=version - CHANGE_LOG_SIZE).delete()
+    with _lock:
+        # read again on next use: the bump is lost if the surrounding transaction rolls back
+        _seen.pop(tag, None)
+    return version
+
+
+def changes_since(tag, version, current):
+    """
+    Every id logged for `tag` after `version` up to `current`, oldest first, or
+    None if a bump in between wasn't logged (trimmed, or made without ids).
+    """
+    if current - version > CHANGE_LOG_SIZE:
+        return None
+    logged = list(
+        CacheChange.objects.filter(tag=tag, version__gt=version, version__lte=current)
+        .order_by('version').values_list('ids', flat=True)
+    )
+    if len(logged) != current - version:
+        return None
+    return [changed_id for ids in logged for changed_id in ids]
+
+
+def forget_versions():
+    """Drop the remembered versions (tests, and anything that just changed the table itself)."""
+    with _lock:
+        _seen.clear()
+
+
+def versioned_key(name, *tags):
+    return f"{name}:" + ':'.join(f"{tag}{version}" for tag, version in zip(tags, get_versions(tags)))
@@ -0,0 +1,72 @@
+"""
+Conditional GET for catalog and blog pages.
+
+A page's validators come from one cheap lookup of its object's updated_at
+(Product, Category and Blog are touched whenever something shown on their page
+changes, see products.services.touch_products and the signals), mixed with what
+differs per visitor: the signed-in user, their CSRF cookie (the page embeds a
+token for it), the session's viewer version (bumped by viewer_changed() when
+they like a product or change their cart) and the header/footer version.
+
+A revisit whose If-None-Match still matches gets a 304 without the view
+running. Pages are marked private and no-cache so browsers always revalidate.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.translation import get_language
+
+from .cache_versions import get_version
+from .context_processors import SITE_CONTEXT_TAG
+
+VIEWER_VERSION_KEY = 'viewer_version'
+
+
+def viewer_changed(request):
+    """The visitor's likes or cart changed: pages they hold are stale for them."""
+    request.session[VIEWER_VERSION_KEY] = request.session.get(VIEWER_VERSION_KEY, 0) + 1
+
+
+def page_etag(request, kind, key, updated_at):
+    parts = [
+        kind, key, updated_at.isoformat(), get_language(),
+        request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        request.session.get(VIEWER_VERSION_KEY, 0),
+        get_version(SITE_CONTEXT_TAG),
+    ]
+    return '"%s"' % hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def conditional_page(kind, last_change):
+    """
+    Answer GET/HEAD with ETag/Last-Modified, and with 304 when the client's copy is current.
+
+    `last_change(*args, **kwargs)` gets the view's URL arguments and returns the
+    page object's updated_at, or None to let the view run (and 404) as usual.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            # pages carrying one-off messages are never reused
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+            updated_at = last_change(*args, **kwargs)
+            if updated_at is None:
+                return view(request, *args, **kwargs)
+
+            key = ':'.join(map(str, [*args, *kwargs.values()]))
+            etag = page_etag(request, kind, key, updated_at)
+            response = get_conditional_response(request, etag=etag, last_modified=int(updated_at.timestamp()))
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers['ETag'] = etag
+                response.headers['Last-Modified'] = http_date(updated_at.timestamp())
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapped
+    return decorator
@@ -1,29 +1,49 @@
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from products.cart import cart_count, get_cart
 from products.models import *
+from products.services import liked_count, liked_product_ids, wishlist_page
 from .models import *
+from .cache_versions import versioned_key
 
-def categories_context(request):
-    main_categories = MainCategory.objects.prefetch_related('categories').all()
-    single_categories = Category.objects.filter(main_category__isnull=True)
-    six_first_category = Category.objects.all().order_by('id')[:6]
-    social_media_links = SocialMediaLinks.objects.last()
-    contact_us = ContactUs.objects.last()
-    about_us = AboutUs.objects.last()
+SITE_CONTEXT_TAG = 'site-context'
+SITE_CONTEXT_TIMEOUT = 60 * 60 * 24
+WISHLIST_PREVIEW_LIMIT = 10
+
+
+def site_context():
+    """Header/footer data shared by every page, cached until one of its models changes (see home.signals)."""
+    key = versioned_key('home:site-context', SITE_CONTEXT_TAG)
+    data = cache.get(key)
+    if data is None:
+        data = {
+            'main_categories': list(MainCategory.objects.prefetch_related('categories')),
+            'single_categories': list(Category.objects.filter(main_category__isnull=True)),
+            'six_first_category': list(Category.objects.all().order_by('id')[:6]),
+            'social_media_links': SocialMediaLinks.objects.last(),
+            'contact_us': ContactUs.objects.last(),
+            'about_us': AboutUs.objects.last(),
+        }
+        cache.set(key, data, SITE_CONTEXT_TIMEOUT)
+    return data
 
+
+def categories_context(request):
     user = request.user
+    # the liked ids are read at most once per request and only if a template asks for them
+    liked = {'liked_product_ids': SimpleLazyObject(lambda: liked_product_ids(request))}
     if user.is_authenticated:
-        user_liked_products = Product.objects.filter(liked_by=user)
-        liked_count = user_liked_products.count()
+        liked['wishlist_preview'] = SimpleLazyObject(lambda: wishlist_page(user.id, per_page=WISHLIST_PREVIEW_LIMIT).items)
+        liked['liked_count'] = SimpleLazyObject(lambda: liked_count(user.id))
     else:
-        user_liked_products = Product.objects.none()  # empty queryset
-        liked_count = 0
-    
-    return {
-        'main_categories': main_categories,
-        'single_categories': single_categories,
-        'user_liked_products': user_liked_products,
-        'liked_count': liked_count,
-        'six_first_category': six_first_category,
-        'social_media_links': social_media_links,
-        'contact_us': contact_us,
-        'about_us': about_us,
-    }
\ No newline at end of file
+        liked['wishlist_preview'] = []
+        liked['liked_count'] = 0
+    liked['cart_count'] = SimpleLazyObject(lambda: cart_count(get_cart(request)))
+
+    # HTMX partials (search results, next page of cards...) never render the header/footer
+    htmx = getattr(request, 'htmx', None)
+    if htmx and not htmx.boosted:
+        return liked
+
+    return {**site_context(), **liked}
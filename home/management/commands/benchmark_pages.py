@@ -0,0 +1,194 @@
+import json
+import math
+import time
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from home.models import Blog
+from home.query_metrics import record_queries
+from products.models import Category, Product, ProductVariant
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every public page with the test client and report latency percentiles, "
+        "throughput and queries per page. --save writes the results as a JSON baseline, "
+        "--compare reports the change against one and fails when a page got slower or "
+        "runs more queries. Run it against a catalog from `manage.py generate_catalog`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per page.")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per page first.")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request (page cache, facet index, ...).")
+        parser.add_argument('--user', help="Sign in as this user instead of browsing anonymously.")
+        parser.add_argument('--only', nargs='+', metavar='NAME', help="Only these pages (names as printed).")
+        parser.add_argument('--save', metavar='PATH', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', metavar='PATH', help="Compare with the results saved in this JSON file.")
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help="With --compare, a p95 this much above the baseline (0.2 = 20%%) is a regression.",
+        )
+
+    def pages(self, user=None):
+        """(name, url) of every public GET page, filled in with objects from the database."""
+        pages = [
+            ('home', reverse('home:home')),
+            ('about_us', reverse('home:about_us')),
+            ('contact_us', reverse('home:contact_us')),
+            ('blog', reverse('home:blog')),
+            ('shop', reverse('products:shop')),
+            ('shop_filtered', reverse('products:shop') + '?min_price=20&max_price=120'),
+            ('shop_cards', reverse('products:shop_cards') + '?min_price=20&max_price=120'),
+            ('cart', reverse('products:cart')),
+        ]
+
+        # the most reviewed and liked product is the heaviest product page
+        product = Product.objects.filter(variants__isnull=False).order_by('-rating_count', '-like_count', 'id').first()
+        if product:
+            variant = ProductVariant.objects.filter(product=product).order_by('id').first()
+            word = product.name.split()[0]
+            pages += [
+                ('product_details', reverse('products:product_details', args=[product.id])),
+                ('product_variant', reverse('products:product_variant', args=[product.id])
+                 + f'?color={variant.color_id}&size={variant.size_id}'),
+                ('product_reviews', reverse('products:product_reviews', args=[product.id])),
+                ('product_search', reverse('home:product_search') + f'?q={word}'),
+                ('search_suggestions', reverse('home:search_suggestions') + f'?q={word[:3]}'),
+            ]
+
+        category = Category.objects.filter(products__isnull=False).order_by('id').first()
+        if category:
+            pages += [
+                ('category_products', reverse('products:category_products', args=[category.slug])),
+                ('category_cards', reverse('products:category_cards', args=[category.slug])),
+            ]
+
+        blog = Blog.objects.filter(is_published=True).order_by('-created_at').first()
+        if blog:
+            pages += [
+                ('blog_detail', reverse('home:blog_detail', args=[blog.slug])),
+                ('search_blog', reverse('home:search_blog') + f'?q={blog.title.split()[0]}'),
+            ]
+
+        if user:
+            # shoppers only see their own wishlist
+            pages.append(('user_wishlist', reverse('products:user_wishlist', args=[user.id])))
+        return pages
+
+    def measure(self, client, url, count, cold):
+        timings, queries, statuses = [], [], set()
+        for _ in range(count):
+            if cold:
+                cache.clear()
+            with record_queries() as stats:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - started)
+            queries.append(stats.count)
+            statuses.add(response.status_code)
+        return timings, queries, statuses
+
+    def handle(self, *args, **options):
+        client = Client(raise_request_exception=False)
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}.")
+            client.force_login(user)
+
+        pages = self.pages(user)
+        if options['only']:
+            unknown = set(options['only']) - {name for name, _ in pages}
+            if unknown:
+                raise CommandError(f"Unknown pages: {', '.join(sorted(unknown))}")
+            pages = [(name, url) for name, url in pages if name in options['only']]
+
+        count = options['requests']
+        if count < 1:
+            raise CommandError("--requests must be at least 1.")
+
+        self.stdout.write(f"{'page':<20} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'queries':>8}  status")
+        results = {}
+        for name, url in pages:
+            self.measure(client, url, options['warmup'], options['cold'])
+            timings, queries, statuses = self.measure(client, url, count, options['cold'])
+            timings.sort()
+            result = results[name] = {
+                'url': url,
+                'p50': percentile(timings, 50) * 1000,
+                'p95': percentile(timings, 95) * 1000,
+                'p99': percentile(timings, 99) * 1000,
+                'rps': count / sum(timings),
+                'queries': max(queries),
+                'status': sorted(statuses),
+            }
+            status = ','.join(map(str, result['status']))
+            self.stdout.write(
+                f"{name:<20} {result['p50']:>7.1f}ms {result['p95']:>6.1f}ms {result['p99']:>6.1f}ms "
+                f"{result['rps']:>8.1f} {result['queries']:>8}  {status}"
+            )
+
+        run = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'requests': count,
+            'cold': options['cold'],
+            'user': options['user'],
+            'products': Product.objects.count(),
+            'variants': ProductVariant.objects.count(),
+            'pages': results,
+        }
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(run, f, indent=2)
+            self.stdout.write(f"Saved to {options['save']}.")
+
+        if options['compare']:
+            self.compare(run, options['compare'], options['threshold'])
+
+    def compare(self, run, path, threshold):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read the baseline {path}: {e}")
+
+        if (baseline.get('products'), baseline.get('cold')) != (run['products'], run['cold']):
+            self.stdout.write(self.style.WARNING(
+                f"The baseline was taken with {baseline.get('products')} products, cold={baseline.get('cold')}; "
+                f"this run has {run['products']}, cold={run['cold']}."
+            ))
+
+        self.stdout.write(f"\n{'page':<20} {'p95 before':>11} {'p95 now':>9} {'change':>8} {'queries':>10}")
+        regressions = []
+        for name, now in run['pages'].items():
+            before = baseline.get('pages', {}).get(name)
+            if before is None:
+                self.stdout.write(f"{name:<20} {'(new page)':>11}")
+                continue
+            change = now['p95'] / before['p95'] - 1 if before['p95'] else 0
+            line = (
+                f"{name:<20} {before['p95']:>9.1f}ms {now['p95']:>7.1f}ms {change:>+8.0%} "
+                f"{before['queries']:>4} → {now['queries']:<4}"
+            )
+            if change > threshold or now['queries'] > before['queries']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"Slower or more queries than the baseline: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS("No regressions."))
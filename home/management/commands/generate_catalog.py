@@ -0,0 +1,253 @@
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from home.cache_versions import bump_version
+from home.context_processors import SITE_CONTEXT_TAG
+from home.models import Blog, BlogCategory, BlogComment, BlogReply
+from home.page_cache import BLOG_TAG, CATALOG_TAG
+from home.suggest import SUGGEST_VERSION_KEY
+from products.facets import FACET_VERSION_KEY
+from products.models import Category, Color, Discount, MainCategory, Product, ProductVariant, Reviews, Size
+from products.pricing import refresh_effective_prices
+from products.services import Like
+
+COLORS = {
+    'Black': '#000000', 'White': '#ffffff', 'Navy': '#1f2a44', 'Red': '#c0392b',
+    'Olive': '#6b7a3a', 'Beige': '#d8c8a8', 'Grey': '#8a8a8a', 'Pink': '#e8a0b4',
+}
+BRANDS = ['Northwind', 'Contoso', 'Fabrikam', 'Tailspin', 'Litware', 'Adatum', 'Proseware', 'Wingtip']
+GARMENTS = ['Shirt', 'T-Shirt', 'Dress', 'Jacket', 'Coat', 'Sweater', 'Hoodie', 'Skirt', 'Jeans', 'Trousers']
+ADJECTIVES = ['Classic', 'Slim', 'Relaxed', 'Cropped', 'Oversized', 'Linen', 'Cotton', 'Wool', 'Denim', 'Pleated']
+WORDS = (
+    'soft fabric fit wash cold season layer everyday tailored stitch comfort style '
+    'colour cut length sleeve pocket collar warm light breathable durable'
+).split()
+# more fours and fives than ones, as on most shops
+RATING_WEIGHTS = [5, 5, 12, 30, 48]
+
+PLACEHOLDER_IMAGE = 'synthetic/placeholder.jpg'
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic catalog for load testing. The same --seed "
+        "gives the same catalog. Rows are inserted with bulk_create, then effective prices, "
+        "listing cards and rating/like totals are computed as the shop would keep them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--main-categories', type=int, default=5)
+        parser.add_argument('--categories', type=int, default=40)
+        parser.add_argument('--products', type=int, default=5_000)
+        parser.add_argument('--variants', type=int, default=4, help="Variants per product (at most one per color and size).")
+        parser.add_argument('--discounts', type=int, default=100)
+        parser.add_argument('--users', type=int, default=1_000, help="Shoppers to spread the likes over.")
+        parser.add_argument('--reviews', type=int, default=20_000)
+        parser.add_argument('--likes', type=int, default=50_000)
+        parser.add_argument('--blogs', type=int, default=100)
+        parser.add_argument('--comments', type=int, default=1_000, help="Blog comments; a third of them get a reply.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='Synthetic', help="Starts every generated name, so runs with different prefixes don't collide.")
+        parser.add_argument('--batch-size', type=int, default=1_000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            categories = self.categories(options['main_categories'], options['categories'])
+            products = self.products(categories, options['products'], options['users'], options['reviews'], options['likes'])
+            variants = self.variants(products, options['variants'])
+            self.discounts(categories, products, variants, options['discounts'])
+            self.blogs(options['blogs'], options['comments'])
+
+            self.stdout.write("Computing effective prices and listing cards...")
+            refresh_effective_prices(ProductVariant.objects.filter(product__in=products))
+            call_command('rebuild_product_cards', batch_size=500, stdout=self.stdout)
+
+        # every cache built from the catalog is out of date, in this process and the web workers
+        for tag in (FACET_VERSION_KEY, SUGGEST_VERSION_KEY, SITE_CONTEXT_TAG, CATALOG_TAG, BLOG_TAG):
+            bump_version(tag)
+
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s."))
+
+    def create(self, model, objs):
+        objs = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.stdout.write(f"{len(objs):>8} {model._meta.verbose_name_plural}")
+        return objs
+
+    def name(self, kind, n):
+        return f"{self.prefix} {kind} {n}"
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    def popular(self, population, k):
+        """k picks from `population`, the first items far more often than the last (power law)."""
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(len(population))]
+        return self.rng.choices(population, weights, k=k)
+
+    # --- catalog --------------------------------------------------------
+
+    def categories(self, main_count, count):
+        mains = self.create(MainCategory, [
+            MainCategory(name=self.name('department', n), slug=slugify(self.name('department', n)), icon=PLACEHOLDER_IMAGE)
+            for n in range(main_count)
+        ])
+        categories = []
+        for n in range(count):
+            name = self.name('category', n)
+            categories.append(Category(
+                main_category=self.rng.choice(mains) if mains else None,
+                name=name,
+                slug=slugify(name),
+                description=self.sentence(12),
+                image=PLACEHOLDER_IMAGE,
+                second_image=PLACEHOLDER_IMAGE,
+                third_image=PLACEHOLDER_IMAGE,
+            ))
+        return self.create(Category, categories)
+
+    def products(self, categories, count, user_count, review_count, like_count):
+        users = self.create(User, [
+            User(username=slugify(self.name('shopper', n)), password=make_password(None))
+            for n in range(user_count)
+        ])
+
+        # decide reviews and likes first so the products are inserted with their totals
+        ranks = list(range(count))
+        self.rng.shuffle(ranks)
+        reviewed = self.popular(ranks, review_count) if count else []
+        ratings = self.rng.choices(range(1, 6), RATING_WEIGHTS, k=len(reviewed))
+        liked = set()
+        if count and users:
+            for product in self.popular(ranks, like_count):
+                liked.add((product, self.rng.randrange(len(users))))
+
+        histograms = [[0] * 5 for _ in range(count)]
+        for product, rating in zip(reviewed, ratings):
+            histograms[product][rating - 1] += 1
+        likes = Counter(product for product, _ in liked)
+
+        products = []
+        for n in range(count):
+            histogram = histograms[n]
+            reviews = sum(histogram)
+            total = sum(stars * k for stars, k in zip(range(1, 6), histogram))
+            products.append(Product(
+                category=self.rng.choice(categories) if categories else None,
+                name=f"{self.rng.choice(ADJECTIVES)} {self.rng.choice(GARMENTS)} {self.prefix} {n}",
+                description=self.sentence(30),
+                brand=self.rng.choice(BRANDS),
+                like_count=likes[n],
+                rating_count=reviews,
+                rating_avg=(Decimal(total) / reviews).quantize(Decimal('0.01')) if reviews else Decimal(0),
+                rating_histogram=histogram,
+                is_featured=n < 12,
+                featured_order=n,
+            ))
+        products = self.create(Product, products)
+
+        self.create(Reviews, [
+            Reviews(product=products[product], name=self.name('reviewer', n), detail=self.sentence(20), rating=rating)
+            for n, (product, rating) in enumerate(zip(reviewed, ratings))
+        ])
+        self.create(Like, [
+            Like(product=products[product], user=users[user]) for product, user in sorted(liked)
+        ])
+        return products
+
+    def variants(self, products, per_product):
+        sizes = [Size.objects.get_or_create(select=select, defaults={'size': label})[0] for select, label in Size.SIZE_CHOICES]
+        colors = [Color.objects.get_or_create(name=name, defaults={'color': code})[0] for name, code in COLORS.items()]
+        combinations = [(size, color) for size in sizes for color in colors]
+
+        variants = []
+        for product in products:
+            base = Decimal(self.rng.randrange(10, 200)) + Decimal('0.99')
+            for size, color in self.rng.sample(combinations, min(per_product, len(combinations))):
+                variants.append(ProductVariant(
+                    product=product,
+                    size=size,
+                    color=color,
+                    price=base,
+                    effective_price=base,
+                    image=PLACEHOLDER_IMAGE,
+                    image_hover=PLACEHOLDER_IMAGE,
+                    # one variant in ten is sold out
+                    stock=0 if self.rng.random() < 0.1 else self.rng.randrange(1, 50),
+                ))
+        return self.create(ProductVariant, variants)
+
+    def discounts(self, categories, products, variants, count):
+        discounts = []
+        for n in range(count):
+            target = self.rng.choices(['category', 'product', 'variant'], [2, 7, 1])[0]
+            targets = {'category': categories, 'product': products, 'variant': variants}[target]
+            if not targets:
+                continue
+            start = self.now - timedelta(days=self.rng.randrange(0, 30))
+            # a quarter run open-ended, some are scheduled for later
+            if self.rng.random() < 0.25:
+                end = None
+            else:
+                end = start + timedelta(days=self.rng.randrange(1, 60))
+            if self.rng.random() < 0.1:
+                start, end = self.now + timedelta(days=self.rng.randrange(1, 10)), None
+            discounts.append(Discount(
+                name=self.name('sale', n),
+                amount=Decimal(self.rng.choice([5, 10, 15, 20, 25, 30, 40, 50])),
+                start_date=start,
+                end_date=end,
+                **{target: self.rng.choice(targets)},
+            ))
+        return self.create(Discount, discounts)
+
+    # --- blog -----------------------------------------------------------
+
+    def blogs(self, count, comment_count):
+        categories = self.create(BlogCategory, [
+            BlogCategory(name=self.name('topic', n), slug=slugify(self.name('topic', n))) for n in range(5)
+        ])
+        blogs = []
+        for n in range(count):
+            title = self.name('post', n)
+            paragraphs = [self.sentence(40) for _ in range(4)]
+            blogs.append(Blog(
+                title=title,
+                slug=slugify(title),
+                category=self.rng.choice(categories),
+                author=self.name('author', n % 7),
+                image=PLACEHOLDER_IMAGE,
+                short_description=paragraphs[0],
+                content=''.join(f'<p>{p}</p>' for p in paragraphs),
+                # Blog.save() fills this; bulk_create doesn't call it
+                content_text='\n'.join(paragraphs),
+                created_at=self.now - timedelta(days=count - n),
+            ))
+        blogs = self.create(Blog, blogs)
+        if not blogs:
+            return
+
+        comments = self.create(BlogComment, [
+            BlogComment(blog=blog, name=self.name('reader', n), comment=self.sentence(15))
+            for n, blog in enumerate(self.popular(blogs, comment_count))
+        ])
+        self.create(BlogReply, [
+            BlogReply(comment=comment, name=self.name('editor', 0), reply_text=self.sentence(10))
+            for comment in comments[::3]
+        ])
@@ -0,0 +1,80 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+
+def human(size):
+    return f"{size / 1024 / 1024:.2f} MB" if size >= 1024 * 1024 else f"{size / 1024:.0f} KB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encode oversized PNGs under static/assets/img as WebP next to the original "
+        "(photo.png -> photo.webp) and report the bytes saved. A WebP is only served "
+        "where the stylesheet or a template points at it: the hero and banner rules in "
+        "assets/css/style.css list theirs in image-set() before the PNG."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=os.path.join(settings.BASE_DIR, 'static', 'assets', 'img'))
+        parser.add_argument('--min-size', type=int, default=200, help="Only PNGs larger than this many KB.")
+        parser.add_argument(
+            '--quality', type=int, default=80,
+            help="Lossy WebP quality; 80 keeps photos clean at a fraction of the PNG's size.",
+        )
+        parser.add_argument('--lossless', action='store_true', help="Encode lossless instead (much larger).")
+        parser.add_argument('--dry-run', action='store_true', help="Report savings without writing files.")
+
+    def encode(self, source, target, quality, lossless):
+        with Image.open(source) as image:
+            image.load()
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            if lossless:
+                image.save(target, 'WEBP', lossless=True, quality=80, method=4)
+            else:
+                image.save(target, 'WEBP', quality=quality, alpha_quality=100, method=4)
+
+    def handle(self, *args, **options):
+        root = options['path']
+        if not os.path.isdir(root):
+            raise CommandError(f"{root} is not a directory")
+        min_size = options['min_size'] * 1024
+
+        before = after = converted = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                if not filename.lower().endswith('.png'):
+                    continue
+                source = os.path.join(dirpath, filename)
+                size = os.path.getsize(source)
+                if size < min_size:
+                    continue
+
+                target = os.path.splitext(source)[0] + '.webp'
+                tmp = target + '.tmp'
+                self.encode(source, tmp, options['quality'], options['lossless'])
+                new_size = os.path.getsize(tmp)
+                if new_size >= size or options['dry_run']:
+                    os.remove(tmp)
+                if new_size >= size:
+                    self.stdout.write(f"  skip {os.path.relpath(source, root)}: WebP is not smaller")
+                    continue
+                if not options['dry_run']:
+                    os.replace(tmp, target)
+
+                before += size
+                after += new_size
+                converted += 1
+                self.stdout.write(
+                    f"  {os.path.relpath(source, root)}: {human(size)} -> {human(new_size)} "
+                    f"(-{100 - new_size * 100 // size}%)"
+                )
+
+        saved = before - after
+        verb = "Would save" if options['dry_run'] else "Saved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {human(saved)} on {converted} PNGs ({human(before)} -> {human(after)})."
+        ))
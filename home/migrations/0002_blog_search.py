@@ -0,0 +1,111 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:04
+
+import html
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+# Full-text search for blogs (see products/migrations/0004_product_search.py
+# and home/search.py). The RichText content is indexed through the stripped
+# plain-text copy in content_text, never as raw HTML.
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE home_blog ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION home_blog_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.short_description, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.content_text, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER home_blog_search_trigger
+    BEFORE INSERT OR UPDATE OF title, short_description, content_text ON home_blog
+    FOR EACH ROW EXECUTE FUNCTION home_blog_search_update()
+    """,
+    "UPDATE home_blog SET title = title",
+    "CREATE INDEX home_blog_search_idx ON home_blog USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS home_blog_search_trigger ON home_blog",
+    "DROP FUNCTION IF EXISTS home_blog_search_update()",
+    "ALTER TABLE home_blog DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE home_blog_fts USING fts5(
+        title, short_description, content_text, content='home_blog', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER home_blog_fts_ai AFTER INSERT ON home_blog BEGIN
+        INSERT INTO home_blog_fts(rowid, title, short_description, content_text)
+        VALUES (new.id, new.title, new.short_description, new.content_text);
+    END
+    """,
+    """
+    CREATE TRIGGER home_blog_fts_ad AFTER DELETE ON home_blog BEGIN
+        INSERT INTO home_blog_fts(home_blog_fts, rowid, title, short_description, content_text)
+        VALUES ('delete', old.id, old.title, old.short_description, old.content_text);
+    END
+    """,
+    """
+    CREATE TRIGGER home_blog_fts_au AFTER UPDATE ON home_blog BEGIN
+        INSERT INTO home_blog_fts(home_blog_fts, rowid, title, short_description, content_text)
+        VALUES ('delete', old.id, old.title, old.short_description, old.content_text);
+        INSERT INTO home_blog_fts(rowid, title, short_description, content_text)
+        VALUES (new.id, new.title, new.short_description, new.content_text);
+    END
+    """,
+    "INSERT INTO home_blog_fts(home_blog_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS home_blog_fts_ai",
+    "DROP TRIGGER IF EXISTS home_blog_fts_ad",
+    "DROP TRIGGER IF EXISTS home_blog_fts_au",
+    "DROP TABLE IF EXISTS home_blog_fts",
+]
+
+
+def fill_content_text(apps, schema_editor):
+    Blog = apps.get_model('home', 'Blog')
+    for blog in Blog.objects.only('id', 'content').iterator():
+        Blog.objects.filter(id=blog.id).update(content_text=html.unescape(strip_tags(blog.content or '')))
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor not in statements:
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements[vendor]:
+                cursor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='content_text',
+            field=models.TextField(blank=True, editable=False, help_text='Plain text of content, used by search'),
+        ),
+        migrations.RunPython(fill_content_text, migrations.RunPython.noop),
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_cache_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=150)),
+                ('version', models.PositiveBigIntegerField()),
+                ('ids', models.JSONField(default=list)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tag', 'version'), name='unique_cache_change_version')],
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils.text import slugify
 from django.utils import timezone
+from django.utils.html import strip_tags
+import html
 from ckeditor.fields import RichTextField
 # Create your models here.
 
@@ -45,6 +47,7 @@ class Blog(models.Model):
     image = models.ImageField(upload_to="blogs/")
     short_description = models.CharField(max_length=400, blank=True)
     content = RichTextField()  # ✅ replaces TextField
+    content_text = models.TextField(blank=True, editable=False, help_text="Plain text of content, used by search")
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     is_published = models.BooleanField(default=True)
@@ -52,6 +55,7 @@ class Blog(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        self.content_text = html.unescape(strip_tags(self.content or ''))
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -80,4 +84,27 @@ class SocialMediaLinks(models.Model):
     tiktok = models.URLField()
 
     def __str__(self):
-        return f"Whatsapp {self.whatsapp} Instagram {self.instagram} TikTok {self.tiktok}"
\ No newline at end of file
+        return f"Whatsapp {self.whatsapp} Instagram {self.instagram} TikTok {self.tiktok}"
+
+class CacheVersion(models.Model):
+    """Invalidation counter shared by every worker and cron job (see home.cache_versions)."""
+    name = models.CharField(max_length=150, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class CacheChange(models.Model):
+    """Ids touched by one CacheVersion bump, replayed by workers that are behind (see home.cache_versions)."""
+    tag = models.CharField(max_length=150)
+    version = models.PositiveBigIntegerField()
+    ids = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'version'], name='unique_cache_change_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag} v{self.version}"
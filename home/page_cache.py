@@ -0,0 +1,149 @@
+"""
+Full-page cache for anonymous shoppers.
+
+Pages are cached per path, language and the query parameters the view reads
+(the `query` argument of cache_anonymous_page; anything else in the query
+string is dropped before the view sees it, so `?utm_source=...` or `?x=1`
+share one copy). Every copy is stamped with the versions of the tags it
+depends on (home.cache_versions). Saving a model bumps its tag (see
+home.signals), which makes the cached pages stale rather than unreachable:
+
+    fresh      versions match and younger than PAGE_FRESH: served as is
+    stale      older, or a tag was bumped: served to everyone except the one
+               request per worker that wins the regeneration lock and renders
+               the page again (no stampede when a hot page expires)
+    missing    the lock winner renders and stores it; the others render it
+               too rather than hold a worker waiting for the winner
+
+Signed-in shoppers, anonymous shoppers with a cart and requests carrying
+messages always get the view. Pages are rendered with a placeholder in place of
+the CSRF token (page_cache_csrf, a context processor) and every response gets
+the visitor's own token substituted in.
+
+Tag versions are shared through the database, so a bump from any worker
+makes every worker's copy stale. Cron jobs that write without signals bump
+the tags themselves (the discount schedule, via products.pricing).
+
+The pages and the regeneration lock live in the default cache, which is
+LocMem (no CACHES setting): each worker process has its own copy of every
+page and its own lock, so single flight holds per worker, not per site. With
+N workers an expired or bumped page is rendered up to N times, once in each.
+Since every change bumps a tag, PAGE_FRESH doesn't decide how soon changes
+show; it only caps how often each worker re-renders a page nobody changed,
+and is long for that reason.
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse, QueryDict
+from django.middleware.csrf import get_token
+from django.utils.translation import get_language
+
+from products.cart import CART_SESSION_KEY
+
+from .cache_versions import get_versions
+from .context_processors import SITE_CONTEXT_TAG
+
+CATALOG_TAG = 'catalog'
+BLOG_TAG = 'blog'
+
+PAGE_FRESH = 60 * 5
+PAGE_STALE = 60 * 10
+LOCK_TIMEOUT = 30
+CSRF_PLACEHOLDER = 'page-cache-csrf-token'
+
+
+def page_cache_csrf(request):
+    """Context processor: the CSRF token placeholder while a page is rendered for the cache."""
+    return {'csrf_token': CSRF_PLACEHOLDER} if getattr(request, 'page_cache_render', False) else {}
+
+
+def cacheable(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # HTMX partials share URLs with the pages
+    if getattr(request, 'htmx', False):
+        return False
+    # the header shows the cart's count
+    if request.session.get(CART_SESSION_KEY):
+        return False
+    return not len(messages.get_messages(request))
+
+
+def page_query(request, query):
+    """The `query` parameters of the request, the only ones a cached page depends on."""
+    return QueryDict(urlencode([(name, value) for name in query for value in request.GET.getlist(name)]))
+
+
+def page_key(request, query=()):
+    # sorted: ?size=1&color=2 and ?color=2&size=1 are the same page
+    params = sorted((name, value) for name, values in page_query(request, query).lists() for value in values)
+    digest = hashlib.md5(f"{request.path}?{urlencode(params)}".encode()).hexdigest()
+    return f"page:{get_language()}:{digest}"
+
+
+def fill_csrf(request, response):
+    if response.streaming:
+        return response
+    response.content = response.content.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+    return response
+
+
+def serve(request, entry, state):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response.headers['X-Page-Cache'] = state
+    return fill_csrf(request, response)
+
+
+def cache_anonymous_page(*tags, query=()):
+    """
+    Serve the view's page to anonymous GETs from the page cache, see the module
+    docstring. `query` names every GET parameter the view reads.
+    """
+    tags = (SITE_CONTEXT_TAG, *tags)
+
+    def decorator(view):
+        def render(request, args, kwargs):
+            request.page_cache_render = True
+            # the page is rendered for every query that maps to this key
+            request.GET = page_query(request, query)
+            request.META['QUERY_STRING'] = request.GET.urlencode()
+            return view(request, *args, **kwargs)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, query)
+            versions = get_versions(tags)
+            entry = cache.get(key)
+            if entry is not None and entry['versions'] == versions and entry['fresh_until'] > time.time():
+                return serve(request, entry, 'hit')
+
+            lock = key + ':lock'
+            if not cache.add(lock, 1, LOCK_TIMEOUT):
+                # another request is rendering it
+                if entry is not None:
+                    return serve(request, entry, 'stale')
+                return fill_csrf(request, render(request, args, kwargs))
+
+            try:
+                response = render(request, args, kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    cache.set(key, {
+                        'content': response.content,
+                        'content_type': response['Content-Type'],
+                        'versions': versions,
+                        'fresh_until': time.time() + PAGE_FRESH,
+                    }, PAGE_FRESH + PAGE_STALE)
+            finally:
+                cache.delete(lock)
+            response.headers['X-Page-Cache'] = 'miss'
+            return fill_csrf(request, response)
+        return wrapped
+    return decorator
@@ -0,0 +1,90 @@
+"""
+Per-request database instrumentation.
+
+record_queries() counts the queries run inside it, their total time and how
+often each statement shape (the SQL with its parameters left out and IN lists
+collapsed) ran. QueryMetricsMiddleware does that for every request. When a
+shape runs more than QUERY_REPEAT_THRESHOLD times it logs a warning naming the
+view, which is what an N+1 loop looks like. In DEBUG it adds a Server-Timing
+header that the browser's network panel shows:
+
+    Server-Timing: db;dur=12.4;desc="18 queries", app;dur=40.1
+
+Tests put budgets on views with home.testing.QueryBudgetMixin.assertMaxQueries.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+REPEAT_THRESHOLD = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 10)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def fingerprint(sql):
+    """The shape of a statement: literals and IN lists of any length look the same."""
+    return LITERAL.sub('?', IN_LIST.sub('IN (...)', sql))
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """Statement shapes that ran more than `threshold` times, most repeated first."""
+        return [(sql, n) for sql, n in self.shapes.most_common() if n > threshold]
+
+
+@contextmanager
+def record_queries():
+    """
+        with record_queries() as stats:
+            ...
+        stats.count, stats.duration, stats.repeated()
+    """
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+class QueryMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with record_queries() as stats:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        for sql, n in stats.repeated():
+            view = getattr(request.resolver_match, 'view_name', None) or request.path
+            logger.warning("%s ran the same query %d times (N+1?): %s", view, n, sql)
+
+        if settings.DEBUG:
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+                f'app;dur={elapsed * 1000:.1f}'
+            )
+        return response
@@ -0,0 +1,129 @@
+"""
+Write-coalesced recent-search history.
+
+Searches are collected in a per-worker buffer and written in batches with a
+single upsert (bulk_create ... ON CONFLICT (user, query) DO UPDATE). The
+buffer is flushed once it is due (max_pending searches, or the oldest is
+max_age seconds old) from home.signals at the end of a request, after the
+response has gone out.
+
+While a query sits in the buffer, any pending prefix of it from the same user
+is dropped, so words typed halfway are never stored; a flush also drops the
+user's last stored search if a new one continues it within TYPING_WINDOW
+(typing that straddled two flushes). Each flush trims the affected users back
+to RECENT_SEARCH_LIMIT rows.
+"""
+import atexit
+import threading
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from products.models import RecentSearch
+
+RECENT_SEARCH_LIMIT = 20
+MIN_QUERY_LENGTH = 2
+TYPING_WINDOW = timedelta(minutes=1)
+
+
+def continues(previous, query):
+    """True if `query` is `previous` typed further ("sne" -> "sneaker")."""
+    return previous != query and query.casefold().startswith(previous.casefold())
+
+
+class RecentSearchBuffer:
+    def __init__(self, max_pending=200, max_age=5.0):
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.pending = {}  # user_id -> {query: searched_at}
+        self.size = 0
+        self.oldest = None
+
+    def record(self, user_id, query):
+        query = ' '.join((query or '').split())[:100]
+        if len(query) < MIN_QUERY_LENGTH:
+            return
+
+        with self.lock:
+            queries = self.pending.setdefault(user_id, {})
+            for previous in list(queries):
+                # "sne" -> "snea" -> "sneaker": only the finished word survives
+                if continues(previous, query):
+                    del queries[previous]
+                    self.size -= 1
+            if query not in queries:
+                self.size += 1
+            queries[query] = timezone.now()
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+
+    def is_due(self):
+        with self.lock:
+            return self.size >= self.max_pending or (
+                self.oldest is not None and time.monotonic() - self.oldest >= self.max_age
+            )
+
+    def flush_if_due(self):
+        return self.flush() if self.is_due() else 0
+
+    def pending_for(self, user_id):
+        """Buffered searches for one user, newest first (so reads see unflushed writes)."""
+        with self.lock:
+            queries = dict(self.pending.get(user_id, {}))
+        return sorted(queries.items(), key=lambda item: item[1], reverse=True)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.size, self.oldest = 0, None
+        if not pending:
+            return 0
+
+        # a prefix that made it into the table in an earlier flush
+        stale = []
+        for user_id, queries in pending.items():
+            last = RecentSearch.objects.filter(user_id=user_id).order_by('-created_at').first()
+            if last and any(
+                continues(last.query, query) and searched_at - last.created_at <= TYPING_WINDOW
+                for query, searched_at in queries.items()
+            ):
+                stale.append(last.id)
+        if stale:
+            RecentSearch.objects.filter(id__in=stale).delete()
+
+        rows = [
+            RecentSearch(user_id=user_id, query=query, created_at=searched_at)
+            for user_id, queries in pending.items()
+            for query, searched_at in queries.items()
+        ]
+        RecentSearch.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'query'],
+            update_fields=['created_at'],
+        )
+        for user_id in pending:
+            keep = RecentSearch.objects.filter(user_id=user_id).order_by('-created_at').values('id')[:RECENT_SEARCH_LIMIT]
+            RecentSearch.objects.filter(user_id=user_id).exclude(id__in=keep).delete()
+        return len(rows)
+
+
+_buffer = RecentSearchBuffer()
+atexit.register(lambda: _buffer.flush())
+
+
+def recent_search_buffer():
+    return _buffer
+
+
+def recent_searches(user, limit=5):
+    """The user's latest searches, buffered ones included, newest first."""
+    result = [RecentSearch(user=user, query=q, created_at=at) for q, at in _buffer.pending_for(user.id)]
+    seen = {s.query for s in result}
+    for search in user.recent_searches.all()[:limit]:
+        if search.query not in seen:
+            result.append(search)
+            seen.add(search.query)
+    return result[:limit]
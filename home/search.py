@@ -0,0 +1,87 @@
+"""
+Full-text search over products and blogs.
+
+The index itself is maintained by the database (see the *_search migrations):
+PostgreSQL gets a trigger-maintained tsvector column with a GIN index and SQLite
+gets FTS5 tables, so tests and local setups work without Postgres. Each backend
+turns the user's text into a prefix query (the last word may be incomplete while
+the user is typing) and returns ids ordered by rank.
+"""
+import re
+
+from django.db import connection
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def query_terms(query):
+    return WORD_RE.findall((query or '').lower())[:8]
+
+
+class SearchBackend:
+    product_table = None
+    blog_table = None
+
+    def ranked_ids(self, table, terms, limit):
+        raise NotImplementedError
+
+    def search_products(self, query, limit=10):
+        """Product ids best matching `query`, best first."""
+        terms = query_terms(query)
+        return self.ranked_ids(self.product_table, terms, limit) if terms else []
+
+    def search_blogs(self, query, limit=5):
+        """Blog ids best matching `query`, best first."""
+        terms = query_terms(query)
+        return self.ranked_ids(self.blog_table, terms, limit) if terms else []
+
+
+class PostgresSearchBackend(SearchBackend):
+    product_table = 'products_product'
+    blog_table = 'home_blog'
+
+    def ranked_ids(self, table, terms, limit):
+        # every word must match; the last one as a prefix
+        tsquery = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+        sql = (
+            f"SELECT id FROM {table}, to_tsquery('simple', %s) query "
+            f"WHERE search_vector @@ query "
+            f"ORDER BY ts_rank(search_vector, query) DESC, id DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SqliteSearchBackend(SearchBackend):
+    product_table = 'products_product_fts'
+    blog_table = 'home_blog_fts'
+    # bm25 column weights, same order as the FTS5 columns (title-like column first)
+    weights = (10.0, 5.0, 1.0)
+
+    def ranked_ids(self, table, terms, limit):
+        match = ' '.join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+        weights = ', '.join(str(w) for w in self.weights)
+        sql = (
+            f"SELECT rowid FROM {table} WHERE {table} MATCH %s "
+            f"ORDER BY bm25({table}, {weights}), rowid DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match.strip(), limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+def get_search_backend():
+    return BACKENDS[connection.vendor]()
+
+
+def in_rank_order(queryset, ids):
+    """Fetch `ids` from `queryset` and return them in the given order."""
+    objects = queryset.in_bulk(ids)
+    return [objects[i] for i in ids if i in objects]
@@ -0,0 +1,100 @@
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from products.images import build_uploads, remember_uploads
+from products.models import Category, Color, Discount, MainCategory, Product, ProductVariant, ProductVariantImage, Reviews, Size
+
+from .cache_versions import bump_version
+from .context_processors import SITE_CONTEXT_TAG
+from .page_cache import BLOG_TAG, CATALOG_TAG
+from .models import AboutUs, Blog, BlogCategory, BlogComment, BlogReply, ContactUs, SocialMediaLinks
+from .recent_searches import recent_search_buffer
+from .suggest import prefix_index
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    prefix_index().product_changed(instance.id, instance.name, instance.brand)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    prefix_index().product_changed(instance.id, deleted=True)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    prefix_index().category_changed(instance.id, instance.name, instance.slug)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    prefix_index().category_changed(instance.id, deleted=True)
+
+
+@receiver([post_save, post_delete], sender=MainCategory)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SocialMediaLinks)
+@receiver([post_save, post_delete], sender=ContactUs)
+@receiver([post_save, post_delete], sender=AboutUs)
+def site_context_changed(sender, **kwargs):
+    bump_version(SITE_CONTEXT_TAG)
+
+
+# anonymous page cache tags, see home.page_cache
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=ProductVariantImage)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Discount)
+@receiver([post_save, post_delete], sender=Reviews)
+@receiver([post_save, post_delete], sender=Color)
+@receiver([post_save, post_delete], sender=Size)
+def catalog_changed(sender, **kwargs):
+    bump_version(CATALOG_TAG)
+
+
+@receiver([post_save, post_delete], sender=Blog)
+@receiver([post_save, post_delete], sender=BlogCategory)
+@receiver([post_save, post_delete], sender=BlogComment)
+@receiver([post_save, post_delete], sender=BlogReply)
+def blog_changed(sender, **kwargs):
+    bump_version(BLOG_TAG)
+
+
+# blog_detail's ETag/Last-Modified come from Blog.updated_at (home.conditional)
+@receiver([post_save, post_delete], sender=BlogComment)
+def blog_comment_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Blog.objects.filter(id=instance.blog_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=BlogReply)
+def blog_reply_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Blog.objects.filter(comments=instance.comment_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=BlogCategory)
+def blog_category_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Blog.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(request_finished)
+def flush_recent_searches(sender, **kwargs):
+    # after the response has been sent, so no search waits on the write
+    recent_search_buffer().flush_if_due()
+
+
+pre_save.connect(remember_uploads, sender=Blog)
+post_save.connect(build_uploads, sender=Blog)
@@ -0,0 +1,222 @@
+"""
+Per-worker prefix index for search-as-you-type suggestions.
+
+Product names, brands and category names are flattened into one sorted list of
+(key, entry id) pairs, where every word of a name is a key as well as the full
+name. A prefix lookup is a bisect into that list followed by a short scan, so
+suggestions are served from memory without touching the database.
+
+The index is built on first use and patched from home.signals when products or
+categories change. Each patch logs the changed entry with the version bump
+(home.cache_versions); other workers re-read just those entries and rebuild only
+when the log no longer reaches back to their version.
+"""
+import bisect
+import threading
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+from django.urls import reverse
+
+from products.models import Category, Product
+
+from .cache_versions import bump_version, changes_since, get_version
+
+SUGGEST_VERSION_KEY = 'home:suggest-index-version'
+SCAN_LIMIT = 200
+
+KIND_ORDER = {'category': 0, 'brand': 1, 'product': 2}
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    kind: str
+    label: str
+    url: str
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.keys = []  # sorted [(key, entry_id)]
+        self.entries = {}  # entry_id -> Suggestion
+        self.brand_refs = {}  # normalized brand -> set of product ids using it
+
+    # --- building -------------------------------------------------------
+
+    @staticmethod
+    def _keys_for(label):
+        name = normalize(label)
+        words = name.split()
+        return {name, *words}
+
+    def _insert(self, entry_id, suggestion):
+        self.entries[entry_id] = suggestion
+        for key in self._keys_for(suggestion.label):
+            bisect.insort(self.keys, (key, entry_id))
+
+    def _delete(self, entry_id):
+        suggestion = self.entries.pop(entry_id, None)
+        if suggestion is None:
+            return
+        for key in self._keys_for(suggestion.label):
+            i = bisect.bisect_left(self.keys, (key, entry_id))
+            if i < len(self.keys) and self.keys[i] == (key, entry_id):
+                del self.keys[i]
+
+    @staticmethod
+    def _product_entry(product_id, name):
+        return ('product', product_id), Suggestion('product', name, reverse('products:product_details', args=[product_id]))
+
+    @staticmethod
+    def _brand_entry(brand):
+        url = f"{reverse('home:product_search')}?{urlencode({'q': brand})}"
+        return ('brand', normalize(brand)), Suggestion('brand', brand, url)
+
+    @staticmethod
+    def _category_entry(category_id, name, slug):
+        return ('category', category_id), Suggestion('category', name, reverse('products:category_products', args=[slug]))
+
+    def rebuild(self):
+        version = get_version(SUGGEST_VERSION_KEY)
+        entries = {}
+        brand_refs = {}
+        for product_id, name, brand in Product.objects.values_list('id', 'name', 'brand').iterator(chunk_size=5000):
+            entry_id, suggestion = self._product_entry(product_id, name)
+            entries[entry_id] = suggestion
+            if brand:
+                entry_id, suggestion = self._brand_entry(brand)
+                entries.setdefault(entry_id, suggestion)
+                brand_refs.setdefault(entry_id[1], set()).add(product_id)
+        for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            entry_id, suggestion = self._category_entry(category_id, name, slug)
+            entries[entry_id] = suggestion
+
+        keys = sorted(
+            (key, entry_id)
+            for entry_id, suggestion in entries.items()
+            for key in self._keys_for(suggestion.label)
+        )
+        with self.lock:
+            self.entries, self.keys, self.brand_refs = entries, keys, brand_refs
+            self.version = version
+
+    # --- incremental updates -------------------------------------------
+
+    def _patch(self, entry_id, apply):
+        """Log `entry_id` as changed and run `apply()` if the local index is current."""
+        with self.lock:
+            seen_version = self.version
+            new_version = bump_version(SUGGEST_VERSION_KEY, [entry_id])
+            if seen_version is not None and new_version == seen_version + 1:
+                apply()
+                self.version = new_version
+            elif not self._catch_up(new_version):
+                self.version = None
+
+    def _catch_up(self, current):
+        """Re-read the entries logged since our version; False if the log doesn't reach back."""
+        if self.version is None:
+            return False
+        changed = changes_since(SUGGEST_VERSION_KEY, self.version, current)
+        if changed is None:
+            return False
+        product_ids = {entry_id for kind, entry_id in changed if kind == 'product'}
+        category_ids = {entry_id for kind, entry_id in changed if kind == 'category'}
+        if product_ids:
+            products = {
+                product_id: (name, brand)
+                for product_id, name, brand in Product.objects.filter(id__in=product_ids).values_list('id', 'name', 'brand')
+            }
+            for product_id in product_ids:
+                self._apply_product(product_id, *products.get(product_id, ()), deleted=product_id not in products)
+        if category_ids:
+            categories = {
+                category_id: (name, slug)
+                for category_id, name, slug in Category.objects.filter(id__in=category_ids).values_list('id', 'name', 'slug')
+            }
+            for category_id in category_ids:
+                self._apply_category(category_id, *categories.get(category_id, ()), deleted=category_id not in categories)
+        self.version = current
+        return True
+
+    def _unlink_brand(self, product_id):
+        for brand, refs in list(self.brand_refs.items()):
+            if product_id in refs:
+                refs.discard(product_id)
+                if not refs:
+                    del self.brand_refs[brand]
+                    self._delete(('brand', brand))
+
+    def _apply_product(self, product_id, name=None, brand=None, deleted=False):
+        self._delete(('product', product_id))
+        self._unlink_brand(product_id)
+        if deleted:
+            return
+        self._insert(*self._product_entry(product_id, name))
+        if brand:
+            entry_id, suggestion = self._brand_entry(brand)
+            if entry_id not in self.entries:
+                self._insert(entry_id, suggestion)
+            self.brand_refs.setdefault(entry_id[1], set()).add(product_id)
+
+    def _apply_category(self, category_id, name=None, slug=None, deleted=False):
+        self._delete(('category', category_id))
+        if not deleted:
+            self._insert(*self._category_entry(category_id, name, slug))
+
+    def product_changed(self, product_id, name=None, brand=None, deleted=False):
+        self._patch(('product', product_id), lambda: self._apply_product(product_id, name, brand, deleted))
+
+    def category_changed(self, category_id, name=None, slug=None, deleted=False):
+        self._patch(('category', category_id), lambda: self._apply_category(category_id, name, slug, deleted))
+
+    def invalidate(self):
+        with self.lock:
+            self.version = None
+
+    def ensure_current(self):
+        current = get_version(SUGGEST_VERSION_KEY)
+        if self.version == current:
+            return
+        with self.lock:
+            caught_up = self.version == current or self._catch_up(current)
+        if not caught_up:
+            self.rebuild()
+
+    # --- querying -------------------------------------------------------
+
+    def suggest(self, query, limit=8):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self.ensure_current()
+
+        with self.lock:
+            keys, entries = self.keys, self.entries
+            start = bisect.bisect_left(keys, (prefix,))
+            found = {}
+            for key, entry_id in keys[start:start + SCAN_LIMIT]:
+                if not key.startswith(prefix):
+                    break
+                suggestion = entries.get(entry_id)
+                if suggestion is None:
+                    continue
+                starts_label = normalize(suggestion.label).startswith(prefix)
+                rank = (not starts_label, KIND_ORDER[suggestion.kind], len(suggestion.label), suggestion.label)
+                if entry_id not in found or rank < found[entry_id][0]:
+                    found[entry_id] = (rank, suggestion)
+
+        return [suggestion for _, suggestion in sorted(found.values(), key=lambda item: item[0])[:limit]]
+
+
+_index = PrefixIndex()
+
+
+def prefix_index():
+    return _index
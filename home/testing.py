@@ -0,0 +1,15 @@
+"""Test helpers shared by the apps' test suites."""
+from .query_metrics import record_queries
+
+
+class QueryBudgetMixin:
+    """assertMaxQueries() for TestCase classes: a query budget per view."""
+
+    def assertMaxQueries(self, url, n, method='get', data=None, **extra):
+        """Request `url` with the test client; fail if it runs more than `n` queries. Returns the response."""
+        with record_queries() as stats:
+            response = getattr(self.client, method)(url, data, **extra)
+        if stats.count > n:
+            shapes = '\n'.join(f'  {count} x {sql}' for sql, count in stats.shapes.most_common(5))
+            self.fail(f"{method.upper()} {url} ran {stats.count} queries, budget {n}. Most run:\n{shapes}")
+        return response
@@ -1,3 +1,677 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import time
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, migrations, models
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django_htmx.middleware import HtmxMiddleware
+from PIL import Image
+
+from products.facets import FACET_VERSION_KEY, FacetIndex, facet_index
+from products.migrations._fts import restore_sqlite_triggers
+from products.models import *
+from products.tests import add_catalog, make_variant
+
+from . import cache_versions
+from .cache_versions import bump_version, forget_versions, get_version, get_versions
+from .context_processors import categories_context
+from .models import Blog, BlogCategory, BlogComment, BlogReply, CacheChange, CacheVersion, SocialMediaLinks
+from .page_cache import page_key
+from .query_metrics import REPEAT_THRESHOLD, QueryMetricsMiddleware, fingerprint
+from .recent_searches import RECENT_SEARCH_LIMIT, RecentSearchBuffer, recent_search_buffer
+from .search import get_search_backend
+from .suggest import PrefixIndex, prefix_index
+from .testing import QueryBudgetMixin
+from .views import BLOG_PER_PAGE, HOME_FEATURED_LIMIT
+
+
+class HomeViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.size = Size.objects.create(select='M')
+        cls.color = Color.objects.create(name='Blue', color='#0000ff')
+
+    def add_products(self, count, start=0):
+        for n in range(start, start + count):
+            category = Category.objects.create(
+                name=f'Category {n}', slug=f'category-{n}',
+                image='categories/1.jpg', second_image='categories/2.jpg', third_image='categories/3.jpg',
+            )
+            product = Product.objects.create(name=f'Product {n}', category=category)
+            for color_n in range(2):
+                color = self.color if color_n == 0 else Color.objects.create(name=f'Color {n}', color='#ff0000')
+                make_variant(product, self.size, color)
+
+    def home_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home:home'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx)
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        self.add_products(2)
+        _, small = self.home_queries()
+
+        self.add_products(HOME_FEATURED_LIMIT + 5, start=2)
+        response, large = self.home_queries()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.context['marked_products']), HOME_FEATURED_LIMIT)
+
+    def test_featured_products_first_and_deduplicated(self):
+        self.add_products(3)
+        featured = Product.objects.get(name='Product 1')
+        featured.is_featured = True
+        featured.save()
+
+        response, _ = self.home_queries()
+        cards = list(response.context['marked_products'])
+        self.assertEqual(cards[0].product, featured)
+        self.assertEqual(len(cards), len({c.product_id for c in cards}))
+        self.assertEqual({c['product_count'] for c in response.context['categories']}, {1})
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.boot = Product.objects.create(name='Leather boot', brand='Acme', category=category,
+                                          description='Waterproof walking boot')
+        cls.sneaker = Product.objects.create(name='Canvas sneaker', brand='Leatherworks', category=category)
+        cls.blog = Blog.objects.create(title='Caring for boots', image='blogs/1.jpg',
+                                       content='<p>Use <strong>saddle</strong> soap &amp; wax</p>')
+
+    def test_ranked_prefix_search(self):
+        backend = get_search_backend()
+        # name matches outrank brand matches
+        self.assertEqual(backend.search_products('leath'), [self.boot.id, self.sneaker.id])
+        self.assertEqual(backend.search_products('walking bo'), [self.boot.id])
+        self.assertEqual(backend.search_products('"); drop'), [])
+
+    def test_index_follows_updates(self):
+        self.sneaker.name = 'Canvas trainer'
+        self.sneaker.save()
+        backend = get_search_backend()
+        self.assertEqual(backend.search_products('train'), [self.sneaker.id])
+        self.assertEqual(backend.search_products('sneaker'), [])
+
+        self.sneaker.delete()
+        self.assertEqual(backend.search_products('canvas'), [])
+
+    def test_blog_content_indexed_as_text(self):
+        self.assertEqual(self.blog.content_text, 'Use saddle soap & wax')
+        backend = get_search_backend()
+        self.assertEqual(backend.search_blogs('saddle'), [self.blog.id])
+        self.assertEqual(backend.search_blogs('strong'), [])
+
+    def test_search_views(self):
+        response = self.client.get(reverse('home:product_search'), {'q': 'boot'})
+        self.assertEqual(list(response.context['results']), [self.boot])
+        response = self.client.get(reverse('home:search_blog'), {'q': 'wax'})
+        self.assertEqual(list(response.context['results']), [self.blog])
+        response = self.client.get(reverse('home:search_blog'))
+        self.assertEqual(response.status_code, 200)
+
+
+class SuggestionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        cls.boot = Product.objects.create(name='Leather boot', brand='Shoemakers', category=cls.shoes)
+
+    def setUp(self):
+        forget_versions()
+        prefix_index().invalidate()
+
+    def labels(self, query):
+        return [(s.kind, s.label) for s in prefix_index().suggest(query)]
+
+    def test_prefix_lookup(self):
+        self.assertEqual(self.labels('sho'), [('category', 'Shoes'), ('brand', 'Shoemakers')])
+        self.assertEqual(self.labels('BOO'), [('product', 'Leather boot')])
+        self.assertEqual(self.labels('leather b'), [('product', 'Leather boot')])
+        self.assertEqual(self.labels(''), [])
+
+    def test_served_from_memory_and_updated_incrementally(self):
+        prefix_index().suggest('x')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('lea'), [('product', 'Leather boot')])
+
+        self.boot.name = 'Suede boot'
+        self.boot.brand = ''
+        self.boot.save()
+        # patched in place; only the version bumped by the save is read again
+        with self.assertNumQueries(1):
+            self.assertEqual(self.labels('lea'), [])
+            self.assertEqual(self.labels('sho'), [('category', 'Shoes')])
+            self.assertEqual(self.labels('sue'), [('product', 'Suede boot')])
+
+    def test_other_workers_replay_logged_changes(self):
+        other = PrefixIndex()  # another worker's copy
+        self.assertEqual([s.label for s in other.suggest('lea')], ['Leather boot'])
+
+        self.boot.name = 'Suede boot'
+        self.boot.save()
+        Category.objects.create(name='Sandals', slug='sandals')
+        forget_versions()
+        with self.assertNumQueries(4):
+            # version, change log, the changed product, the changed category
+            self.assertEqual([s.label for s in other.suggest('s')], ['Shoes', 'Sandals', 'Shoemakers', 'Suede boot'])
+        self.assertEqual(other.suggest('lea'), [])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('home:search_suggestions'), {'q': 'leat'})
+        self.assertContains(response, self.boot.get_absolute_url())
+
+
+class RecentSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='pw')
+
+    def test_prefixes_coalesced_and_upserted(self):
+        buffer = RecentSearchBuffer(max_pending=1000, max_age=3600)
+        for typed in ['sn', 'sne', 'sneak', 'sneaker', 'boots']:
+            buffer.record(self.user.id, typed)
+        with self.assertNumQueries(0):
+            self.assertEqual([q for q, _ in buffer.pending_for(self.user.id)], ['boots', 'sneaker'])
+
+        buffer.flush()
+        buffer.record(self.user.id, 'sneaker')
+        buffer.flush()
+        self.assertEqual(list(self.user.recent_searches.values_list('query', flat=True)), ['sneaker', 'boots'])
+
+    def test_prefix_stored_by_an_earlier_flush_is_dropped(self):
+        buffer = RecentSearchBuffer(max_pending=1000, max_age=3600)
+        buffer.record(self.user.id, 'boots')
+        buffer.flush()
+        buffer.record(self.user.id, 'sh')
+        buffer.flush()
+        buffer.record(self.user.id, 'shirt')
+        buffer.flush()
+        self.assertEqual(list(self.user.recent_searches.values_list('query', flat=True)), ['shirt', 'boots'])
+
+    def test_flushed_after_a_request_once_due(self):
+        buffer = recent_search_buffer()
+        self.addCleanup(buffer.flush)
+        buffer.record(self.user.id, 'sandals')
+        self.client.get(reverse('home:about_us'))
+        self.assertEqual(self.user.recent_searches.count(), 0)
+
+        buffer.oldest -= buffer.max_age
+        self.client.get(reverse('home:about_us'))
+        self.assertEqual(list(self.user.recent_searches.values_list('query', flat=True)), ['sandals'])
+
+    def test_history_is_capped(self):
+        buffer = RecentSearchBuffer(max_pending=1000, max_age=3600)
+        for n in range(RECENT_SEARCH_LIMIT + 5):
+            buffer.record(self.user.id, f'query {n:02d}x')
+        buffer.flush()
+        self.assertEqual(self.user.recent_searches.count(), RECENT_SEARCH_LIMIT)
+        self.assertEqual(self.user.recent_searches.first().query, f'query {RECENT_SEARCH_LIMIT + 4:02d}x')
+
+    def test_search_view_reads_its_own_writes(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('home:product_search'), {'q': 'boots'})
+        response = self.client.get(reverse('home:product_search'), {'q': 'sandals'})
+        self.assertEqual([s.query for s in response.context['recent_searches']], ['sandals', 'boots'])
+        recent_search_buffer().flush()
+        self.assertEqual(self.user.recent_searches.count(), 2)
+
+
+class SearchMigrationTests(TransactionTestCase):
+    """Schema changes to products_product keep the search index following the table."""
+
+    def test_index_follows_updates_after_alter_field(self):
+        product = Product.objects.create(name='Linen shirt')
+
+        # SQLite applies AlterField by copying the table, which drops its triggers
+        executor = MigrationExecutor(connection)
+        state = executor.loader.project_state(executor.loader.graph.leaf_nodes('products')[0])
+        migration = type('Migration', (migrations.Migration,), {'operations': [
+            migrations.AlterField('product', 'name', models.CharField(max_length=250)),
+            migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+        ]})('0999_widen_name', 'products')
+        with connection.schema_editor() as editor:
+            migration.apply(state.clone(), editor)
+        self.addCleanup(self.unapply, migration, state)
+
+        product.name = 'Wool coat'
+        product.save()
+        backend = get_search_backend()
+        self.assertEqual(backend.search_products('wool'), [product.id])
+        self.assertEqual(backend.search_products('linen'), [])
+
+    def unapply(self, migration, state):
+        # going back rebuilds the table again
+        with connection.schema_editor() as editor:
+            migration.unapply(state.clone(), editor)
+            restore_sqlite_triggers(None, editor)
+
+
+class CacheVersionTests(TestCase):
+
+    def setUp(self):
+        forget_versions()
+        self.addCleanup(forget_versions)
+
+    def test_bumps_are_shared_through_the_database(self):
+        self.assertEqual(get_version('shelf'), 0)
+        self.assertEqual(bump_version('shelf'), 1)
+        self.assertEqual(get_version('shelf'), 1)
+
+        # another worker bumps it: seen here once the remembered value expires
+        CacheVersion.objects.filter(name='shelf').update(version=5)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_version('shelf'), 1)
+        forget_versions()
+        self.assertEqual(get_version('shelf'), 5)
+        self.assertEqual(bump_version('shelf'), 6)
+
+    def test_remembers_a_bounded_number_of_tags(self):
+        self.addCleanup(setattr, cache_versions, 'MAX_REMEMBERED', cache_versions.MAX_REMEMBERED)
+        cache_versions.MAX_REMEMBERED = 2
+        get_versions(['a', 'b', 'c'])
+        self.assertEqual(list(cache_versions._seen), ['b', 'c'])
+        with self.assertNumQueries(1):
+            # 'b' is remembered, 'a' is read again and pushes out 'c', the least recently used
+            get_versions(['b', 'a'])
+        self.assertEqual(list(cache_versions._seen), ['b', 'a'])
+
+    def test_facet_index_follows_other_workers(self):
+        add_catalog(products=2)
+        index = facet_index()
+        index.invalidate()
+        self.assertEqual(index.search().total, 2)
+
+        # another worker adds a product: no signal reaches this process, only the version
+        variant = ProductVariant.objects.first()
+        product = Product.objects.bulk_create([Product(name='Elsewhere', category_id=variant.product.category_id)])[0]
+        ProductVariant.objects.bulk_create([ProductVariant(
+            product=product, size=variant.size, color=variant.color, price=5, image='v.jpg', image_hover='v.jpg',
+        )])
+        CacheVersion.objects.filter(name=FACET_VERSION_KEY).update(version=F('version') + 1)
+        self.assertEqual(index.search().total, 2)
+        forget_versions()
+        self.assertEqual(index.search().total, 3)
+
+    def test_facet_index_replays_logged_changes(self):
+        add_catalog(products=3)
+        red = Color.objects.create(name='Red', color='#ff0000')
+        other = FacetIndex()  # another worker's copy
+        self.assertEqual(other.search().total, 3)
+
+        # changes made here reach the other copy through the change log, not a rebuild
+        variant = ProductVariant.objects.first()
+        make_variant(variant.product, variant.size, red, price='12.00')
+        Product.objects.exclude(id=variant.product_id).first().delete()
+        forget_versions()
+        with self.assertNumQueries(3):
+            # version, change log, the variants of just the two changed products
+            result = other.search(colors=[red.id])
+        self.assertEqual(result.page(10), [variant.product_id])
+        self.assertEqual(other.search().total, 2)
+
+        # a change the log no longer covers: start over
+        CacheChange.objects.all().delete()
+        bump_version(FACET_VERSION_KEY, [variant.product_id])
+        forget_versions()
+        with self.assertNumQueries(3):
+            # version, change log, then the full rebuild (the version is still remembered)
+            self.assertEqual(other.search().total, 2)
+
+
+class SiteContextTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='pw')
+        MainCategory.objects.create(name='Women', slug='women', icon='icon_images/w.png')
+        Category.objects.create(name='Hats', slug='hats')
+
+    def setUp(self):
+        cache.clear()
+        forget_versions()
+        self.factory = RequestFactory()
+
+    def request(self, user=None, **headers):
+        request = self.factory.get('/', **headers)
+        request.user = user or AnonymousUser()
+        HtmxMiddleware(lambda r: None)(request)
+        return request
+
+    def test_site_wide_parts_are_cached(self):
+        categories_context(self.request())
+        with self.assertNumQueries(0):
+            context = categories_context(self.request())
+        self.assertEqual([c.name for c in context['single_categories']], ['Hats'])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(context['main_categories'][0].categories.all()), 0)
+
+    def test_saving_a_model_invalidates(self):
+        categories_context(self.request())
+        SocialMediaLinks.objects.create(whatsapp='https://wa.me/1', instagram='https://i.com', tiktok='https://t.com')
+        context = categories_context(self.request())
+        self.assertEqual(context['social_media_links'].whatsapp, 'https://wa.me/1')
+
+    def test_liked_data_is_lazy(self):
+        categories_context(self.request())
+        with self.assertNumQueries(0):
+            context = categories_context(self.request(self.user))
+        with self.assertNumQueries(2):  # the liked-count version, then the count
+            self.assertEqual(str(context['liked_count']), '0')
+
+    def test_htmx_partials_skip_processor(self):
+        with self.assertNumQueries(0):
+            context = categories_context(self.request(HTTP_HX_REQUEST='true'))
+        self.assertNotIn('main_categories', context)
+        self.assertIn('liked_product_ids', context)
+
+
+class OptimizeStaticImagesTests(TestCase):
+
+    def test_pngs_reencoded_as_webp(self):
+        with tempfile.TemporaryDirectory() as root:
+            big = os.path.join(root, 'hero.png')
+            Image.linear_gradient('L').resize((600, 400)).convert('RGB').save(big)
+            Image.new('RGB', (10, 10)).save(os.path.join(root, 'tiny.png'))
+
+            out = StringIO()
+            call_command('optimize_static_images', path=root, min_size=1, lossless=True, stdout=out)
+
+            self.assertTrue(os.path.exists(os.path.join(root, 'hero.webp')))
+            self.assertFalse(os.path.exists(os.path.join(root, 'tiny.webp')))
+            with Image.open(os.path.join(root, 'hero.webp')) as webp, Image.open(big) as png:
+                self.assertEqual(list(webp.getdata()), list(png.getdata()))  # lossless
+            self.assertIn('on 1 PNGs', out.getvalue())
+
+    def test_stylesheet_webps_exist(self):
+        # image-set() picks the WebP whenever the browser supports it: a missing one is a blank banner
+        with open(os.path.join(settings.BASE_DIR, 'static', 'assets', 'css', 'style.css')) as f:
+            webps = re.findall(r'url\("([^"]+\.webp)"\)', f.read())
+        self.assertTrue(webps)
+        for url in webps:
+            self.assertTrue(finders.find(os.path.normpath(os.path.join('assets/css', url))), url)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), UPLOAD_PROCESS_IN_THREAD=False)
+class BlogUploadTests(TestCase):
+
+    def test_comment_and_reply_images_are_staged(self):
+        blog = Blog.objects.create(title='Care guide', image='blogs/1.jpg', content='<p>Hi</p>')
+        image = SimpleUploadedFile('me.jpg', b'...', content_type='image/jpeg')
+        self.client.post(reverse('home:blog_detail', args=[blog.slug]),
+                         {'name': 'Ana', 'comment': 'Nice', 'image': image, 'comment_submit': ''})
+        comment = BlogComment.objects.get()
+        self.assertFalse(comment.image)
+
+        image = SimpleUploadedFile('me.jpg', b'...', content_type='image/jpeg')
+        self.client.post(reverse('home:comment_reply'),
+                         {'comment_id': comment.id, 'name': 'Bo', 'reply_text': 'Thanks', 'image': image})
+        self.assertFalse(BlogReply.objects.get().image)
+        self.assertEqual(
+            sorted(PendingUpload.objects.values_list('model_label', flat=True)),
+            ['home.BlogComment', 'home.BlogReply'],
+        )
+
+
+class BlogListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        forget_versions()
+
+    def test_pages_newest_first(self):
+        blogs = [
+            Blog.objects.create(title=f'Care guide {n}', image='blogs/1.jpg', content='<p>Hi</p>')
+            for n in range(BLOG_PER_PAGE + 2)
+        ]
+        response = self.client.get(reverse('home:blog'))
+        self.assertEqual(response.context['blogs_record'], blogs[:1:-1])
+
+        response = self.client.get(response.context['next_url'])
+        self.assertEqual(response.context['blogs_record'], blogs[1::-1])
+        self.assertIsNone(response.context['next_url'])
+
+    def test_malformed_cursor(self):
+        self.assertEqual(self.client.get(reverse('home:blog'), {'cursor': 'nope'}).status_code, 400)
+
+
+class BlogConditionalGetTests(TestCase):
+
+    def test_comment_changes_the_etag(self):
+        blog = Blog.objects.create(title='Care guide', image='blogs/1.jpg', content='<p>Hi</p>')
+        url = reverse('home:blog_detail', args=[blog.slug])
+        self.client.get(url)  # the first visit sets the CSRF cookie the page's token belongs to
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        BlogComment.objects.create(blog=blog, name='Ana', comment='Nice')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        forget_versions()
+        self.url = reverse('home:about_us')
+
+    def test_anonymous_page_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        # every copy carries the visitor's own CSRF token
+        self.assertNotContains(second, 'page-cache-csrf-token')
+        self.assertIn('csrftoken', second.cookies)
+
+    def test_bumped_tag_serves_stale_while_one_request_renders(self):
+        self.client.get(self.url)
+        SocialMediaLinks.objects.create(whatsapp='https://wa.me/1', instagram='https://ig.me', tiktok='https://tiktok.com')
+
+        lock = page_key(RequestFactory().get(self.url)) + ':lock'
+        cache.add(lock, 1)  # another worker is rendering it
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'stale')
+        cache.delete(lock)
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'hit')
+
+    def test_key_only_has_the_query_the_view_reads(self):
+        self.client.get(self.url)
+        # about_us reads no parameters: junk in the query string shares its copy
+        self.assertEqual(self.client.get(self.url + '?x=1&utm_source=mail')['X-Page-Cache'], 'hit')
+
+        shop = reverse('products:shop')
+        self.assertEqual(self.client.get(shop + '?size=1&color=2&x=1')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(shop + '?color=2&size=1&y=2')['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get(shop + '?color=3&size=1')['X-Page-Cache'], 'miss')
+
+    def test_missing_page_is_rendered_without_waiting(self):
+        cache.add(page_key(RequestFactory().get(self.url)) + ':lock', 1)  # another worker is rendering it
+        started = time.monotonic()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertIsNone(cache.get(page_key(RequestFactory().get(self.url))))
+
+    def test_signed_in_and_cart_holders_skip_the_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(User.objects.create_user('shopper', password='pw'))
+        self.assertFalse(self.client.get(self.url).has_header('X-Page-Cache'))
+        self.client.logout()
+
+        variant = make_variant(Product.objects.create(name='Tee'), Size.objects.create(select='M'),
+                               Color.objects.create(name='Red', color='#f00'), stock=3)
+        self.client.post(reverse('products:cart_add', args=[variant.id]))
+        self.assertFalse(self.client.get(self.url).has_header('X-Page-Cache'))
+
+    def test_token_in_cached_page_is_accepted(self):
+        client = Client(enforce_csrf_checks=True)
+        variant = make_variant(Product.objects.create(name='Tee'), Size.objects.create(select='M'),
+                               Color.objects.create(name='Red', color='#f00'), stock=3)
+        url = reverse('products:product_details', args=[variant.product_id])
+        client.get(url)
+        response = client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        token = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', response.content).group(1).decode()
+        response = client.post(reverse('products:cart_add', args=[variant.id]), {'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Query budgets for every URL in home/urls.py, with the page cache cleared
+    (worst case). A budget that starts failing is an N+1 creeping in.
+    """
+    BUDGETS = {
+        'home': 20,
+        'contact_us': 14,
+        'about_us': 14,
+        'blog': 14,
+        'blog_detail': 17,
+        'comment_reply': 6,
+        'product_search': 13,
+        'search_suggestions': 12,
+        'search_blog': 12,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        add_catalog()
+        cls.user = User.objects.create_user('shopper', password='pw')
+        categories = [BlogCategory.objects.create(name=name) for name in ('Care', 'Style')]
+        # more posts than the blog page's budget: a query per post's category would show
+        cls.blogs = [
+            Blog.objects.create(title=f'Care guide {n}', image='blogs/1.jpg', content='<p>Wash cold</p>',
+                                category=categories[n % 2])
+            for n in range(20)
+        ]
+        for n in range(5):
+            comment = BlogComment.objects.create(blog=cls.blogs[0], name=f'Reader {n}', comment='Thanks')
+            BlogReply.objects.create(comment=comment, name='Editor', reply_text='You are welcome')
+
+    def setUp(self):
+        cache.clear()
+        forget_versions()
+        self.client.force_login(self.user)
+        # searches are buffered; write them while the test database is still there
+        self.addCleanup(recent_search_buffer().flush)
+
+    def test_every_url_has_a_budget(self):
+        from . import urls
+        self.assertEqual({p.name for p in urls.urlpatterns}, set(self.BUDGETS))
+
+    def test_budgets(self):
+        requests = {
+            'home': (reverse('home:home'), 'get', None),
+            'contact_us': (reverse('home:contact_us'), 'get', None),
+            'about_us': (reverse('home:about_us'), 'get', None),
+            'blog': (reverse('home:blog'), 'get', None),
+            'blog_detail': (reverse('home:blog_detail', args=[self.blogs[0].slug]), 'get', None),
+            'comment_reply': (reverse('home:comment_reply'), 'post',
+                              {'comment_id': BlogComment.objects.first().id, 'name': 'Bo', 'reply_text': 'Same'}),
+            'product_search': (reverse('home:product_search'), 'get', {'q': 'shirt'}),
+            'search_suggestions': (reverse('home:search_suggestions'), 'get', {'q': 'sh'}),
+            'search_blog': (reverse('home:search_blog'), 'get', {'q': 'wash'}),
+        }
+        for name, (url, method, data) in requests.items():
+            with self.subTest(name):
+                cache.clear()
+                forget_versions()
+                response = self.assertMaxQueries(url, self.BUDGETS[name], method, data)
+                self.assertLess(response.status_code, 400)
+
+
+class QueryMetricsTests(TestCase):
+
+    def test_fingerprint_ignores_literals_and_list_lengths(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s) LIMIT 5'),
+        )
+
+    def test_repeated_statements_are_reported(self):
+        def view(request):
+            for n in range(REPEAT_THRESHOLD + 1):
+                list(Product.objects.filter(id=n))
+            return HttpResponse()
+
+        request = RequestFactory().get('/loop')
+        with self.assertLogs('home.query_metrics', 'WARNING') as logs, override_settings(DEBUG=True):
+            response = QueryMetricsMiddleware(view)(request)
+        self.assertIn(f'{REPEAT_THRESHOLD + 1} times', logs.output[0])
+        self.assertIn(f'desc="{REPEAT_THRESHOLD + 1} queries"', response['Server-Timing'])
+
+
+class SyntheticCatalogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        forget_versions()
+        self.addCleanup(recent_search_buffer().flush)
+
+    def generate(self, **options):
+        counts = dict(
+            main_categories=2, categories=4, products=12, variants=3, discounts=5,
+            users=6, reviews=30, likes=20, blogs=3, comments=6, seed=7,
+        )
+        counts.update(options)
+        call_command('generate_catalog', stdout=StringIO(), **counts)
+
+    def test_catalog_is_reproducible_and_consistent(self):
+        self.generate()
+        first = list(Product.objects.order_by('id').values_list('name', 'rating_count', 'like_count'))
+        self.assertEqual(len(first), 12)
+        self.assertEqual(ProductVariant.objects.count(), 36)
+        self.assertEqual(ProductCard.objects.count(), 12)
+        self.assertEqual(sum(r[1] for r in first), Reviews.objects.count())
+        self.assertEqual(sum(r[2] for r in first), Product.liked_by.through.objects.count())
+        self.assertFalse(ProductVariant.objects.filter(effective_price__isnull=True).exists())
+        self.assertEqual(Blog.objects.exclude(content_text='').count(), 3)
+
+        self.generate(prefix='Again')
+        again = list(Product.objects.filter(name__contains='Again').order_by('id').values_list('name', 'rating_count', 'like_count'))
+        self.assertEqual([(n.replace('Again', 'Synthetic'), r, l) for n, r, l in again], first)
+
+    def test_benchmark_saves_and_compares_a_baseline(self):
+        self.generate()
+        with tempfile.TemporaryDirectory() as root:
+            baseline = os.path.join(root, 'baseline.json')
+            out = StringIO()
+            call_command('benchmark_pages', requests=2, warmup=1, save=baseline, stdout=out)
+            self.assertIn('product_details', out.getvalue())
+
+            with open(baseline) as f:
+                pages = json.load(f)['pages']
+            self.assertEqual(pages['shop']['status'], [200])
+            self.assertTrue(all(page['status'] == [200] for page in pages.values()), pages)
+
+            out = StringIO()
+            call_command('benchmark_pages', requests=2, warmup=1, only=['shop'], compare=baseline, threshold=100, stdout=out)
+            self.assertIn('No regressions.', out.getvalue())
+
+        out = StringIO()
+        call_command('benchmark_pages', requests=1, warmup=0, user='synthetic-shopper-0', only=['user_wishlist'], stdout=out)
+        self.assertRegex(out.getvalue(), r'user_wishlist .* 200')
@@ -1,72 +1,50 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from products.models import *
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.urls import reverse
 from .models import *
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Count
+from products import uploads
+from products.pagination import InvalidCursor, KeysetPaginator
+from products.services import DiscountResolver
+from .search import get_search_backend, in_rank_order
+from .suggest import prefix_index
+from .recent_searches import recent_search_buffer, recent_searches
+from .conditional import conditional_page
+from .page_cache import BLOG_TAG, CATALOG_TAG, cache_anonymous_page
+
+HOME_FEATURED_LIMIT = 12
+HOME_BLOG_LIMIT = 6
+BLOG_PER_PAGE = 12
+
 # Create your views here.
+@cache_anonymous_page(CATALOG_TAG, BLOG_TAG)
 def home(request):
-    categories = Category.objects.all()
-    blog_record = Blog.objects.filter(is_published=True)
+    categories = Category.objects.annotate(product_count=Count('products'))
+    blog_record = Blog.objects.filter(is_published=True).select_related('category').order_by('-created_at')[:HOME_BLOG_LIMIT]
     category_data = []
+    category_discounts = DiscountResolver().category_discounts([c.id for c in categories])
 
     for cate in categories:
-        discount = Discount.objects.filter(category=cate, active=True, end_date__gte=timezone.now()).first()
-        discount_percent = discount.amount if discount and discount.discount_type == 'percent' else 0
+        discount = category_discounts.get(cate.id)
+        discount_percent = discount.amount if discount else 0
 
-        product_count = Product.objects.filter(category=cate).count()
-    
         category_data.append({
             'category': cate,
             'discount_percent': discount_percent,
-            'product_count': product_count,
+            'product_count': cate.product_count,
         })
 
     main_categories = MainCategory.objects.prefetch_related('categories').all()
     single_categories = Category.objects.filter(main_category__isnull=True)
 
-    # Get variants marked for main page
-    marked_variants = ProductVariant.objects.all().select_related('product', 'color', 'size')
-
-    # Group by product
-    products = []
-    for variant in marked_variants:
-        product = variant.product
-        all_variants = ProductVariant.objects.filter(product=product)
-
-        # Colors
-        colors = [{
-            'name': v.color.name,
-            'code': getattr(v.color, 'color', '#000'),  # fallback if no color code
-            'image': v.image.url,
-            'image_hover': v.image_hover.url
-        } for v in all_variants]
-
-        # Sizes
-        sizes = [v.size.size for v in all_variants]
-
-        # Price and discount
-        discount = (
-            Discount.objects.filter(variant=variant, active=True).first()
-            or Discount.objects.filter(product=product, active=True).first()
-            or Discount.objects.filter(category=product.category, active=True).first()
-        )
-        original_price = variant.price
-        if discount:
-            final_price = variant.price - (variant.price * discount.amount / 100)
-        else:
-            final_price = variant.price
-
-        products.append({
-            'product': product,
-            'first_variant': variant,
-            'colors': colors,
-            'sizes': sizes,
-            'original_price': original_price,
-            'final_price': final_price,
-            'has_discount': discount is not None,
-        })
+    # Featured products first, then the newest ones, one card row per product
+    products = ProductCard.objects.select_related('product__category').order_by(
+        '-product__is_featured', 'product__featured_order', '-product__created_at'
+    )[:HOME_FEATURED_LIMIT]
 
     context = {
         'categories': category_data,
@@ -103,6 +81,7 @@ def contact_us(request):
         'contact_info': contact_info,
     })
 
+@cache_anonymous_page()
 def about_us(request):
     try:
         about_info = AboutUs.objects.last()
@@ -110,17 +89,31 @@ def about_us(request):
         about_info = None
     return render(request, 'home/about-us.html', {'about_info':about_info})
 
+@cache_anonymous_page(BLOG_TAG, query=('cursor',))
 def blog(request):
-    blogs_record = Blog.objects.filter(is_published=True)
+    blogs = Blog.objects.filter(is_published=True).select_related('category')
+    try:
+        page = KeysetPaginator(blogs, ('-created_at', '-id'), BLOG_PER_PAGE).page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    next_url = None
+    if page.has_next:
+        next_url = f"{reverse('home:blog')}?cursor={page.next_cursor}"
 
     context = {
-        'blogs_record':blogs_record
+        'blogs_record': page.items,
+        'next_url': next_url,
     }
     return render(request, 'home/blog.html', context)
 
+def _blog_changed(slug):
+    return Blog.objects.filter(slug=slug).values_list('updated_at', flat=True).first()
+
+@conditional_page('blog', _blog_changed)
 def blog_detail(request, slug):
-    blog = get_object_or_404(Blog, slug=slug)
-    blog_comments = BlogComment.objects.filter(blog=blog).order_by('-created_at')
+    blog = get_object_or_404(Blog.objects.select_related('category'), slug=slug)
+    blog_comments = BlogComment.objects.filter(blog=blog).prefetch_related('replies').order_by('-created_at')
 
     # Handle new comment submission
     if request.method == "POST":
@@ -130,7 +123,16 @@ def blog_detail(request, slug):
             image = request.FILES.get("image")
 
             if name and comment_text:
-                BlogComment.objects.create(blog=blog, name=name, comment=comment_text, image=image)
+                try:
+                    if image:
+                        uploads.validate_upload(image)
+                except uploads.UploadRejected as exc:
+                    messages.error(request, str(exc))
+                    return redirect("home:blog_detail", slug=slug)
+                with transaction.atomic():
+                    comment = BlogComment.objects.create(blog=blog, name=name, comment=comment_text)
+                    if image:
+                        uploads.stage_upload(image, comment, 'image')
             return redirect("home:blog_detail", slug=slug)
         
     return render(request, "home/blog_detail.html", {
@@ -152,13 +154,22 @@ def comment_reply(request):
         # Find the base comment
         comment = get_object_or_404(BlogComment, id=comment_id)
 
-        # Create reply
-        reply = BlogReply.objects.create(
-            comment=comment,
-            name=name,
-            reply_text=reply_text,
-            image=image if image else None
-        )
+        if image:
+            try:
+                uploads.validate_upload(image)
+            except uploads.UploadRejected as exc:
+                messages.error(request, str(exc))
+                return redirect(request.META.get('HTTP_REFERER', '/'))
+
+        # Create reply; the picture is attached once processed in the background
+        with transaction.atomic():
+            reply = BlogReply.objects.create(
+                comment=comment,
+                name=name,
+                reply_text=reply_text,
+            )
+            if image:
+                uploads.stage_upload(image, reply, 'image')
         messages.success(request, "Reply submitted successfully!")
         return redirect(request.META.get('HTTP_REFERER', '/'))
 
@@ -167,33 +178,36 @@ def comment_reply(request):
 
 def product_search(request):
     query = request.GET.get("q")
-    print(query)  # for debugging
     results = []
 
     if query:
-        results = Product.objects.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        ).select_related('category')[:10]
+        ids = get_search_backend().search_products(query, limit=10)
+        results = in_rank_order(Product.objects.select_related('category', 'card'), ids)
 
         if request.user.is_authenticated:
-            if not RecentSearch.objects.filter(user=request.user, query=query).exists():
-                RecentSearch.objects.create(user=request.user, query=query)
+            recent_search_buffer().record(request.user.id, query)
 
-    recent_searches = []
+    user_recent_searches = []
     if request.user.is_authenticated:
-        recent_searches = request.user.recent_searches.all()[:5]
+        user_recent_searches = recent_searches(request.user, limit=5)
 
     return render(request, "partials/search_results.html", {
         "results": results,
-        "recent_searches": recent_searches
+        "recent_searches": user_recent_searches
     })
 
+def search_suggestions(request):
+    """Search-as-you-type: answered from the in-memory prefix index, no database query."""
+    suggestions = prefix_index().suggest(request.GET.get("q", ""), limit=8)
+    return render(request, "partials/search_suggestions.html", {"suggestions": suggestions})
+
 def search_blog(request):
     query = request.GET.get("q")
-    print(query)  # for debugging
+    results = []
     if query:
-        results = Blog.objects.filter(Q(title__icontains=query) | Q(short_description__icontains=query) | Q(content__icontains=query))[:5]
+        ids = get_search_backend().search_blogs(query, limit=5)
+        results = in_rank_order(Blog.objects.filter(is_published=True).select_related('category'), ids)
 
     return render(request, "partials/blog_search_results.html", {
         "results": results,
-    })
\ No newline at end of file
+    })
@@ -35,7 +35,9 @@ class ProductVariantInline(admin.StackedInline):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'brand', 'created_at']
+    list_display = ['name', 'brand', 'created_at', 'is_featured', 'featured_order']
+    list_editable = ['is_featured', 'featured_order']
+    list_filter = ['is_featured']
     search_fields = ['name', 'brand']
     inlines = [ProductVariantInline]
 
@@ -52,7 +54,7 @@ class ColorAdmin(admin.ModelAdmin):
 
 @admin.register(ProductVariant)
 class ProductVariantAdmin(admin.ModelAdmin):
-    list_display = ['product', 'size', 'color', 'price', 'stock']
+    list_display = ['product', 'size', 'color', 'price', 'effective_price', 'stock']
     list_filter = ['product', 'size', 'color']
     search_fields = ['product__name', 'size__name', 'color__name']
     inlines = [ProductVariantImageInline]  # images inline in variant admin
@@ -75,4 +77,54 @@ class ReviewsAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html('<img src="{}" width="60" style="border-radius:5px;" />', obj.image.url)
         return "-"
-    image_preview.short_description = 'Image Preview'
\ No newline at end of file
+    image_preview.short_description = 'Image Preview'
+
+@admin.register(ProductCard)
+class ProductCardAdmin(admin.ModelAdmin):
+    list_display = ['product', 'min_price', 'max_price', 'effective_price', 'has_discount', 'stock', 'updated_at']
+    list_filter = ['has_discount']
+    search_fields = ['product__name']
+    readonly_fields = [f.name for f in ProductCard._meta.fields]
+
+
+@admin.register(PendingUpload)
+class PendingUploadAdmin(admin.ModelAdmin):
+    list_display = ['model_label', 'object_id', 'field', 'status', 'attempts', 'created_at']
+    list_filter = ['status', 'model_label']
+    readonly_fields = [f.name for f in PendingUpload._meta.fields]
+
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    extra = 0
+    raw_id_fields = ['variant']
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'created_at', 'updated_at']
+    search_fields = ['user__username']
+    inlines = [CartItemInline]
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['variant', 'quantity', 'status', 'cart', 'expires_at', 'created_at']
+    list_filter = ['status']
+    # stock moves with these rows; they are changed by products.cart only
+    readonly_fields = [f.name for f in StockReservation._meta.fields]
+
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    raw_id_fields = ['variant']
+    readonly_fields = ['variant', 'product_name', 'quantity', 'unit_price', 'original_price']
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'total', 'created_at']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'total', 'created_at']
+    inlines = [OrderLineInline]
@@ -0,0 +1,285 @@
+"""
+Carts and checkout stock reservations.
+
+Stock is never read, changed in Python and written back. Every change is one
+conditional UPDATE:
+
+    UPDATE products_productvariant SET stock = stock - n WHERE id = %s AND stock >= n
+
+so when buyers race for the last units the database settles it: a buyer whose
+UPDATE matches no row didn't get them, at any isolation level. checkout() takes
+every line of a cart that way in one transaction, in variant id order so
+concurrent checkouts lock rows in the same order and can't deadlock, and rolls
+all of it back if any line is short.
+
+Taken units are held as StockReservation rows for RESERVATION_TTL.
+confirm_checkout() marks them sold and records the Order, as long as the cart
+still holds exactly what was reserved; release_expired() puts the others back. It
+runs from `manage.py release_reservations` (cron, every minute) and, for a
+single variant, whenever a checkout comes up short, so abandoned checkouts
+can't keep a flash sale sold out.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+from .models import Cart, CartItem, Order, OrderLine, Product, ProductCard, ProductVariant, StockReservation
+from .services import DiscountResolver
+
+RESERVATION_TTL = timedelta(minutes=getattr(settings, 'CART_RESERVATION_MINUTES', 10))
+CART_SESSION_KEY = 'cart_id'
+MAX_QUANTITY = 10
+CENT = Decimal('0.01')
+
+
+class OutOfStock(Exception):
+    def __init__(self, variant):
+        self.variant = variant
+        super().__init__(f"Not enough stock left for {variant}")
+
+
+class CartChanged(Exception):
+    """The cart no longer matches the hold taken at checkout."""
+
+
+# --- stock ---------------------------------------------------------------
+
+def take_stock(variant_id, quantity):
+    """Take `quantity` units of a variant if they are all there; returns whether it did."""
+    taken = ProductVariant.objects.filter(id=variant_id, stock__gte=quantity).update(stock=F('stock') - quantity)
+    if taken:
+        stock_changed(variant_id)
+    return bool(taken)
+
+
+def return_stock(variant_id, quantity):
+    ProductVariant.objects.filter(id=variant_id).update(stock=F('stock') + quantity)
+    stock_changed(variant_id)
+
+
+def stock_changed(variant_id):
+    # update() skips the signals that rebuild cards. The listing total is counted
+    # again from the variants in the same UPDATE, never adjusted, so it can't drift.
+    variant_stock = (
+        ProductVariant.objects.filter(product=OuterRef('product'))
+        .values('product').annotate(total=Sum('stock')).values('total')
+    )
+    ProductCard.objects.filter(product__variants=variant_id).update(stock=Coalesce(Subquery(variant_stock), 0))
+    # the product page shows stock; its category page doesn't, so only the product is touched
+    Product.objects.filter(variants=variant_id).update(updated_at=timezone.now())
+
+
+def release(reservations):
+    """Put held reservations back into stock; returns how many were released."""
+    released = 0
+    for reservation in reservations:
+        with transaction.atomic():
+            # the delete is the claim: when two workers release the same row only one deletes it
+            deleted, _ = StockReservation.objects.filter(id=reservation.id, status=StockReservation.HELD).delete()
+            if deleted:
+                return_stock(reservation.variant_id, reservation.quantity)
+                released += 1
+    return released
+
+
+def release_expired(variant_id=None, now=None):
+    """Release every held reservation past its expiry (of one variant if given)."""
+    expired = StockReservation.objects.filter(status=StockReservation.HELD, expires_at__lte=now or timezone.now())
+    if variant_id is not None:
+        expired = expired.filter(variant_id=variant_id)
+    return release(list(expired.only('id', 'variant_id', 'quantity').order_by('id')))
+
+
+# --- carts ---------------------------------------------------------------
+
+def get_cart(request, create=False):
+    """
+    The request's cart, or None if it has none and `create` is False. Nothing
+    is written unless `create` is set: the context processor calls this on
+    every page. An anonymous cart moves to the shopper at login (adopt_cart).
+    """
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart is None and create:
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+        return cart
+
+    session_cart_id = request.session.get(CART_SESSION_KEY)
+    cart = Cart.objects.filter(id=session_cart_id, user=None).first() if session_cart_id else None
+    if cart is None and create:
+        cart = Cart.objects.create()
+        request.session[CART_SESSION_KEY] = cart.id
+    return cart
+
+
+def adopt_cart(request, user):
+    """
+    Give the session's anonymous cart to `user`, who just signed in, or merge
+    it into theirs. Runs from the user_logged_in signal (products.signals).
+    """
+    session_cart_id = request.session.pop(CART_SESSION_KEY, None)
+    anonymous = Cart.objects.filter(id=session_cart_id, user=None).first() if session_cart_id else None
+    if anonymous is None:
+        return
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        if cart is None:
+            anonymous.user = user
+            anonymous.save(update_fields=['user', 'updated_at'])
+        else:
+            merge_carts(anonymous, cart)
+
+
+def merge_carts(source, target):
+    with transaction.atomic():
+        for item in source.items.all():
+            add_item(target, item.variant_id, item.quantity)
+        source.reservations.update(cart=target)
+        source.delete()
+
+
+def add_item(cart, variant_id, quantity=1):
+    quantity = max(1, min(quantity, MAX_QUANTITY))
+    item, created = CartItem.objects.get_or_create(cart=cart, variant_id=variant_id, defaults={'quantity': quantity})
+    if not created:
+        CartItem.objects.filter(id=item.id).update(quantity=Least(F('quantity') + quantity, MAX_QUANTITY))
+
+
+def set_quantity(cart, variant_id, quantity):
+    items = CartItem.objects.filter(cart=cart, variant_id=variant_id)
+    if quantity <= 0:
+        items.delete()
+    else:
+        items.update(quantity=min(quantity, MAX_QUANTITY))
+
+
+@dataclass
+class CartLine:
+    variant: ProductVariant
+    quantity: int
+    unit_price: Decimal
+    original_price: Decimal
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
+
+    @property
+    def has_discount(self):
+        return self.unit_price != self.original_price
+
+
+def cart_lines(cart):
+    """The cart's lines at today's prices, in two queries."""
+    if cart is None:
+        return []
+    items = list(
+        cart.items.select_related('variant__product__category', 'variant__size', 'variant__color').order_by('id')
+    )
+    prices = DiscountResolver().resolve(item.variant for item in items)
+    return [
+        CartLine(item.variant, item.quantity, prices[item.variant_id].final_price, prices[item.variant_id].original_price)
+        for item in items
+    ]
+
+
+def cart_total(lines):
+    return sum((line.total for line in lines), Decimal('0'))
+
+
+def cart_count(cart):
+    return sum(cart.items.values_list('quantity', flat=True)) if cart else 0
+
+
+# --- checkout ------------------------------------------------------------
+
+def held_until(cart):
+    """Expiry of the cart's current hold, or None."""
+    if cart is None:
+        return None
+    reservation = cart.reservations.filter(status=StockReservation.HELD).order_by('expires_at').first()
+    return reservation.expires_at if reservation else None
+
+
+def checkout(cart, now=None):
+    """
+    Reserve every line of `cart` for RESERVATION_TTL and return the reservations.
+    Raises OutOfStock, having reserved nothing, if any line can't be covered.
+    """
+    now = now or timezone.now()
+    items = list(cart.items.select_related('variant').order_by('variant_id'))
+    try:
+        return reserve(cart, items, now)
+    except OutOfStock:
+        # abandoned checkouts may be sitting on the units. Released outside the
+        # failed transaction, which would have rolled the release back with it.
+        released = sum(release_expired(item.variant_id, now) for item in items)
+        if not released:
+            raise
+    return reserve(cart, items, now)
+
+
+def reserve(cart, items, now):
+    with transaction.atomic():
+        # checking out again replaces the cart's earlier hold
+        release(list(cart.reservations.filter(status=StockReservation.HELD)))
+        for item in items:
+            if not take_stock(item.variant_id, item.quantity):
+                raise OutOfStock(item.variant)
+        return StockReservation.objects.bulk_create([
+            StockReservation(cart=cart, variant_id=item.variant_id, quantity=item.quantity, expires_at=now + RESERVATION_TTL)
+            for item in items
+        ])
+
+
+def confirm_checkout(cart, now=None):
+    """
+    Mark the cart's unexpired hold as sold, record it as an Order at today's
+    prices and empty the cart, all in one transaction; returns the Order, or
+    None when the hold has expired.
+
+    If lines were added or quantities changed since checkout, nothing is sold:
+    the cart is reserved again as it is now and CartChanged is raised so the
+    shopper can review it (OutOfStock if it can't be covered).
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        held = list(cart.reservations.select_for_update().filter(status=StockReservation.HELD, expires_at__gt=now))
+        if not held:
+            return None
+        reserved = Counter()
+        for reservation in held:
+            reserved[reservation.variant_id] += reservation.quantity
+        in_cart = Counter(dict(cart.items.select_for_update().values_list('variant_id', 'quantity')))
+        if reserved == in_cart:
+            StockReservation.objects.filter(id__in=[r.id for r in held]).update(status=StockReservation.CONFIRMED)
+            order = place_order(cart, cart_lines(cart))
+            cart.items.all().delete()
+            return order
+    checkout(cart, now)
+    raise CartChanged
+
+
+def place_order(cart, lines):
+    order_lines = [
+        OrderLine(
+            variant=line.variant,
+            product_name=line.variant.product.name,
+            quantity=line.quantity,
+            unit_price=line.unit_price.quantize(CENT, ROUND_HALF_UP),
+            original_price=line.original_price,
+        )
+        for line in lines
+    ]
+    order = Order.objects.create(user_id=cart.user_id, total=sum((line.total for line in order_lines), Decimal('0')))
+    for line in order_lines:
+        line.order = order
+    OrderLine.objects.bulk_create(order_lines)
+    return order
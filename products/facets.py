@@ -0,0 +1,281 @@
+"""
+In-process facet index for the shop sidebar.
+
+Every facet value (a category, size, color or price bucket) maps to a bitmap of
+product ids stored in a plain Python int (bit n set = product n matches).
+AND/OR/popcount on those ints run in C, so any filter combination plus its
+per-facet counts is answered without touching the database.
+
+Each worker keeps its own index. Local changes are applied incrementally from
+products.signals and logged with the version bump (home.cache_versions, shared
+through the database); other workers see the new version and re-read just the
+logged products, rebuilding only when the log no longer reaches back to theirs.
+"""
+import bisect
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models.functions import Coalesce
+
+from home.cache_versions import bump_version, changes_since, get_version
+
+from .models import ProductVariant
+
+FACET_VERSION_KEY = 'products:facet-index-version'
+
+# (label, low inclusive, high exclusive); None means open ended
+PRICE_BUCKETS = [
+    ('Under $25', None, Decimal('25')),
+    ('$25 – $50', Decimal('25'), Decimal('50')),
+    ('$50 – $100', Decimal('50'), Decimal('100')),
+    ('$100 – $200', Decimal('100'), Decimal('200')),
+    ('$200 & above', Decimal('200'), None),
+]
+
+
+def price_bucket(price):
+    for i, (_, low, high) in enumerate(PRICE_BUCKETS):
+        if (low is None or price >= low) and (high is None or price < high):
+            return i
+    return None
+
+
+def bits(ids):
+    """Bitmap with every id in `ids` set, built in one pass."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buf = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def top_ids(mask, limit, below=None):
+    """Up to `limit` ids set in `mask`, highest first, optionally only ids < `below`."""
+    if below is not None:
+        mask &= (1 << below) - 1
+    ids = []
+    while mask and len(ids) < limit:
+        top = mask.bit_length() - 1
+        ids.append(top)
+        mask ^= 1 << top
+    return ids
+
+
+class FacetResult:
+    def __init__(self, mask, counts):
+        self.mask = mask
+        self.counts = counts
+
+    @property
+    def total(self):
+        return self.mask.bit_count()
+
+    def page(self, limit, below=None):
+        return top_ids(self.mask, limit, below)
+
+
+class FacetIndex:
+    FACETS = ('category', 'size', 'color', 'price')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        self.all = 0
+        self.bitmaps = {facet: defaultdict(int) for facet in self.FACETS}
+        self.rows = {}  # product_id -> [(category_id, size_id, color_id, price)]
+        self.prices = []  # sorted [(price, product_id)]
+        self.prices_dirty = False
+
+    # --- building -------------------------------------------------------
+
+    @staticmethod
+    def _variant_rows(queryset):
+        rows = defaultdict(list)
+        # effective_price: filters and buckets use the discounted price (see products.pricing)
+        for product_id, category_id, size_id, color_id, price in queryset.values_list(
+            'product_id', 'product__category_id', 'size_id', 'color_id', Coalesce('effective_price', 'price'),
+        ).iterator(chunk_size=5000):
+            rows[product_id].append((category_id, size_id, color_id, price))
+        return rows
+
+    def _add(self, product_id, rows):
+        """Incremental insert of a single product (full builds go through rebuild())."""
+        bit = 1 << product_id
+        self.all |= bit
+        self.rows[product_id] = rows
+        for category_id, size_id, color_id, price in rows:
+            if category_id is not None:
+                self.bitmaps['category'][category_id] |= bit
+            self.bitmaps['size'][size_id] |= bit
+            self.bitmaps['color'][color_id] |= bit
+            bucket = price_bucket(price)
+            if bucket is not None:
+                self.bitmaps['price'][bucket] |= bit
+        self.prices_dirty = True
+
+    def _remove(self, product_id):
+        if product_id not in self.rows:
+            return
+        clear = ~(1 << product_id)
+        self.all &= clear
+        for facet in self.FACETS:
+            for key in list(self.bitmaps[facet]):
+                self.bitmaps[facet][key] &= clear
+                if not self.bitmaps[facet][key]:
+                    del self.bitmaps[facet][key]
+        del self.rows[product_id]
+        self.prices_dirty = True
+
+    def rebuild(self):
+        # read first: a change made while the rows are read shows up as a newer version
+        version = get_version(FACET_VERSION_KEY)
+        rows_by_product = self._variant_rows(ProductVariant.objects.all())
+        members = {facet: defaultdict(list) for facet in self.FACETS}
+        for product_id, rows in rows_by_product.items():
+            for category_id, size_id, color_id, price in rows:
+                if category_id is not None:
+                    members['category'][category_id].append(product_id)
+                members['size'][size_id].append(product_id)
+                members['color'][color_id].append(product_id)
+                bucket = price_bucket(price)
+                if bucket is not None:
+                    members['price'][bucket].append(product_id)
+
+        with self.lock:
+            self._reset()
+            self.rows = dict(rows_by_product)
+            self.all = bits(rows_by_product)
+            for facet, values in members.items():
+                for key, ids in values.items():
+                    self.bitmaps[facet][key] = bits(ids)
+            self.prices_dirty = True
+            self.version = version
+
+    def _patch(self, product_ids):
+        rows = self._variant_rows(ProductVariant.objects.filter(product_id__in=product_ids))
+        for product_id in product_ids:
+            self._remove(product_id)
+            if rows.get(product_id):
+                self._add(product_id, rows[product_id])
+
+    def _catch_up(self, current):
+        """Re-read the products logged since our version; False if the log doesn't reach back."""
+        if self.version is None:
+            return False
+        changed = changes_since(FACET_VERSION_KEY, self.version, current)
+        if changed is None:
+            return False
+        self._patch(set(changed))
+        self.version = current
+        return True
+
+    def refresh_products(self, product_ids):
+        """Re-read the variants of `product_ids` and patch their bits in place."""
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+        with self.lock:
+            seen_version = self.version
+            # let the other workers know which products to re-read
+            new_version = bump_version(FACET_VERSION_KEY, sorted(product_ids))
+            if seen_version is not None and new_version == seen_version + 1:
+                self._patch(product_ids)
+                self.version = new_version
+            elif not self._catch_up(new_version):
+                # never built, or too far behind: rebuild on next search
+                self.version = None
+
+    def id_limit(self):
+        """One past the highest product id indexed; card cursors must stay within it."""
+        self.ensure_current()
+        return self.all.bit_length()
+
+    def invalidate(self):
+        with self.lock:
+            self.version = None
+
+    def ensure_current(self):
+        current = get_version(FACET_VERSION_KEY)
+        if self.version == current:
+            return
+        with self.lock:
+            caught_up = self.version == current or self._catch_up(current)
+        if not caught_up:
+            self.rebuild()
+
+    # --- querying -------------------------------------------------------
+
+    def _sorted_prices(self):
+        with self.lock:
+            if self.prices_dirty:
+                self.prices = sorted(
+                    (price, product_id)
+                    for product_id, rows in self.rows.items()
+                    for *_, price in rows
+                )
+                self.prices_dirty = False
+            return self.prices
+
+    def _price_range_mask(self, min_price, max_price):
+        prices = self._sorted_prices()
+        lo = 0 if min_price is None else bisect.bisect_left(prices, (min_price, -1))
+        hi = len(prices) if max_price is None else bisect.bisect_right(prices, (max_price, float('inf')))
+        return bits(product_id for _, product_id in prices[lo:hi])
+
+    def price_range(self):
+        """(min, max) effective variant price across the catalog, or (None, None) when empty."""
+        self.ensure_current()
+        prices = self._sorted_prices()
+        if not prices:
+            return None, None
+        return prices[0][0], prices[-1][0]
+
+    def _union(self, facet, keys):
+        mask = 0
+        for key in keys:
+            mask |= self.bitmaps[facet].get(key, 0)
+        return mask
+
+    def search(self, categories=(), sizes=(), colors=(), price_buckets=(), min_price=None, max_price=None):
+        """
+        Products matching every given facet (values inside one facet are OR-ed),
+        plus counts for each facet value computed with the *other* facets applied.
+        """
+        self.ensure_current()
+        selected = {'category': categories, 'size': sizes, 'color': colors, 'price': price_buckets}
+        masks = {
+            facet: self._union(facet, keys) if keys else self.all
+            for facet, keys in selected.items()
+        }
+        base = self.all
+        if min_price is not None or max_price is not None:
+            base &= self._price_range_mask(min_price, max_price)
+
+        result = base
+        for mask in masks.values():
+            result &= mask
+
+        counts = {}
+        for facet in self.FACETS:
+            others = base
+            for other, mask in masks.items():
+                if other != facet:
+                    others &= mask
+            counts[facet] = {
+                key: (others & bitmap).bit_count()
+                for key, bitmap in self.bitmaps[facet].items()
+            }
+        return FacetResult(result, counts)
+
+
+_index = FacetIndex()
+
+
+def facet_index():
+    return _index
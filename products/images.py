@@ -0,0 +1,136 @@
+"""
+Responsive image derivatives.
+
+Every uploaded image in DERIVATIVE_FIELDS gets fixed-width renditions in WebP and
+JPEG, stored next to the original under a predictable name:
+
+    products/main/shirt.jpg -> products/main/shirt.w320.webp, products/main/shirt.w320.jpg, ...
+
+Because the names only depend on the original, templates can build srcset
+attributes from a URL alone (see templatetags/responsive_images.py) without
+looking anything up. Originals narrower than a width are not upscaled; that
+rendition is written at the original size so every name in the srcset exists.
+
+Derivatives are generated after an upload is saved (products.signals and
+home.signals) and backfilled with `manage.py build_image_derivatives`.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 1024)))
+FORMATS = {
+    # extension: (Pillow format, save options)
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# app_label.Model -> image fields that get derivatives
+DERIVATIVE_FIELDS = {
+    'products.Category': ['image', 'second_image', 'third_image'],
+    'products.ProductVariant': ['image', 'image_hover'],
+    'products.ProductVariantImage': ['image'],
+    'products.Reviews': ['image'],
+    'home.Blog': ['image'],
+}
+
+
+def derivative_name(name, width, ext):
+    """Storage name (or URL) of the `width`px `ext` rendition of `name`."""
+    root, _ = os.path.splitext(name)
+    return f'{root}.w{width}.{ext}'
+
+
+def derivative_names(name):
+    return [derivative_name(name, width, ext) for width in WIDTHS for ext in FORMATS]
+
+
+def has_derivatives(name, storage=default_storage):
+    return all(storage.exists(n) for n in derivative_names(name))
+
+
+def open_image(name, storage=default_storage):
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    # honour camera rotation, then drop alpha/palette for formats that don't keep it
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def encode_image(image, ext):
+    fmt, options = FORMATS[ext]
+    if fmt == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buf = BytesIO()
+    image.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def build_derivatives(name, storage=default_storage):
+    """Write every rendition of the stored image `name`; returns the names written."""
+    image = open_image(name, storage)
+    written = []
+    for width in WIDTHS:
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+        else:
+            resized = image
+        for ext in FORMATS:
+            target = derivative_name(name, width, ext)
+            if storage.exists(target):
+                # storage.save() would pick a new name instead of overwriting
+                storage.delete(target)
+            written.append(storage.save(target, ContentFile(encode_image(resized, ext))))
+    return written
+
+
+def new_uploads(instance):
+    """Names of image fields on `instance` holding a file not saved to storage yet."""
+    fields = DERIVATIVE_FIELDS.get(instance._meta.label, [])
+    return [
+        field for field in fields
+        if getattr(instance, field) and not getattr(instance, field)._committed
+    ]
+
+
+def build_for_fields(instance, fields):
+    """Build derivatives for the given (already saved) image fields of `instance`."""
+    for field in fields:
+        file = getattr(instance, field)
+        if not file:
+            continue
+        try:
+            build_derivatives(file.name, file.storage)
+        except OSError:
+            # unreadable upload: pages keep working off the original
+            logger.exception("Could not build derivatives for %s", file.name)
+
+
+# Signal receivers, connected for every model in DERIVATIVE_FIELDS by products.signals / home.signals.
+# FileField commits the upload during save(), so new files are noted before it and handled after.
+
+def remember_uploads(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._image_uploads = new_uploads(instance)
+
+
+def build_uploads(sender, instance, raw=False, **kwargs):
+    fields = getattr(instance, '_image_uploads', None)
+    if raw or not fields:
+        return
+    instance._image_uploads = []
+    transaction.on_commit(lambda: build_for_fields(instance, fields))
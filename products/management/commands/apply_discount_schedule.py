@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.pricing import apply_schedule, next_boundary, prices_changed, refresh_effective_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Reprice variants whose discounts started or ended recently. "
+        "Run it every minute from cron, or keep it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=5,
+                            help="Minutes to look back for boundaries (overlapping runs are harmless).")
+        parser.add_argument('--all', action='store_true', help="Reprice every variant (after a deploy or import).")
+        parser.add_argument('--loop', action='store_true', help="Keep running, waking up at each boundary.")
+        parser.add_argument('--max-sleep', type=float, default=60.0,
+                            help="Longest nap with --loop, so newly scheduled discounts are noticed.")
+
+    def report(self, changed):
+        self.stdout.write(self.style.SUCCESS(f"Repriced {len(changed)} products."))
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['all']:
+            changed = refresh_effective_prices(now=now)
+            prices_changed(changed)
+        else:
+            changed = apply_schedule(now - timedelta(minutes=options['window']), now)
+        self.report(changed)
+
+        while options['loop']:
+            since = now
+            wake_at = next_boundary(now)
+            delay = options['max_sleep']
+            if wake_at is not None:
+                # a discount stops applying just after its end_date, hence the extra second
+                delay = min(delay, max((wake_at - now).total_seconds() + 1, 0))
+            time.sleep(delay)
+            now = timezone.now()
+            changed = apply_schedule(since, now)
+            if changed:
+                self.report(changed)
@@ -0,0 +1,54 @@
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from products.recommend import CHUNK_SIZE, MAX_LIKES_PER_USER, MIN_COMMON_LIKES, TOP_K, like_matrix, similar_items
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the also-liked similarity job on a synthetic like matrix (no database). "
+        "Product popularity follows a power law, like real catalogs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--users', type=int, default=200_000)
+        parser.add_argument('--likes', type=int, default=2_000_000)
+        parser.add_argument('--top', type=int, default=TOP_K)
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--min-common', type=int, default=MIN_COMMON_LIKES)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def synthetic_likes(self, products, users, likes, seed):
+        rng = np.random.default_rng(seed)
+        popularity = 1 / np.arange(1, products + 1) ** 0.8
+        product_ids = rng.choice(products, size=likes, p=popularity / popularity.sum())
+        user_ids = rng.integers(0, users, size=likes)
+        # a shopper likes a product once
+        pairs = np.unique(user_ids * products + product_ids)
+        return pairs // products, pairs % products
+
+    def handle(self, *args, **options):
+        user_ids, product_ids = self.synthetic_likes(
+            options['products'], options['users'], options['likes'], options['seed'],
+        )
+        self.stdout.write(f"{len(user_ids)} likes, {options['products']} products, {options['users']} users")
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        product_index, matrix = like_matrix(user_ids, product_ids, MAX_LIKES_PER_USER)
+        built = time.perf_counter()
+
+        pairs = 0
+        for _, _, rows, _, _ in similar_items(matrix, options['top'], options['chunk_size'], options['min_common']):
+            pairs += len(rows)
+        finished = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(f"matrix:       {built - started:.2f}s ({matrix.nnz} non-zeros)")
+        self.stdout.write(f"similarities: {finished - built:.2f}s ({pairs} pairs kept)")
+        self.stdout.write(f"peak memory:  {peak / 2**20:.0f} MB")
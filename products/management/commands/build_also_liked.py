@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.recommend import CHUNK_SIZE, MIN_COMMON_LIKES, TOP_K, build_also_liked
+
+
+class Command(BaseCommand):
+    help = "Recompute the \"customers who liked this also liked\" rows from the like matrix."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_K, help="Recommendations kept per product.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Products scored per batch.")
+        parser.add_argument('--min-common', type=int, default=MIN_COMMON_LIKES,
+                            help="Minimum number of shoppers who liked both products.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = build_also_liked(
+            top_k=options['top'], chunk_size=options['chunk_size'], min_common=options['min_common'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} also-liked rows in {elapsed:.1f}s."))
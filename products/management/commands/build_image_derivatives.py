@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from products.images import DERIVATIVE_FIELDS, build_derivatives, has_derivatives
+
+
+class Command(BaseCommand):
+    help = "Generate the WebP/JPEG width renditions for images uploaded before the pipeline existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild renditions that already exist.")
+
+    def handle(self, *args, **options):
+        built = skipped = failed = 0
+        for label, fields in DERIVATIVE_FIELDS.items():
+            model = apps.get_model(label)
+            names = set()
+            for row in model.objects.values_list(*fields).iterator(chunk_size=2000):
+                names.update(name for name in row if name)
+
+            storage = model._meta.get_field(fields[0]).storage
+            for name in sorted(names):
+                if not options['force'] and has_derivatives(name, storage):
+                    skipped += 1
+                    continue
+                try:
+                    build_derivatives(name, storage)
+                    built += 1
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f"{label} {name}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {built} images ({skipped} up to date, {failed} failed)."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products.related import TOP_N, build_related_products
+
+
+class Command(BaseCommand):
+    help = "Recompute the similar-product rows (category, shared colors/sizes and co-likes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_N, help="Related products kept per product.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        written = build_related_products(top_n=options['top'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} related product rows."))
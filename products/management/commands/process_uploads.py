@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.uploads import process_pending
+
+
+class Command(BaseCommand):
+    help = "Validate, clean and attach staged user image uploads (reviews, blog comments and replies)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of doing a single pass.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between polls with --loop.")
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            results = process_pending(limit=options['limit'])
+            if results or not options['loop']:
+                summary = ', '.join(f"{n} {status}" for status, n in sorted(results.items())) or "nothing to do"
+                self.stdout.write(self.style.SUCCESS(f"Processed uploads: {summary}."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
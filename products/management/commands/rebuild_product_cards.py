@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product, ProductCard
+from products.services import refresh_product_cards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized ProductCard table for every product."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+        written = 0
+        for start in range(0, len(ids), batch_size):
+            written += refresh_product_cards(ids[start:start + batch_size])
+
+        # Drop cards whose product has lost all its variants since the last run
+        stale, _ = ProductCard.objects.filter(product__variants__isnull=True).delete()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} product cards ({stale} stale removed)."))
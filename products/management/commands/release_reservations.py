@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.cart import release_expired
+
+
+class Command(BaseCommand):
+    help = "Put the stock of expired checkout reservations back on sale (run every minute from cron)."
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservations."))
@@ -0,0 +1,117 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+BATCH_SIZE = 500
+
+
+def discounts_in_force(Discount):
+    """The winning discount per variant, product and category: lowest id among those active now."""
+    now = timezone.now()
+    winners = {'variant_id': {}, 'product_id': {}, 'category_id': {}}
+    active = Discount.objects.filter(active=True, start_date__lte=now).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=now)
+    )
+    for discount in active.order_by('id'):
+        for field, by_key in winners.items():
+            if getattr(discount, field) is not None:
+                by_key.setdefault(getattr(discount, field), discount)
+    return winners
+
+
+def build_card(ProductCard, product, variants, discount, now):
+    first_variant = variants[0]
+    colors, seen_colors = [], set()
+    sizes = []
+    for v in variants:
+        if v.color_id and v.color_id not in seen_colors:
+            seen_colors.add(v.color_id)
+            colors.append({
+                'id': v.color.id,
+                'name': v.color.name,
+                'code': v.color.color or '#000',
+                'image': v.image.url if v.image else '',
+                'image_hover': v.image_hover.url if v.image_hover else '',
+            })
+        if v.size_id and v.size.size and v.size.size not in sizes:
+            sizes.append(v.size.size)
+
+    prices = [v.price for v in variants]
+    price = first_variant.price
+    return ProductCard(
+        product=product,
+        variant=first_variant,
+        min_price=min(prices),
+        max_price=max(prices),
+        price=price,
+        effective_price=price - price * discount.amount / 100 if discount else price,
+        has_discount=discount is not None,
+        stock=sum(v.stock for v in variants),
+        main_image=first_variant.image.url if first_variant.image else '',
+        hover_image=first_variant.image_hover.url if first_variant.image_hover else '',
+        colors=colors,
+        sizes=sizes,
+        updated_at=now,
+    )
+
+
+def build_cards(apps, schema_editor):
+    # listings read nothing but ProductCard, so existing products need theirs now.
+    # A frozen copy of services.refresh_product_cards as of this migration: the
+    # app code moves on, this has to keep working against the tables as they are here.
+    Product = apps.get_model('products', 'Product')
+    ProductCard = apps.get_model('products', 'ProductCard')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    winners = discounts_in_force(apps.get_model('products', 'Discount'))
+    now = timezone.now()
+
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        products = Product.objects.filter(id__in=ids[start:start + BATCH_SIZE]).prefetch_related(
+            models.Prefetch('variants', queryset=ProductVariant.objects.select_related('color', 'size').order_by('id'))
+        )
+        cards = []
+        for product in products:
+            variants = list(product.variants.all())
+            if not variants:
+                continue
+            # variant -> product -> category, like services.DiscountResolver
+            discount = (
+                winners['variant_id'].get(variants[0].id)
+                or winners['product_id'].get(product.id)
+                or winners['category_id'].get(product.category_id)
+            )
+            cards.append(build_card(ProductCard, product, variants, discount, now))
+        ProductCard.objects.bulk_create(cards)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='products.product')),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price', models.DecimalField(decimal_places=2, help_text='Price of the display variant', max_digits=10)),
+                ('effective_price', models.DecimalField(decimal_places=2, help_text='Display variant price after discount', max_digits=10)),
+                ('has_discount', models.BooleanField(default=False)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('main_image', models.CharField(blank=True, max_length=500)),
+                ('hover_image', models.CharField(blank=True, max_length=500)),
+                ('colors', models.JSONField(blank=True, default=list)),
+                ('sizes', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.productvariant')),
+            ],
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_productcard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='featured_order',
+            field=models.PositiveIntegerField(default=0, help_text='Lower numbers are shown first'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='is_featured',
+            field=models.BooleanField(db_index=True, default=False, help_text='Show in the home page feed'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:04
+
+from django.db import migrations
+
+# Full-text search for products, maintained by the database itself:
+#  * PostgreSQL: a weighted tsvector column kept current by a trigger, with a GIN index
+#  * SQLite: an external-content FTS5 table kept current by triggers
+# See home/search.py for the query side.
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE products_product ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION products_product_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.brand, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER products_product_search_trigger
+    BEFORE INSERT OR UPDATE OF name, brand, description ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_search_update()
+    """,
+    "UPDATE products_product SET name = name",
+    "CREATE INDEX products_product_search_idx ON products_product USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS products_product_search_trigger ON products_product",
+    "DROP FUNCTION IF EXISTS products_product_search_update()",
+    "ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE products_product_fts USING fts5(
+        name, brand, description, content='products_product', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER products_product_fts_ai AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts(rowid, name, brand, description)
+        VALUES (new.id, new.name, coalesce(new.brand, ''), coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_ad AFTER DELETE ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.brand, ''), coalesce(old.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_au AFTER UPDATE ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.brand, ''), coalesce(old.description, ''));
+        INSERT INTO products_product_fts(rowid, name, brand, description)
+        VALUES (new.id, new.name, coalesce(new.brand, ''), coalesce(new.description, ''));
+    END
+    """,
+    "INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS products_product_fts_ai",
+    "DROP TRIGGER IF EXISTS products_product_fts_ad",
+    "DROP TRIGGER IF EXISTS products_product_fts_au",
+    "DROP TABLE IF EXISTS products_product_fts",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor not in statements:
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements[vendor]:
+                cursor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_featured'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:06
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_duplicates(apps, schema_editor):
+    """Keep only the newest row per (user, query) so the unique constraint can be added."""
+    RecentSearch = apps.get_model('products', 'RecentSearch')
+    seen = set()
+    duplicates = []
+    for pk, user_id, query in RecentSearch.objects.order_by('-created_at', '-id').values_list('id', 'user_id', 'query'):
+        if (user_id, query) in seen:
+            duplicates.append(pk)
+        seen.add((user_id, query))
+    RecentSearch.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recentsearch',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='recentsearch',
+            index=models.Index(fields=['user', '-created_at'], name='recent_search_user_created'),
+        ),
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='recentsearch',
+            constraint=models.UniqueConstraint(fields=('user', 'query'), name='unique_recent_search_per_user'),
+        ),
+    ]
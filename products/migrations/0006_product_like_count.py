@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from ._fts import restore_sqlite_triggers
+
+
+def count_likes(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Like = Product.liked_by.through
+    likes = Like.objects.filter(product_id=OuterRef('pk')).values('product_id').annotate(n=Count('*')).values('n')
+    Product.objects.update(like_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_recentsearch_upsert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Kept in sync with liked_by'),
+        ),
+        migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
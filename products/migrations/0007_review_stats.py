@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:20
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+import products.models
+
+from ._fts import restore_sqlite_triggers
+
+
+def fill_review_stats(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Reviews = apps.get_model('products', 'Reviews')
+    histograms = defaultdict(lambda: [0] * 5)
+    for product_id, rating, n in Reviews.objects.values_list('product_id', 'rating').annotate(n=Count('id')):
+        if 1 <= rating <= 5:
+            histograms[product_id][rating - 1] = n
+    for product_id, histogram in histograms.items():
+        count = sum(histogram)
+        avg = Decimal(sum(star * n for star, n in enumerate(histogram, 1))) / count
+        Product.objects.filter(id=product_id).update(
+            rating_histogram=histogram, rating_count=count, rating_avg=avg.quantize(Decimal('0.01')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_like_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=products.models.empty_rating_histogram, editable=False, help_text='Review counts for 1..5 stars'),
+        ),
+        migrations.AddIndex(
+            model_name='reviews',
+            index=models.Index(fields=['product', '-created_at'], name='review_product_created'),
+        ),
+        migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
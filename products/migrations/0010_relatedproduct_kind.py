@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='relatedproduct',
+            name='unique_related_product',
+        ),
+        migrations.RemoveIndex(
+            model_name='relatedproduct',
+            name='related_product_score',
+        ),
+        migrations.AddField(
+            model_name='relatedproduct',
+            name='kind',
+            field=models.CharField(choices=[('similar', 'Similar'), ('also_liked', 'Also liked')], default='similar', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='relatedproduct',
+            index=models.Index(fields=['product', 'kind', '-score'], name='related_product_kind_score'),
+        ),
+        migrations.AddConstraint(
+            model_name='relatedproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'kind', 'related'), name='unique_related_product_kind'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:33
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+BATCH_SIZE = 2000
+
+
+def compute_prices(apps, schema_editor):
+    # The discounts in force now; later starts and ends are applied by apply_discount_schedule.
+    # A frozen copy of pricing.refresh_effective_prices as of this migration, so
+    # later changes to the app code can't break replaying it.
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    Discount = apps.get_model('products', 'Discount')
+    now = timezone.now()
+
+    # lowest id wins within each level, variant -> product -> category (services.DiscountResolver)
+    winners = {'variant_id': {}, 'product_id': {}, 'category_id': {}}
+    active = Discount.objects.filter(active=True, start_date__lte=now).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=now)
+    )
+    for discount in active.order_by('id'):
+        for field, by_key in winners.items():
+            if getattr(discount, field) is not None:
+                by_key.setdefault(getattr(discount, field), discount)
+
+    batch = []
+    variants = ProductVariant.objects.select_related('product').only('id', 'price', 'product__category').order_by('id')
+    for variant in variants.iterator(chunk_size=BATCH_SIZE):
+        discount = (
+            winners['variant_id'].get(variant.id)
+            or winners['product_id'].get(variant.product_id)
+            or winners['category_id'].get(variant.product.category_id)
+        )
+        price = variant.price - variant.price * discount.amount / 100 if discount else variant.price
+        variant.effective_price = price.quantize(CENT, ROUND_HALF_UP)
+        batch.append(variant)
+        if len(batch) == BATCH_SIZE:
+            ProductVariant.objects.bulk_update(batch, ['effective_price'])
+            batch = []
+    ProductVariant.objects.bulk_update(batch, ['effective_price'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_cart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariant',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(fields=['effective_price'], name='variant_effective_price'),
+        ),
+        migrations.RunPython(compute_prices, migrations.RunPython.noop),
+    ]
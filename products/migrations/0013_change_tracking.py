@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from ._fts import restore_sqlite_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_variant_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(restore_sqlite_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# SQLite drops a table's triggers whenever a migration has to rebuild it (most
+# AddField/AlterField operations do), which silently stops the products_product_fts
+# index from following changes. Migrations that touch products_product import
+# restore_sqlite_triggers() from here and run it after their schema changes.
+# Postgres keeps its trigger across ALTER TABLE and needs nothing.
+
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS products_product_fts_ai",
+    "DROP TRIGGER IF EXISTS products_product_fts_ad",
+    "DROP TRIGGER IF EXISTS products_product_fts_au",
+    """
+    CREATE TRIGGER products_product_fts_ai AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts(rowid, name, brand, description)
+        VALUES (new.id, new.name, coalesce(new.brand, ''), coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_ad AFTER DELETE ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.brand, ''), coalesce(old.description, ''));
+    END
+    """,
+    # only the indexed columns, so counter updates (like_count...) don't rewrite the index
+    """
+    CREATE TRIGGER products_product_fts_au AFTER UPDATE OF name, brand, description ON products_product BEGIN
+        INSERT INTO products_product_fts(products_product_fts, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.brand, ''), coalesce(old.description, ''));
+        INSERT INTO products_product_fts(rowid, name, brand, description)
+        VALUES (new.id, new.name, coalesce(new.brand, ''), coalesce(new.description, ''));
+    END
+    """,
+    "INSERT INTO products_product_fts(products_product_fts) VALUES ('rebuild')",
+]
+
+
+def restore_sqlite_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
@@ -31,6 +31,8 @@ class Category(models.Model):
     second_image = models.ImageField(upload_to='categories/', blank=True, null=True)
     third_image = models.ImageField(upload_to='categories/', blank=True, null=True)
     icon = models.ImageField(upload_to="icon_images", blank=True, null=True)
+    # also touched when a product listed in it changes, see services.touch_products
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = 'Categories'
@@ -40,19 +42,32 @@ class Category(models.Model):
     def __str__(self):
         return f"→ {self.name}"
 
+def empty_rating_histogram():
+    return [0] * 5
+
+
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     brand = models.CharField(max_length=100, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # also touched when its variants, images, discounts or reviews change, see services.touch_products
+    updated_at = models.DateTimeField(auto_now=True)
     liked_by = models.ManyToManyField(User, blank=True, related_name='liked_products')
+    like_count = models.PositiveIntegerField(default=0, editable=False, help_text="Kept in sync with liked_by")
+    # review summary, kept in sync by services.refresh_review_stats()
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_histogram = models.JSONField(default=empty_rating_histogram, blank=True, editable=False, help_text="Review counts for 1..5 stars")
+    is_featured = models.BooleanField(default=False, db_index=True, help_text="Show in the home page feed")
+    featured_order = models.PositiveIntegerField(default=0, help_text="Lower numbers are shown first")
 
     def __str__(self):
         return self.name
 
     def total_likes(self):
-        return self.liked_by.count()
+        return self.like_count
 
     
     def get_absolute_url(self):
@@ -93,12 +108,17 @@ class ProductVariant(models.Model):
     size = models.ForeignKey(Size, on_delete=models.CASCADE, blank=True)
     color = models.ForeignKey(Color, on_delete=models.CASCADE, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # price after the discount in force right now, kept by products.pricing; filter and sort on this
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
     image = models.ImageField(upload_to="products/main/")
     image_hover = models.ImageField(upload_to="products/main/")
     stock = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('product', 'size', 'color')
+        indexes = [
+            models.Index(fields=['effective_price'], name='variant_effective_price'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.color.name}"
@@ -163,16 +183,181 @@ class Reviews(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='review_product_created'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.product.name} ({self.rating}⭐)"
     
 class RecentSearch(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recent_searches')
     query = models.CharField(max_length=100)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # last time the query was searched; set by home.recent_searches when the buffer is flushed
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'query'], name='unique_recent_search_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='recent_search_user_created'),
+        ]
+
+    def __str__(self):
+        return self.query
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed recommendations for a product, best first by score.
+    "similar" rows are filled by `manage.py build_related_products` (see
+    products/related.py), "also_liked" rows by `manage.py build_also_liked`
+    (see products/recommend.py).
+    """
+    SIMILAR = 'similar'
+    ALSO_LIKED = 'also_liked'
+    KIND_CHOICES = [
+        (SIMILAR, 'Similar'),
+        (ALSO_LIKED, 'Also liked'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_from')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=SIMILAR)
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'kind', 'related'], name='unique_related_product_kind'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'kind', '-score'], name='related_product_kind_score'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.kind}, {self.score:.2f})"
+
+class PendingUpload(models.Model):
+    """
+    A user-uploaded image waiting in the staging area (see products.uploads).
+    Once processed, the cleaned file is attached to `field` of the target row.
+    """
+    PENDING, PROCESSING, DONE, FAILED = 'pending', 'processing', 'done', 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (PROCESSING, 'Processing'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    model_label = models.CharField(max_length=100, help_text="e.g. products.Reviews")
+    object_id = models.PositiveBigIntegerField()
+    field = models.CharField(max_length=50)
+    staged_name = models.CharField(max_length=300)
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='pending_upload_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_label}#{self.object_id}.{self.field} ({self.status})"
+
+class Cart(models.Model):
+    """
+    A shopper's cart. Signed-in shoppers have one each; anonymous carts are found
+    through the session (see products.cart).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='cart')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cart {self.id} ({self.user or 'anonymous'})"
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='cart_items')
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'variant'], name='unique_cart_variant'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant_id}"
+
+class StockReservation(models.Model):
+    """
+    Units taken out of ProductVariant.stock at checkout (see products.cart).
+    Held units go back to stock once `expires_at` passes; confirmed ones are sold.
+    """
+    HELD, CONFIRMED = 'held', 'confirmed'
+    STATUS_CHOICES = [(HELD, 'Held'), (CONFIRMED, 'Confirmed')]
+
+    # SET_NULL: a held reservation must still expire if its cart goes away
+    cart = models.ForeignKey(Cart, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservations')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant_id} ({self.status})"
+
+class Order(models.Model):
+    """A confirmed checkout; written by products.cart.confirm_checkout."""
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Order {self.id} ({self.user or 'anonymous'})"
+
+class OrderLine(models.Model):
+    """One line of an order at the price paid; the name is kept in case the variant goes away."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_lines')
+    product_name = models.CharField(max_length=200)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    original_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name}"
+
+class ProductCard(models.Model):
+    """
+    Denormalized listing row for a product (one per product).
+    Kept up to date by products.signals; rebuild with `manage.py rebuild_product_cards`.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Price of the display variant")
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Display variant price after discount")
+    has_discount = models.BooleanField(default=False)
+    stock = models.PositiveIntegerField(default=0)
+    main_image = models.CharField(max_length=500, blank=True)
+    hover_image = models.CharField(max_length=500, blank=True)
+    colors = models.JSONField(default=list, blank=True)
+    sizes = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.query
\ No newline at end of file
+        return f"Card for {self.product_id}"
@@ -0,0 +1,128 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder, but datetimes keep their microseconds (it rounds them to milliseconds)."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=CursorEncoder).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Inverse of encode_cursor(); raises InvalidCursor unless it holds `length` values."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor(cursor)
+    return values
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) pagination over a stable ordering.
+
+    `ordering` works like QuerySet.order_by() and must end with a unique field so
+    the sort key is total, e.g. ('-product_id',) or ('effective_price', 'product_id').
+    Each page is a single `WHERE key > last_key ORDER BY key LIMIT n+1` query,
+    so its cost does not depend on how deep into the listing the user is.
+    """
+
+    def __init__(self, queryset, ordering, per_page=24):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [o.lstrip('-') for o in self.ordering]
+
+    encode_cursor = staticmethod(encode_cursor)
+
+    def _model_field(self, path):
+        model = self.queryset.model
+        for part in path.split('__'):
+            field = model._meta.get_field(part)
+            model = field.related_model
+        # a foreign key's value is checked as its target column (no lookup of the row)
+        return field.target_field if field.is_relation else field
+
+    def decode_cursor(self, cursor):
+        """The cursor's values converted by their ordering fields; InvalidCursor if any doesn't fit."""
+        values = decode_cursor(cursor, len(self.fields))
+        if None in values:
+            raise InvalidCursor(cursor)
+        try:
+            # clean(): type conversion plus range validators (ids beyond the column's integer range)
+            return [
+                self._model_field(path).clean(value, None)
+                for path, value in zip(self.fields, values)
+            ]
+        except (ValidationError, TypeError, ValueError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+    def _after(self, values):
+        """Q matching rows strictly after `values` in the ordering."""
+        condition = Q()
+        for i, order in enumerate(self.ordering):
+            field = self.fields[i]
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _key(self, obj):
+        values = []
+        for field in self.fields:
+            value = obj
+            for part in field.split('__'):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+
+        items = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode_cursor(self._key(items[-1]))
+        return KeysetPage(items, next_cursor)
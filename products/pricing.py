@@ -0,0 +1,137 @@
+"""
+Materialized effective prices.
+
+ProductVariant.effective_price is the variant's price after the discount in
+force (same precedence as services.DiscountResolver), so the shop filters,
+price buckets and price range work on the price shoppers actually pay, read
+from a column instead of resolving discounts per request.
+
+It is kept current:
+
+    on save     for the saved variant (products.signals)
+    discounts   for every variant a Discount reaches, before and after the
+                change, when it is saved or deleted (products.signals)
+    schedule    at each discount's start_date and end_date, by
+                `manage.py apply_discount_schedule` (every minute from cron,
+                or --loop to sleep until the next boundary)
+
+Changed products get their ProductCard and facet bits refreshed as well, and
+the cached catalog pages are made stale (CATALOG_TAG).
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from home.cache_versions import bump_version
+from home.page_cache import CATALOG_TAG
+
+from .facets import facet_index
+from .models import Discount, ProductVariant
+from .services import DiscountResolver, refresh_product_cards, touch_products
+
+CENT = Decimal('0.01')
+BATCH_SIZE = 2000
+CARD_BATCH_SIZE = 500
+
+
+def discount_targets(discount):
+    """(variant_id, product_id, category_id) a discount applies to."""
+    return discount.variant_id, discount.product_id, discount.category_id
+
+
+def variants_for(targets):
+    """Q matching every variant reached by any of the (variant_id, product_id, category_id) targets."""
+    q = Q(pk__in=[])
+    for variant_id, product_id, category_id in targets:
+        if variant_id:
+            q |= Q(id=variant_id)
+        if product_id:
+            q |= Q(product_id=product_id)
+        if category_id:
+            q |= Q(product__category_id=category_id)
+    return q
+
+
+def refresh_effective_prices(variants=None, now=None, batch_size=BATCH_SIZE):
+    """
+    Recompute effective_price for `variants` (a queryset; every variant by default).
+    Returns the ids of the products whose prices changed.
+    """
+    resolver = DiscountResolver(now)
+    if variants is None:
+        variants = ProductVariant.objects.all()
+    rows = (
+        variants.select_related('product')
+        .only('id', 'price', 'effective_price', 'product__category')
+        .order_by('id')
+        .iterator(chunk_size=batch_size)
+    )
+    changed_products = set()
+    while batch := list(islice(rows, batch_size)):
+        prices = resolver.resolve(batch)
+        changed = []
+        for variant in batch:
+            price = prices[variant.id].final_price.quantize(CENT, ROUND_HALF_UP)
+            if price != variant.effective_price:
+                variant.effective_price = price
+                changed.append(variant)
+        ProductVariant.objects.bulk_update(changed, ['effective_price'])
+        changed_products.update(variant.product_id for variant in changed)
+    return changed_products
+
+
+def prices_changed(product_ids):
+    """
+    Carry new prices into the listing cards, the facet index, the pages'
+    updated_at (products and their categories) and the anonymous page cache.
+    """
+    product_ids = sorted(product_ids)
+    if not product_ids:
+        return
+    for start in range(0, len(product_ids), CARD_BATCH_SIZE):
+        batch = product_ids[start:start + CARD_BATCH_SIZE]
+        refresh_product_cards(batch)
+        touch_products(batch)
+    facet_index().refresh_products(product_ids)
+    # the schedule saves no model, so home.signals never bumps this for it
+    bump_version(CATALOG_TAG)
+
+
+def reprice(targets, now=None):
+    """Refresh every variant reached by `targets`; returns the ids of the products repriced."""
+    targets = list(targets)
+    if not targets:
+        return set()
+    changed = refresh_effective_prices(ProductVariant.objects.filter(variants_for(targets)), now)
+    prices_changed(changed)
+    return changed
+
+
+# --- schedule ------------------------------------------------------------
+
+def due_discounts(since, now):
+    """Discounts that started or ended in (since, now]."""
+    return Discount.objects.filter(
+        Q(start_date__gt=since, start_date__lte=now)
+        # a discount still applies at its end_date and stops right after it
+        | Q(end_date__gte=since, end_date__lt=now)
+    )
+
+
+def apply_schedule(since, now=None):
+    """Reprice what the discount boundaries passed since `since` reach; returns the products repriced."""
+    now = now or timezone.now()
+    return reprice((discount_targets(d) for d in due_discounts(since, now)), now)
+
+
+def next_boundary(now=None):
+    """When the next discount starts or ends, or None when nothing is scheduled."""
+    now = now or timezone.now()
+    upcoming = Discount.objects.aggregate(
+        start=Min('start_date', filter=Q(start_date__gt=now)),
+        end=Min('end_date', filter=Q(end_date__gte=now)),
+    )
+    boundaries = [when for when in upcoming.values() if when is not None]
+    return min(boundaries) if boundaries else None
@@ -0,0 +1,124 @@
+"""
+"Customers who liked this also liked", from the like matrix.
+
+Likes form a binary product x user matrix X (one row per liked product). The
+cosine similarity of two products is
+
+    users who liked both / sqrt(likes of a * likes of b)
+
+so for every pair at once it is X @ X.T scaled by the row norms. That product
+is computed CHUNK_SIZE rows at a time and only the TOP_K best of each row are
+kept, then written to RelatedProduct as "also_liked" rows, which
+product_details and the wishlist page read with a single query each.
+
+Memory stays bounded with millions of likes:
+
+    likes     two int64 arrays (16 bytes per like), read in chunks; user and
+              product ids are remapped to dense indexes for the matrix
+    matrix    CSR, 4 bytes of data + 4 of index per like
+    chunk     at most CHUNK_SIZE rows of X @ X.T; users with more than
+              MAX_LIKES_PER_USER likes only contribute their most recent ones,
+              which caps how many pairs a single heavy user can add
+
+Run `manage.py build_also_liked` from cron (after build_related_products);
+`manage.py benchmark_also_liked` times the job on a synthetic matrix.
+"""
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+from .models import Product, RelatedProduct
+from .services import replace_related
+
+TOP_K = 12
+CHUNK_SIZE = 1000
+# pairs liked together by fewer users than this are noise, not a recommendation
+MIN_COMMON_LIKES = 2
+MAX_LIKES_PER_USER = 200
+DB_CHUNK_SIZE = 20000
+
+Like = Product.liked_by.through
+
+
+def load_likes(chunk_size=DB_CHUNK_SIZE):
+    """(user ids, product ids) of every like, grouped by user, newest first."""
+    users, products = array('q'), array('q')
+    rows = Like.objects.order_by('user_id', '-id').values_list('user_id', 'product_id')
+    for user_id, product_id in rows.iterator(chunk_size=chunk_size):
+        users.append(user_id)
+        products.append(product_id)
+    return np.frombuffer(users, dtype=np.int64), np.frombuffer(products, dtype=np.int64)
+
+
+def like_matrix(user_ids, product_ids, max_per_user=MAX_LIKES_PER_USER):
+    """
+    Binary product x user CSR matrix of the likes, and the product id of each row.
+
+    `user_ids` must be grouped by user with the likes to keep first, as
+    load_likes() returns them. Every liked product gets a row, even if all its
+    likes came from trimmed users.
+    """
+    product_index, rows = np.unique(product_ids, return_inverse=True)
+    if not len(user_ids):
+        return product_index, sparse.csr_matrix((0, 0), dtype=np.float32)
+
+    # position of each like within its user's group
+    starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    rank = np.arange(len(user_ids)) - np.repeat(starts, np.diff(np.r_[starts, len(user_ids)]))
+    keep = rank < max_per_user
+
+    _, cols = np.unique(user_ids[keep], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.float32), (rows[keep], cols)),
+        shape=(len(product_index), cols.max() + 1),
+    )
+    return product_index, matrix
+
+
+def similar_items(matrix, top_k=TOP_K, chunk_size=CHUNK_SIZE, min_common=MIN_COMMON_LIKES):
+    """
+    Yield (start, stop, rows, cols, scores) for each chunk of rows of `matrix`:
+    the top_k most cosine-similar rows of every row in [start, stop), best
+    first. rows/cols are row indexes of `matrix`.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    norms = np.sqrt(np.diff(matrix.indptr)).astype(np.float32)
+    norms[norms == 0] = 1
+    transposed = matrix.T.tocsr()
+
+    for start in range(0, matrix.shape[0], chunk_size):
+        stop = min(start + chunk_size, matrix.shape[0])
+        common = (matrix[start:stop] @ transposed).tocoo()  # likes in common
+        rows, cols, counts = common.row + start, common.col, common.data
+        keep = (rows != cols) & (counts >= min_common)
+        rows, cols = rows[keep], cols[keep]
+        scores = counts[keep] / (norms[rows] * norms[cols])
+
+        # by row, best score first (ties: newest product), then the first top_k of each row
+        order = np.lexsort((-cols, -scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        top = np.arange(len(rows)) - np.searchsorted(rows, rows) < top_k
+        yield start, stop, rows[top], cols[top], scores[top]
+
+
+def build_also_liked(top_k=TOP_K, chunk_size=CHUNK_SIZE, min_common=MIN_COMMON_LIKES):
+    """
+    Recompute every "also_liked" RelatedProduct row; returns the number of rows
+    written. Only products whose rows changed are rewritten (replace_related).
+    """
+    product_index, matrix = like_matrix(*load_likes())
+    written = 0
+    for start, stop, rows, cols, scores in similar_items(matrix, top_k, chunk_size, min_common):
+        new_rows = [
+            RelatedProduct(product_id=product_id, related_id=related_id, kind=RelatedProduct.ALSO_LIKED, score=score)
+            for product_id, related_id, score in zip(
+                product_index[rows].tolist(), product_index[cols].tolist(), scores.tolist()
+            )
+        ]
+        written += replace_related(RelatedProduct.ALSO_LIKED, product_index[start:stop].tolist(), new_rows)
+
+    # products nobody likes any more have no row in the matrix
+    unliked = RelatedProduct.objects.filter(kind=RelatedProduct.ALSO_LIKED, product__like_count=0)
+    replace_related(RelatedProduct.ALSO_LIKED, set(unliked.values_list('product_id', flat=True)), [])
+    return written
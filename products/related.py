@@ -0,0 +1,123 @@
+"""
+Precomputed related products.
+
+For every product a score is computed against a bounded set of candidates (the
+products of the same category, the same main category and those liked by the
+same users) from four signals:
+
+    category   1 for the same category, 0.5 for a sibling in the same main category
+    colors     Jaccard overlap of the color sets of both products' variants
+    sizes      Jaccard overlap of the size sets
+    co-likes   users who liked both / sqrt(likes of a * likes of b)
+
+weighted by WEIGHTS. Co-likes come from the sparse like matrix of recommend.py
+(X @ X.T a chunk at a time), keeping only the MAX_CO_LIKED best per product. The top N per product are written to RelatedProduct as
+"similar" rows, which product_details reads with a single query. Rebuild with
+`manage.py build_related_products` (e.g. nightly from cron).
+"""
+from collections import defaultdict
+
+from .models import Product, ProductVariant, RelatedProduct
+from .recommend import like_matrix, load_likes, similar_items
+from .services import replace_related
+
+WEIGHTS = {'category': 3.0, 'colors': 1.5, 'sizes': 1.0, 'likes': 4.0}
+TOP_N = 12
+# per product, at most this many same-(main)category candidates are scored
+MAX_CATEGORY_CANDIDATES = 400
+# per product, only the products most often liked together with it are kept as co-likes
+MAX_CO_LIKED = 50
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class CatalogSnapshot:
+    """Everything the scorer needs, read once with a handful of queries."""
+
+    def __init__(self):
+        self.category = {}
+        self.main_category = {}
+        for product_id, category_id, main_category_id in Product.objects.values_list(
+            'id', 'category_id', 'category__main_category_id'
+        ).iterator(chunk_size=5000):
+            self.category[product_id] = category_id
+            self.main_category[product_id] = main_category_id
+
+        self.colors = defaultdict(set)
+        self.sizes = defaultdict(set)
+        for product_id, color_id, size_id in ProductVariant.objects.values_list(
+            'product_id', 'color_id', 'size_id'
+        ).iterator(chunk_size=5000):
+            self.colors[product_id].add(color_id)
+            self.sizes[product_id].add(size_id)
+
+        self.by_category = defaultdict(list)
+        self.by_main_category = defaultdict(list)
+        for product_id in sorted(self.category, reverse=True):
+            if self.category[product_id] is not None:
+                self.by_category[self.category[product_id]].append(product_id)
+            if self.main_category[product_id] is not None:
+                self.by_main_category[self.main_category[product_id]].append(product_id)
+
+        # cosine of the like vectors, MAX_CO_LIKED per product: memory grows with the
+        # catalog, not with the square of the likes of the heaviest users
+        self.co_likes = defaultdict(dict)
+        product_index, matrix = like_matrix(*load_likes())
+        for _, _, rows, cols, scores in similar_items(matrix, MAX_CO_LIKED, min_common=1):
+            for a, b, score in zip(product_index[rows].tolist(), product_index[cols].tolist(), scores.tolist()):
+                self.co_likes[a][b] = score
+
+    def candidates(self, product_id):
+        found = set(self.co_likes.get(product_id, ()))
+        for pool in (
+            self.by_category.get(self.category.get(product_id), ()),
+            self.by_main_category.get(self.main_category.get(product_id), ()),
+        ):
+            found.update(pool[:MAX_CATEGORY_CANDIDATES])
+        found.discard(product_id)
+        return found
+
+    def score(self, a, b):
+        if self.category[a] is not None and self.category[a] == self.category[b]:
+            category = 1.0
+        elif self.main_category[a] is not None and self.main_category[a] == self.main_category[b]:
+            category = 0.5
+        else:
+            category = 0.0
+
+        likes = self.co_likes.get(a, {}).get(b, 0.0)
+
+        return (
+            WEIGHTS['category'] * category
+            + WEIGHTS['colors'] * jaccard(self.colors[a], self.colors[b])
+            + WEIGHTS['sizes'] * jaccard(self.sizes[a], self.sizes[b])
+            + WEIGHTS['likes'] * likes
+        )
+
+    def top_related(self, product_id, top_n=TOP_N):
+        scored = [(self.score(product_id, other), other) for other in self.candidates(product_id)]
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        return [(other, score) for score, other in scored[:top_n] if score > 0]
+
+
+def build_related_products(top_n=TOP_N, batch_size=500):
+    """
+    Recompute every "similar" RelatedProduct row; returns the number of rows
+    written. Only products whose rows changed are rewritten (replace_related).
+    """
+    snapshot = CatalogSnapshot()
+    product_ids = sorted(snapshot.category)
+    written = 0
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        rows = [
+            RelatedProduct(product_id=product_id, related_id=other, kind=RelatedProduct.SIMILAR, score=score)
+            for product_id in batch
+            for other, score in snapshot.top_related(product_id, top_n)
+        ]
+        written += replace_related(RelatedProduct.SIMILAR, batch, rows)
+    return written
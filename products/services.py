@@ -0,0 +1,415 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from home.cache_versions import bump_version, versioned_key
+
+from .models import Category, Discount, Product, ProductCard, ProductVariant, RelatedProduct, Reviews
+from .pagination import KeysetPaginator
+
+
+@dataclass
+class VariantPrice:
+    """Winning discount and final price for a single variant."""
+    discount: Discount = None
+    original_price: Decimal = Decimal('0')
+    final_price: Decimal = Decimal('0')
+
+    @property
+    def has_discount(self):
+        return self.discount is not None
+
+    @property
+    def discount_percent(self):
+        return self.discount.amount if self.discount else 0
+
+
+class DiscountResolver:
+    """
+    Resolve discounts for a batch of variants in one or two queries.
+
+    Precedence is the same as the old per-card cascade:
+    variant discount → product discount → category discount.
+    Only discounts inside their start/end window are considered (see Discount.is_valid).
+    """
+
+    def __init__(self, now=None):
+        self.now = now or timezone.now()
+
+    def valid_discounts(self):
+        return Discount.objects.filter(
+            active=True,
+            start_date__lte=self.now,
+        ).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=self.now)
+        ).order_by('id')
+
+    def _variant_keys(self, variants):
+        """Return {variant_id: (product_id, category_id)} without touching variant.product lazily."""
+        keys = {}
+        missing = []
+        for v in variants:
+            if ProductVariant.product.is_cached(v):
+                keys[v.id] = (v.product_id, v.product.category_id)
+            else:
+                missing.append(v.id)
+
+        if missing:
+            rows = ProductVariant.objects.filter(id__in=missing).values_list(
+                'id', 'product_id', 'product__category_id'
+            )
+            for variant_id, product_id, category_id in rows:
+                keys[variant_id] = (product_id, category_id)
+        return keys
+
+    def resolve(self, variants):
+        """Return {variant_id: VariantPrice} for every variant given."""
+        variants = [v for v in variants if v is not None]
+        if not variants:
+            return {}
+
+        keys = self._variant_keys(variants)
+        variant_ids = set(keys)
+        product_ids = {p for p, _ in keys.values()}
+        category_ids = {c for _, c in keys.values() if c is not None}
+
+        by_variant, by_product, by_category = {}, {}, {}
+        discounts = self.valid_discounts().filter(
+            Q(variant_id__in=variant_ids)
+            | Q(product_id__in=product_ids)
+            | Q(category_id__in=category_ids)
+        )
+        for d in discounts:
+            # first (lowest id) discount wins inside each level, like .first() did
+            if d.variant_id in variant_ids:
+                by_variant.setdefault(d.variant_id, d)
+            if d.product_id in product_ids:
+                by_product.setdefault(d.product_id, d)
+            if d.category_id in category_ids:
+                by_category.setdefault(d.category_id, d)
+
+        prices = {}
+        for v in variants:
+            product_id, category_id = keys.get(v.id, (None, None))
+            discount = (
+                by_variant.get(v.id)
+                or by_product.get(product_id)
+                or by_category.get(category_id)
+            )
+            final_price = v.price
+            if discount:
+                final_price = v.price - (v.price * discount.amount / 100)
+            prices[v.id] = VariantPrice(
+                discount=discount,
+                original_price=v.price,
+                final_price=final_price,
+            )
+        return prices
+
+    def resolve_one(self, variant):
+        if variant is None:
+            return VariantPrice()
+        return self.resolve([variant])[variant.id]
+
+    def category_discounts(self, category_ids):
+        """Return {category_id: Discount} for category-wide discounts."""
+        result = {}
+        for d in self.valid_discounts().filter(category_id__in=category_ids):
+            result.setdefault(d.category_id, d)
+        return result
+
+
+CARD_FIELDS = [
+    'variant', 'min_price', 'max_price', 'price', 'effective_price', 'has_discount',
+    'stock', 'main_image', 'hover_image', 'colors', 'sizes', 'updated_at',
+]
+
+
+def build_card(product, variants, price):
+    """Build an unsaved ProductCard from a product, its variants and the display variant's VariantPrice."""
+    first_variant = variants[0]
+
+    colors, seen_colors = [], set()
+    sizes = []
+    for v in variants:
+        if v.color_id and v.color_id not in seen_colors:
+            seen_colors.add(v.color_id)
+            colors.append({
+                'id': v.color.id,
+                'name': v.color.name,
+                'code': v.color.color or '#000',
+                'image': v.image.url if v.image else '',
+                'image_hover': v.image_hover.url if v.image_hover else '',
+            })
+        if v.size_id and v.size.size and v.size.size not in sizes:
+            sizes.append(v.size.size)
+
+    prices = [v.price for v in variants]
+    return ProductCard(
+        product=product,
+        variant=first_variant,
+        min_price=min(prices),
+        max_price=max(prices),
+        price=price.original_price,
+        effective_price=price.final_price,
+        has_discount=price.has_discount,
+        stock=sum(v.stock for v in variants),
+        main_image=first_variant.image.url if first_variant.image else '',
+        hover_image=first_variant.image_hover.url if first_variant.image_hover else '',
+        colors=colors,
+        sizes=sizes,
+        updated_at=timezone.now(),
+    )
+
+
+def refresh_product_cards(product_ids):
+    """
+    Rebuild the ProductCard rows for the given products.
+    Products without variants lose their card. Returns the number of cards written.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return 0
+
+    products = list(
+        Product.objects.filter(id__in=product_ids).prefetch_related(
+            models.Prefetch(
+                'variants',
+                queryset=ProductVariant.objects.select_related('color', 'size').order_by('id'),
+            )
+        )
+    )
+    with_variants = [p for p in products if p.variants.all()]
+    prices = DiscountResolver().resolve(p.variants.all()[0] for p in with_variants)
+
+    cards = [build_card(p, p.variants.all(), prices[p.variants.all()[0].id]) for p in with_variants]
+    empty_ids = product_ids - {c.product_id for c in cards}
+
+    with transaction.atomic():
+        if empty_ids:
+            ProductCard.objects.filter(product_id__in=empty_ids).delete()
+        if cards:
+            ProductCard.objects.bulk_create(
+                cards,
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=CARD_FIELDS,
+            )
+    return len(cards)
+
+
+def touch_products(product_ids, category_ids=()):
+    """
+    Mark products, and the categories listing them, as changed now.
+
+    Their updated_at is what the product and category pages' ETag/Last-Modified
+    come from (home.conditional). The signals call this for changes that don't
+    save the Product itself: variants, images, prices, reviews, stock.
+    """
+    product_ids = set(product_ids)
+    category_ids = {c for c in category_ids if c}
+    now = timezone.now()
+    if product_ids:
+        Product.objects.filter(id__in=product_ids).update(updated_at=now)
+    if product_ids or category_ids:
+        Category.objects.filter(Q(id__in=category_ids) | Q(products__in=product_ids)).update(updated_at=now)
+
+
+def replace_related(kind, product_ids, rows):
+    """
+    Make `rows` (RelatedProduct, best first per product) the `kind` rows of
+    `product_ids`; returns how many rows were written.
+
+    Products whose rows are the same as before are left alone, and only those
+    whose list of related products changed are touched: a nightly rebuild that
+    moves a score a little doesn't expire every product page.
+    """
+    new = defaultdict(list)
+    for row in rows:
+        new[row.product_id].append((row.related_id, round(row.score, 6)))
+    old = defaultdict(list)
+    for product_id, related_id, score in RelatedProduct.objects.filter(
+        product_id__in=product_ids, kind=kind,
+    ).order_by('product_id', '-score', '-related_id').values_list('product_id', 'related_id', 'score'):
+        old[product_id].append((related_id, round(score, 6)))
+
+    rewritten = {p for p in product_ids if old[p] != new[p]}
+    reordered = {p for p in rewritten if [r for r, _ in old[p]] != [r for r, _ in new[p]]}
+    rows = [row for row in rows if row.product_id in rewritten]
+    with transaction.atomic():
+        if rewritten:
+            RelatedProduct.objects.filter(product_id__in=rewritten, kind=kind).delete()
+            RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+        if reordered:
+            # the product pages show these; their categories don't
+            Product.objects.filter(id__in=reordered).update(updated_at=timezone.now())
+    return len(rows)
+
+
+# --- likes ---------------------------------------------------------------
+
+Like = Product.liked_by.through
+LIKED_COUNT_TIMEOUT = 60 * 60 * 24
+WISHLIST_PER_PAGE = 20
+
+
+def liked_count_tag(user_id):
+    return f'products:likes:{user_id}'
+
+
+def forget_liked_counts(user_ids):
+    """Make the cached liked_count of `user_ids` stale in every worker; the next read recounts."""
+    for user_id in user_ids:
+        bump_version(liked_count_tag(user_id))
+
+
+def liked_count(user_id):
+    """Number of products `user_id` likes, cached until they like or unlike something."""
+    key = versioned_key('products:liked-count', liked_count_tag(user_id))
+    count = cache.get(key)
+    if count is None:
+        count = Like.objects.filter(user_id=user_id).count()
+        cache.set(key, count, LIKED_COUNT_TIMEOUT)
+    return count
+
+
+def toggle_like(product_id, user):
+    """
+    Like or unlike a product for `user`, returning True if it is now liked.
+
+    Works on the through table directly, so it never loads the product's likers,
+    and moves `Product.like_count` with an F() update in the same transaction.
+    """
+    with transaction.atomic():
+        removed, _ = Like.objects.filter(product_id=product_id, user_id=user.id).delete()
+        if removed:
+            delta = -1
+        else:
+            try:
+                with transaction.atomic():
+                    Like.objects.create(product_id=product_id, user_id=user.id)
+                delta = 1
+            except IntegrityError:
+                # a concurrent request liked it first; the counter was bumped there
+                delta = 0
+        if delta:
+            Product.objects.filter(id=product_id).update(like_count=F('like_count') + delta)
+            forget_liked_counts([user.id])
+    return not removed
+
+
+def sync_like_counts(product_ids=None):
+    """Recount `like_count` from the through table (all products when `product_ids` is None)."""
+    likes = (
+        Like.objects.filter(product_id=OuterRef('pk'))
+        .values('product_id')
+        .annotate(n=Count('*'))
+        .values('n')
+    )
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(id__in=product_ids)
+    products.update(like_count=Coalesce(Subquery(likes), 0))
+
+
+def liked_product_ids(request):
+    """Ids of the products the current user likes; loaded at most once per request."""
+    if not hasattr(request, '_liked_product_ids'):
+        user = request.user
+        if user.is_authenticated:
+            ids = set(Like.objects.filter(user_id=user.id).values_list('product_id', flat=True))
+        else:
+            ids = set()
+        request._liked_product_ids = ids
+    return request._liked_product_ids
+
+
+@dataclass
+class WishlistItem:
+    """A liked product with the variant, price and stock shown for it."""
+    product: Product
+    variant: ProductVariant = None
+    price: Decimal = Decimal('0')
+    original_price: Decimal = Decimal('0')
+    has_discount: bool = False
+    image: str = ''
+    stock: int = 0
+    size: str = None
+    color: str = None
+
+
+def wishlist_item(product):
+    card = product.card
+    variant = card.variant
+    return WishlistItem(
+        product=product,
+        variant=variant,
+        price=card.effective_price,
+        original_price=card.price,
+        has_discount=card.has_discount,
+        image=card.main_image,
+        stock=variant.stock if variant else 0,
+        size=variant.size.size if variant and variant.size_id else None,
+        color=variant.color.name if variant and variant.color_id else None,
+    )
+
+
+def wishlist_page(user_id, cursor=None, per_page=WISHLIST_PER_PAGE):
+    """
+    One keyset page of a user's liked products, most recently liked first.
+
+    The display variant, its size/color and the discounted price all come from the
+    product's card, so a page is a single query however many products it holds.
+    Products without variants (and so without a card) are left out.
+    """
+    likes = (
+        Like.objects.filter(user_id=user_id, product__card__isnull=False)
+        .select_related('product__category', 'product__card__variant__size', 'product__card__variant__color')
+    )
+    page = KeysetPaginator(likes, ('-id',), per_page).page(cursor)
+    page.items = [wishlist_item(like.product) for like in page.items]
+    return page
+
+
+# --- reviews -------------------------------------------------------------
+
+REVIEWS_PER_PAGE = 10
+
+
+def refresh_review_stats(product_id):
+    """
+    Recompute a product's rating_avg/rating_count/rating_histogram from its reviews.
+
+    Runs from products.signals whenever a review is saved or deleted. The product
+    row is locked first (FOR NO KEY UPDATE, which doesn't wait on the FK lock the
+    review insert holds), so concurrent reviews of one product are counted one
+    after the other instead of overwriting each other's totals.
+    """
+    with transaction.atomic():
+        if not Product.objects.select_for_update(no_key=True).filter(id=product_id).exists():
+            return
+        histogram = [0] * 5
+        rows = Reviews.objects.filter(product_id=product_id, rating__range=(1, 5)).values_list('rating').annotate(n=Count('id'))
+        for rating, n in rows:
+            histogram[rating - 1] = n
+        count = sum(histogram)
+        avg = Decimal(sum(star * n for star, n in enumerate(histogram, 1))) / count if count else Decimal('0')
+        Product.objects.filter(id=product_id).update(
+            rating_histogram=histogram, rating_count=count, rating_avg=avg.quantize(Decimal('0.01')),
+        )
+
+
+def add_review(product_id, **fields):
+    """Save a review and (through the post_save signal) the product's new rating summary in one transaction."""
+    with transaction.atomic():
+        return Reviews.objects.create(product_id=product_id, **fields)
+
+
+def review_page(product_id, cursor=None, per_page=REVIEWS_PER_PAGE):
+    """Newest reviews first, one keyset page at a time (uses the (product, created_at) index)."""
+    reviews = Reviews.objects.filter(product_id=product_id)
+    return KeysetPaginator(reviews, ('-created_at', '-id'), per_page).page(cursor)
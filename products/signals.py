@@ -0,0 +1,145 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cart import adopt_cart
+from .facets import facet_index
+from .images import build_uploads, remember_uploads
+from .models import Category, Color, Discount, Product, ProductVariant, ProductVariantImage, Reviews, Size
+from .pricing import discount_targets, refresh_effective_prices, reprice
+from .services import forget_liked_counts, refresh_product_cards, refresh_review_stats, sync_like_counts, touch_products
+
+
+def catalog_changed(product_ids, category_ids=()):
+    """Products whose variants or category changed: refresh their cards and facet bits."""
+    product_ids = set(product_ids)
+    refresh_product_cards(product_ids)
+    facet_index().refresh_products(product_ids)
+    touch_products(product_ids, category_ids)
+
+
+@receiver(pre_save, sender=Product)
+def remember_category(sender, instance, raw=False, **kwargs):
+    # a product moved to another category changes the old category's page too
+    instance._old_category_id = None if raw or instance.pk is None else (
+        Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    catalog_changed([instance.id], [getattr(instance, '_old_category_id', None)])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    facet_index().refresh_products([instance.id])
+    touch_products([], [instance.category_id])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def variant_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if kwargs['signal'] is post_save:
+        refresh_effective_prices(ProductVariant.objects.filter(id=instance.id))
+    catalog_changed([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Color)
+@receiver([post_save, post_delete], sender=Size)
+def swatch_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    lookup = 'color' if sender is Color else 'size'
+    product_ids = set(ProductVariant.objects.filter(**{lookup: instance.id}).values_list('product_id', flat=True))
+    refresh_product_cards(product_ids)
+    touch_products(product_ids)
+
+
+@receiver([post_save, post_delete], sender=ProductVariantImage)
+def variant_image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    touch_products(Product.objects.filter(variants=instance.variant_id).values_list('id', flat=True))
+
+
+def discount_product_ids(discount):
+    """Every product whose card price may depend on this discount."""
+    product_ids = set()
+    if discount.variant_id:
+        product_ids.update(
+            ProductVariant.objects.filter(id=discount.variant_id).values_list('product_id', flat=True)
+        )
+    if discount.product_id:
+        product_ids.add(discount.product_id)
+    if discount.category_id:
+        product_ids.update(
+            Product.objects.filter(category_id=discount.category_id).values_list('id', flat=True)
+        )
+    return product_ids
+
+
+@receiver(pre_save, sender=Discount)
+def remember_discount_targets(sender, instance, raw=False, **kwargs):
+    # a discount moved to another product/category must reprice the old one too
+    instance._old_targets = [] if raw or instance.pk is None else [
+        discount_targets(old) for old in Discount.objects.filter(pk=instance.pk)
+    ]
+
+
+@receiver([post_save, post_delete], sender=Discount)
+def discount_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    repriced = reprice([discount_targets(instance), *getattr(instance, '_old_targets', [])])
+    # cards also show whether a discount applies; refresh those whose price didn't move
+    unchanged = discount_product_ids(instance) - repriced
+    refresh_product_cards(unchanged)
+    touch_products(unchanged)
+
+
+@receiver(m2m_changed, sender=Product.liked_by.through)
+def likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # liked_by.add()/remove()/clear() from the admin or the shell;
+    # services.toggle_like keeps the counters itself and doesn't come through here
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_like_ids = list(instance.liked_products.values_list('id', flat=True))
+        else:
+            instance._cleared_like_ids = list(instance.liked_by.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_like_ids', [])
+    if reverse:
+        # user.liked_products: pk_set holds products
+        sync_like_counts(pk_set)
+        forget_liked_counts([instance.pk])
+    else:
+        # product.liked_by: pk_set holds users
+        sync_like_counts([instance.pk])
+        forget_liked_counts(pk_set)
+
+
+@receiver([post_save, post_delete], sender=Reviews)
+def review_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_review_stats(instance.product_id)
+    touch_products([instance.product_id])
+
+
+@receiver(user_logged_in)
+def cart_follows_login(sender, request, user, **kwargs):
+    if request is not None:
+        adopt_cart(request, user)
+
+
+# responsive image derivatives for new uploads, see products/images.py
+for model in (Category, ProductVariant, ProductVariantImage, Reviews):
+    pre_save.connect(remember_uploads, sender=model)
+    post_save.connect(build_uploads, sender=model)
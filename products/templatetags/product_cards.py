@@ -0,0 +1,47 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+register = template.Library()
+
+CARD_TEMPLATE = 'products/partials/product_card.html'
+CARD_TIMEOUT = 60 * 60 * 24
+UNLIKED_HEART, LIKED_HEART = 'ri-heart-line', 'ri-heart-fill'
+
+
+def _stamp(when):
+    return int(when.timestamp() * 1_000_000) if when else 0
+
+
+def card_key(card, compact=False):
+    """
+    Cache key of a card's HTML. The card row, its product and its category are all
+    touched when anything the card shows changes (products.services.touch_products).
+    """
+    product = card.product
+    category = product.category if product.category_id else None
+    stamps = (_stamp(card.updated_at), _stamp(product.updated_at), _stamp(category and category.updated_at))
+    return f"product-card:{get_language()}:{int(compact)}:{card.product_id}:" + '-'.join(map(str, stamps))
+
+
+@register.simple_tag(takes_context=True)
+def product_card(context, card, compact=False):
+    """
+    A listing card for a ProductCard (loaded with select_related('product__category')).
+
+        {% product_card i %}                the shop/category/home card
+        {% product_card i compact=True %}   smaller, for related products
+
+    The HTML is rendered once per product version and language and cached; the
+    only per-visitor bit, the heart, is filled in afterwards from liked_product_ids.
+    """
+    key = card_key(card, compact)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(CARD_TEMPLATE, {'i': card, 'compact': compact, 'liked_product_ids': ()})
+        cache.set(key, html, CARD_TIMEOUT)
+    if card.product_id in context.get('liked_product_ids', ()):
+        html = html.replace(UNLIKED_HEART, LIKED_HEART, 1)
+    return mark_safe(html)
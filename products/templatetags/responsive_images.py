@@ -0,0 +1,46 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from products.images import FORMATS, WIDTHS, derivative_name
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 575px) 50vw, (max-width: 991px) 33vw, 25vw'
+
+
+def _url(image):
+    """Accept an ImageField file or a plain URL (ProductCard stores URLs)."""
+    if not image:
+        return ''
+    return image if isinstance(image, str) else image.url
+
+
+@register.filter
+def srcset(image, ext='webp'):
+    """`{{ variant.image|srcset:"jpg" }}` -> "….w320.jpg 320w, ….w640.jpg 640w, …"."""
+    url = _url(image)
+    if not url or ext not in FORMATS:
+        return ''
+    return ', '.join(f'{derivative_name(url, width, ext)} {width}w' for width in WIDTHS)
+
+
+@register.simple_tag
+def picture(image, alt='', sizes=DEFAULT_SIZES, loading='lazy', **attrs):
+    """
+    <picture> with a WebP source and a JPEG srcset, the original as the fallback src.
+
+        {% picture i.main_image alt=i.product.name class="main-img" %}
+
+    Extra keyword arguments become attributes of the <img>.
+    """
+    url = _url(image)
+    if not url:
+        return ''
+    img_attrs = format_html_join('', ' {}="{}"', ((name.replace('_', '-'), value) for name, value in attrs.items()))
+    return format_html(
+        '<picture data-widths="{}"><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="{}" decoding="async"{}></picture>',
+        ','.join(str(w) for w in WIDTHS),
+        srcset(url, 'webp'), sizes,
+        url, srcset(url, 'jpg'), sizes, alt, loading, img_attrs,
+    )
@@ -1,3 +1,1085 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import numpy as np
+from PIL import Image
+
+from home.cache_versions import forget_versions, get_version
+from home.page_cache import CATALOG_TAG
+from home.testing import QueryBudgetMixin
+
+from .cart import CART_SESSION_KEY, CartChanged, OutOfStock, add_item, checkout, confirm_checkout, release, release_expired
+from .facets import facet_index
+from .images import WIDTHS, derivative_name
+from .recommend import build_also_liked, like_matrix, similar_items
+from .related import CatalogSnapshot, build_related_products
+from .uploads import process_pending
+from .views import _also_liked_cards, _related_cards
+from .models import *
+from .pagination import InvalidCursor, KeysetPaginator
+from .pricing import apply_schedule, next_boundary, refresh_effective_prices
+from .services import DiscountResolver, add_review, liked_count, review_page, toggle_like, wishlist_page
+from .templatetags.product_cards import card_key
+
+
+def make_variant(product, size, color, price='100.00', **kwargs):
+    return ProductVariant.objects.create(
+        product=product,
+        size=size,
+        color=color,
+        price=Decimal(price),
+        image='products/main/test.jpg',
+        image_hover='products/main/test-hover.jpg',
+        **kwargs
+    )
+
+
+def add_catalog(products=6, variants=2):
+    """A few categories of products with variants, reviews and a discount, for query budgets."""
+    sizes = [Size.objects.create(select=s) for s in ('S', 'M', 'L')]
+    colors = [Color.objects.create(name=f'Color {n}', color='#00ff00') for n in range(variants)]
+    categories = [
+        Category.objects.create(
+            name=f'Category {n}', slug=f'category-{n}',
+            image='categories/1.jpg', second_image='categories/2.jpg', third_image='categories/3.jpg',
+        )
+        for n in range(3)
+    ]
+    for n in range(products):
+        product = Product.objects.create(name=f'Shirt {n}', category=categories[n % 3], description='Cotton')
+        for v in range(variants):
+            make_variant(product, sizes[v % 3], colors[v], stock=5)
+        Reviews.objects.create(product=product, name='Ana', rating=4, detail='Good')
+    Discount.objects.create(name='Sale', amount=10, category=categories[0])
+    return categories
+
+
+class CatalogTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Shirts', slug='shirts',
+            image='categories/1.jpg', second_image='categories/2.jpg', third_image='categories/3.jpg',
+        )
+        cls.product = Product.objects.create(name='Oxford shirt', category=cls.category)
+        cls.size = Size.objects.create(select='M')
+        cls.color = Color.objects.create(name='Blue', color='#0000ff')
+        cls.variant = make_variant(cls.product, cls.size, cls.color)
+
+    def setUp(self):
+        super().setUp()
+        # the facet index lives in process memory and outlives each test's rollback
+        facet_index().invalidate()
+
+
+class DiscountResolverTests(CatalogTestMixin, TestCase):
+
+    def test_no_discount(self):
+        price = DiscountResolver().resolve_one(self.variant)
+        self.assertFalse(price.has_discount)
+        self.assertEqual(price.final_price, Decimal('100.00'))
+
+    def test_variant_beats_product_beats_category(self):
+        Discount.objects.create(name='cat', amount=10, category=self.category)
+        price = DiscountResolver().resolve_one(self.variant)
+        self.assertEqual(price.final_price, Decimal('90.00'))
+
+        Discount.objects.create(name='prod', amount=20, product=self.product)
+        price = DiscountResolver().resolve_one(self.variant)
+        self.assertEqual(price.final_price, Decimal('80.00'))
+
+        Discount.objects.create(name='var', amount=50, variant=self.variant)
+        price = DiscountResolver().resolve_one(self.variant)
+        self.assertEqual(price.discount.name, 'var')
+        self.assertEqual(price.final_price, Decimal('50.00'))
+
+    def test_date_window_is_respected(self):
+        now = timezone.now()
+        Discount.objects.create(name='future', amount=10, product=self.product,
+                                start_date=now + timedelta(days=1))
+        Discount.objects.create(name='expired', amount=10, product=self.product,
+                                start_date=now - timedelta(days=2), end_date=now - timedelta(days=1))
+        Discount.objects.create(name='inactive', amount=10, product=self.product, active=False)
+        self.assertFalse(DiscountResolver().resolve_one(self.variant).has_discount)
+
+    def test_batch_is_one_query(self):
+        other = Product.objects.create(name='Linen shirt', category=self.category)
+        make_variant(other, self.size, self.color, price='40.00')
+        Discount.objects.create(name='cat', amount=25, category=self.category)
+        variants = list(ProductVariant.objects.select_related('product'))
+
+        with self.assertNumQueries(1):
+            prices = DiscountResolver().resolve(variants)
+        self.assertEqual(sorted(p.final_price for p in prices.values()), [Decimal('30.00'), Decimal('75.00')])
+
+
+class ProductCardTests(CatalogTestMixin, TestCase):
+
+    def test_card_created_with_variant(self):
+        card = ProductCard.objects.get(product=self.product)
+        self.assertEqual(card.price, Decimal('100.00'))
+        self.assertEqual(card.sizes, ['Medium'])
+        self.assertEqual([c['name'] for c in card.colors], ['Blue'])
+        self.assertEqual(card.main_image, '/media/products/main/test.jpg')
+
+    def test_card_follows_variants_and_discounts(self):
+        red = Color.objects.create(name='Red', color='#ff0000')
+        make_variant(self.product, self.size, red, price='60.00', stock=3)
+        Discount.objects.create(name='cat', amount=10, category=self.category)
+
+        card = ProductCard.objects.get(product=self.product)
+        self.assertEqual((card.min_price, card.max_price), (Decimal('60.00'), Decimal('100.00')))
+        self.assertEqual(card.stock, 3)
+        self.assertTrue(card.has_discount)
+        self.assertEqual(card.effective_price, Decimal('90.00'))
+
+        red.name = 'Crimson'
+        red.save()
+        card.refresh_from_db()
+        self.assertIn('Crimson', [c['name'] for c in card.colors])
+
+    def test_card_removed_with_last_variant(self):
+        self.variant.delete()
+        self.assertFalse(ProductCard.objects.filter(product=self.product).exists())
+
+    def test_rebuild_command(self):
+        ProductCard.objects.all().delete()
+        call_command('rebuild_product_cards', stdout=StringIO())
+        self.assertTrue(ProductCard.objects.filter(product=self.product).exists())
+
+
+class KeysetPaginationTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for n in range(4):
+            product = Product.objects.create(name=f'Extra {n}', category=self.category)
+            make_variant(product, self.size, self.color, price=f'{10 + n}.00')
+
+    def test_pages_cover_catalog_once(self):
+        paginator = KeysetPaginator(ProductCard.objects.all(), ordering=('-product_id',), per_page=2)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(card.product_id for card in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, sorted(Product.objects.values_list('id', flat=True), reverse=True))
+
+    def test_composite_ordering(self):
+        paginator = KeysetPaginator(ProductCard.objects.all(), ordering=('price', 'product_id'), per_page=3)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        prices = [c.price for c in first] + [c.price for c in second]
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(len(prices), 5)
+
+    def test_bad_cursor(self):
+        paginator = KeysetPaginator(ProductCard.objects.all(), ordering=('-product_id',))
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+
+    def test_cursor_values_must_fit_their_fields(self):
+        paginator = KeysetPaginator(Reviews.objects.all(), ordering=('-created_at', '-id'))
+        for values in (['notadate', 1], [timezone.now().isoformat(), 'x'], [None, 1], [timezone.now().isoformat(), 10 ** 30]):
+            with self.assertRaises(InvalidCursor, msg=values):
+                paginator.page(KeysetPaginator.encode_cursor(values))
+        self.assertEqual(len(paginator.page(KeysetPaginator.encode_cursor([timezone.now(), 1]))), 0)
+
+    def test_shop_cards_endpoint(self):
+        response = self.client.get(reverse('products:shop'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['next_url'])
+
+        ids = sorted(Product.objects.values_list('id', flat=True), reverse=True)
+        cursor = KeysetPaginator.encode_cursor([ids[2]])
+        response = self.client.get(reverse('products:shop_cards'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c.product_id for c in response.context['products']], ids[3:])
+
+        response = self.client.get(reverse('products:shop_cards'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_card_cursors_are_refused(self):
+        facet_index().invalidate()
+        top = max(Product.objects.values_list('id', flat=True))
+        for below in (-5, 0, top + 2, 10 ** 30, True, 'x'):
+            cursor = KeysetPaginator.encode_cursor([below])
+            response = self.client.get(reverse('products:shop_cards'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, below)
+        cursor = KeysetPaginator.encode_cursor([top + 1])
+        self.assertEqual(self.client.get(reverse('products:shop_cards'), {'cursor': cursor}).status_code, 200)
+
+
+class FacetIndexTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.red = Color.objects.create(name='Red', color='#ff0000')
+        self.large = Size.objects.create(select='L')
+        self.trousers = Category.objects.create(name='Trousers', slug='trousers')
+        self.chino = Product.objects.create(name='Chino', category=self.trousers)
+        make_variant(self.chino, self.large, self.red, price='30.00')
+        make_variant(self.chino, self.size, self.red, price='35.00')
+
+    def test_filters_and_counts(self):
+        index = facet_index()
+        result = index.search()
+        self.assertEqual(set(result.page(result.total)), {self.product.id, self.chino.id})
+        self.assertEqual(result.counts['color'], {self.color.id: 1, self.red.id: 1})
+        self.assertEqual(result.counts['size'], {self.size.id: 2, self.large.id: 1})
+
+        result = index.search(sizes=[self.size.id], colors=[self.red.id])
+        self.assertEqual(result.page(result.total), [self.chino.id])
+        # counts for a facet ignore that facet's own selection
+        self.assertEqual(result.counts['color'], {self.color.id: 1, self.red.id: 1})
+        self.assertEqual(result.counts['category'], {self.category.id: 0, self.trousers.id: 1})
+
+        result = index.search(min_price=Decimal('20'), max_price=Decimal('32'))
+        self.assertEqual(result.page(result.total), [self.chino.id])
+
+    def test_incremental_update(self):
+        index = facet_index()
+        index.search()
+        self.assertIsNotNone(index.version)
+
+        make_variant(self.product, self.large, self.red, price='250.00')
+        result = index.search(sizes=[self.large.id])
+        self.assertEqual(set(result.page(result.total)), {self.product.id, self.chino.id})
+        self.assertEqual(result.counts['price'][4], 1)
+
+        self.chino.delete()
+        result = index.search()
+        self.assertEqual(result.page(result.total), [self.product.id])
+
+    def test_shop_view_uses_index(self):
+        response = self.client.get(reverse('products:shop'), {'color': self.red.id})
+        self.assertEqual([c.product for c in response.context['products']], [self.chino])
+        counts = {c.id: c.facet_count for c in response.context['colors']}
+        self.assertEqual(counts[self.color.id], 1)
+
+
+class LikeTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('shopper', password='pw')
+        self.other = User.objects.create_user('other', password='pw')
+
+    def test_toggle_keeps_counter(self):
+        # delete + insert + F() update + the liked-count version bump, the rest are savepoints
+        with self.assertNumQueries(8):
+            self.assertTrue(toggle_like(self.product.id, self.user))
+        toggle_like(self.product.id, self.other)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_likes(), 2)
+
+        self.assertFalse(toggle_like(self.product.id, self.user))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.like_count, 1)
+        self.assertEqual(list(self.product.liked_by.all()), [self.other])
+
+    def test_m2m_changes_resync_counter(self):
+        self.product.liked_by.add(self.user, self.other)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.like_count, 2)
+        self.user.liked_products.clear()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.like_count, 1)
+
+    def test_htmx_toggle_returns_fragment(self):
+        url = reverse('products:toggle_like', args=[self.product.id])
+        response = self.client.post(url, HTTP_HX_REQUEST='true')
+        self.assertIn('HX-Redirect', response.headers)
+
+        self.client.force_login(self.user)
+        response = self.client.post(url, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'products/partials/like_icon.html')
+        self.assertContains(response, 'ri-heart-fill')
+        response = self.client.post(url)
+        self.assertRedirects(response, self.product.get_absolute_url(), fetch_redirect_response=False)
+        self.assertFalse(self.product.liked_by.exists())
+
+
+class WishlistTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        forget_versions()
+        self.user = User.objects.create_user('shopper', password='pw')
+
+    def like_products(self, count):
+        products = []
+        for n in range(count):
+            product = Product.objects.create(name=f'Product {n}', category=self.category)
+            make_variant(product, self.size, self.color, price='40.00', stock=n)
+            toggle_like(product.id, self.user)
+            products.append(product)
+        return products
+
+    def test_page_is_one_query(self):
+        products = self.like_products(5)
+        Product.objects.create(name='No variants').liked_by.add(self.user)
+
+        with self.assertNumQueries(1):
+            page = wishlist_page(self.user.id, per_page=3)
+            self.assertEqual([item.product for item in page], products[:1:-1])
+            self.assertEqual([(item.size, item.color, item.price) for item in page][0], ('Medium', 'Blue', Decimal('40.00')))
+            self.assertEqual(page.items[0].product.category, self.category)
+
+        page = wishlist_page(self.user.id, cursor=page.next_cursor, per_page=3)
+        self.assertEqual([item.product for item in page], products[1::-1])
+        self.assertFalse(page.has_next)
+
+    def test_liked_count_is_cached(self):
+        self.like_products(2)
+        self.assertEqual(liked_count(self.user.id), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(liked_count(self.user.id), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.product.id, self.user)
+        self.assertEqual(liked_count(self.user.id), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.liked_products.clear()
+        self.assertEqual(liked_count(self.user.id), 0)
+
+    def test_wishlist_view(self):
+        self.like_products(2)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('products:user_wishlist', args=[self.user.id]))
+        self.assertEqual(len(response.context['wishlist_data']), 2)
+        self.assertIsNone(response.context['next_url'])
+        response = self.client.get(reverse('products:user_wishlist', args=[self.user.id]), {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse('products:user_wishlist', args=[self.user.id]), {'cursor': KeysetPaginator.encode_cursor(['x'])},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_remove_from_wishlist_needs_a_post(self):
+        self.like_products(1)
+        product = self.user.liked_products.get()
+        self.client.force_login(self.user)
+        url = reverse('products:toggle_like', args=[product.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertTrue(self.user.liked_products.exists())
+
+        wishlist = reverse('products:user_wishlist', args=[self.user.id])
+        response = self.client.post(url, {'next': wishlist})
+        self.assertRedirects(response, wishlist, fetch_redirect_response=False)
+        self.assertFalse(self.user.liked_products.exists())
+        response = self.client.post(url, {'next': 'https://example.com/'})
+        self.assertRedirects(response, product.get_absolute_url(), fetch_redirect_response=False)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageDerivativeTests(CatalogTestMixin, TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, name, size=(1500, 1000), mode='RGB'):
+        buf = BytesIO()
+        Image.new(mode, size, 'red').save(buf, 'PNG')
+        return SimpleUploadedFile(name, buf.getvalue(), content_type='image/png')
+
+    def test_upload_builds_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductVariantImage.objects.create(variant=self.variant, image=self.upload('photo.png', mode='RGBA'))
+
+        for width in WIDTHS:
+            for ext in ('webp', 'jpg'):
+                with default_storage.open(derivative_name(image.image.name, width, ext)) as f:
+                    rendition = Image.open(f)
+                    self.assertEqual(rendition.width, width)
+                    self.assertEqual(rendition.format, 'WEBP' if ext == 'webp' else 'JPEG')
+
+        # saving again without a new file doesn't rebuild anything
+        with self.captureOnCommitCallbacks() as callbacks:
+            image.save()
+        self.assertEqual(callbacks, [])
+
+    def test_backfill_command(self):
+        small = default_storage.save('products/main/small.png', self.upload('small.png', size=(200, 100)))
+        self.variant.image = small
+        self.variant.save()
+
+        out = StringIO()
+        call_command('build_image_derivatives', stdout=out, stderr=StringIO())
+        self.assertIn('Built derivatives for 1 images', out.getvalue())
+        with default_storage.open(derivative_name(small, WIDTHS[-1], 'webp')) as f:
+            self.assertEqual(Image.open(f).width, 200)  # never upscaled
+
+        out = StringIO()
+        call_command('build_image_derivatives', stdout=out, stderr=StringIO())
+        self.assertIn('0 images (1 up to date', out.getvalue())
+
+    def test_picture_tag(self):
+        html = Template('{% load responsive_images %}{% picture url alt="Shirt" class="main-img" %}').render(
+            Context({'url': '/media/products/main/shirt.jpg'})
+        )
+        self.assertIn('<source type="image/webp" srcset="/media/products/main/shirt.w320.webp 320w', html)
+        self.assertIn('src="/media/products/main/shirt.jpg"', html)
+        self.assertIn('/media/products/main/shirt.w640.jpg 640w', html)
+        self.assertIn('class="main-img"', html)
+        self.assertEqual(Template('{% load responsive_images %}{% picture "" %}').render(Context()), '')
+
+
+class ReviewTests(CatalogTestMixin, TestCase):
+
+    def review(self, rating, **kwargs):
+        return add_review(self.product.id, name='Ana', detail='Nice', rating=rating, **kwargs)
+
+    def test_stats_follow_reviews(self):
+        for rating in (5, 4, 4, 1):
+            self.review(rating)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 4)
+        self.assertEqual(self.product.rating_avg, Decimal('3.50'))
+        self.assertEqual(self.product.rating_histogram, [1, 0, 0, 2, 1])
+
+        Reviews.objects.filter(rating=4).first().delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_avg), (3, Decimal('3.33')))
+
+    def test_pages_newest_first(self):
+        reviews = [self.review(5) for _ in range(3)]
+        page = review_page(self.product.id, per_page=2)
+        self.assertEqual(page.items, reviews[:0:-1])
+        self.assertEqual(review_page(self.product.id, page.next_cursor, per_page=2).items, reviews[:1])
+
+    def test_cursor_keeps_microseconds(self):
+        # three reviews within the same millisecond
+        start = timezone.now().replace(microsecond=1000)
+        reviews = [self.review(5) for _ in range(3)]
+        for n, review in enumerate(reviews):
+            Reviews.objects.filter(id=review.id).update(created_at=start + timedelta(microseconds=n))
+        cursor, seen = None, []
+        for _ in reviews:
+            page = review_page(self.product.id, cursor, per_page=1)
+            seen += page.items
+            cursor = page.next_cursor
+        self.assertEqual(seen, reviews[::-1])
+
+    def test_submit_and_htmx_page(self):
+        response = self.client.post(
+            reverse('products:submit_review', args=[self.product.id]),
+            {'your-name': 'Ana', 'your-commemt': 'Great', 'rating': '9'},
+        )
+        self.assertRedirects(response, self.product.get_absolute_url(), fetch_redirect_response=False)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_histogram, [0, 0, 0, 0, 1])
+
+        response = self.client.get(reverse('products:product_reviews', args=[self.product.id]), HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'products/partials/reviews.html')
+        self.assertContains(response, 'Great')
+        response = self.client.get(reverse('products:product_reviews', args=[self.product.id]), {'cursor': 'x'})
+        self.assertEqual(response.status_code, 400)
+        cursor = KeysetPaginator.encode_cursor(['notadate', 1])
+        response = self.client.get(reverse('products:product_reviews', args=[self.product.id]), {'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_PROCESS_IN_THREAD=False)
+class UploadProcessingTests(CatalogTestMixin, TestCase):
+
+    def photo(self, size=(3000, 2000), fmt='JPEG', content_type='image/jpeg'):
+        buf = BytesIO()
+        image = Image.new('RGB', size, 'blue')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotate 90
+        exif[0x010F] = 'PhoneMaker'
+        image.save(buf, fmt, exif=exif)
+        return SimpleUploadedFile('IMG 0001.jpg', buf.getvalue(), content_type=content_type)
+
+    def post_review(self, image):
+        return self.client.post(
+            reverse('products:submit_review', args=[self.product.id]),
+            {'your-name': 'Ana', 'your-commemt': 'Great', 'rating': '5', 'your-image': image},
+        )
+
+    def test_review_photo_processed_off_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_review(self.photo())
+        review = Reviews.objects.get()
+        self.assertFalse(review.image)
+        job = PendingUpload.objects.get()
+        self.assertEqual((job.model_label, job.field, job.status), ('products.Reviews', 'image', 'pending'))
+
+        Product.objects.filter(id=self.product.id).update(updated_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(process_pending(), {'done': 1})
+        review.refresh_from_db()
+        # the product page shows the photo, so its ETag/Last-Modified move
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, timezone.now() - timedelta(minutes=1))
+        with default_storage.open(review.image.name) as f:
+            image = Image.open(f)
+            self.assertEqual(image.size, (1067, 1600))  # rotated, then downscaled
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertTrue(default_storage.exists(derivative_name(review.image.name, WIDTHS[0], 'webp')))
+        self.assertFalse(default_storage.exists(job.staged_name))
+
+    def test_bad_uploads(self):
+        self.post_review(SimpleUploadedFile('notes.txt', b'hello', content_type='text/plain'))
+        self.assertFalse(Reviews.objects.exists())
+
+        self.post_review(SimpleUploadedFile('fake.jpg', b'not an image', content_type='image/jpeg'))
+        self.assertEqual(process_pending(), {'failed': 1})
+        self.assertFalse(Reviews.objects.get().image)
+        self.assertTrue(PendingUpload.objects.get().error)
+
+
+class RelatedProductTests(CatalogTestMixin, TestCase):
+
+    def test_scores_and_detail_page(self):
+        red = Color.objects.create(name='Red', color='#ff0000')
+        twin = Product.objects.create(name='Oxford twin', category=self.category)
+        make_variant(twin, self.size, self.color)
+        cousin = Product.objects.create(name='Linen shirt', category=self.category)
+        make_variant(cousin, self.size, red)
+        stranger = Product.objects.create(name='Sandals')
+        make_variant(stranger, self.size, red)
+        # two shoppers liked the shirt together with the sandals
+        for username in ('a', 'b'):
+            user = User.objects.create_user(username)
+            self.product.liked_by.add(user)
+            stranger.liked_by.add(user)
+        co_likes = CatalogSnapshot().co_likes[self.product.id]
+        self.assertEqual(list(co_likes), [stranger.id])
+        self.assertAlmostEqual(co_likes[stranger.id], 1.0, places=5)
+
+        call_command('build_related_products', stdout=StringIO())
+        related = list(self.product.related_products.order_by('-score').values_list('related', flat=True))
+        self.assertEqual(related, [twin.id, stranger.id, cousin.id])
+
+        # nothing changed: nothing is rewritten and no product page expires
+        stamps = dict(Product.objects.values_list('id', 'updated_at'))
+        self.assertEqual(build_related_products(), 0)
+        self.assertEqual(dict(Product.objects.values_list('id', 'updated_at')), stamps)
+        self.assertEqual(build_related_products(top_n=1), 3)  # the sandals' list already had one row
+        touched = Product.objects.exclude(updated_at__in=stamps.values()).values_list('id', flat=True)
+        self.assertIn(self.product.id, touched)
+
+        with self.assertNumQueries(1):
+            cards = _related_cards(self.product)
+            self.assertEqual([c.product.category for c in cards], [self.category])
+
+
+class AlsoLikedTests(CatalogTestMixin, TestCase):
+
+    def test_cosine_top_k_in_chunks(self):
+        # users 1-3 liked products 10 and 20, user 3 also liked 30, user 4 liked 40 only
+        users = np.array([1, 1, 2, 2, 3, 3, 3, 4])
+        products = np.array([10, 20, 10, 20, 30, 20, 10, 40])
+        product_index, matrix = like_matrix(users, products)
+        self.assertEqual(product_index.tolist(), [10, 20, 30, 40])
+
+        pairs = {
+            (product_index[a], product_index[b]): round(float(score), 3)
+            for *_, rows, cols, scores in similar_items(matrix, top_k=1, chunk_size=3, min_common=1)
+            for a, b, score in zip(rows, cols, scores)
+        }
+        self.assertEqual(pairs, {(10, 20): 1.0, (20, 10): 1.0, (30, 20): 0.577})
+
+        # only each user's first (most recent) like is kept
+        _, matrix = like_matrix(users, products, max_per_user=1)
+        self.assertEqual(matrix.nnz, 4)
+
+    def test_build_and_pages(self):
+        boots = Product.objects.create(name='Boots', category=self.category)
+        make_variant(boots, self.size, self.color)
+        scarf = Product.objects.create(name='Scarf', category=self.category)
+        make_variant(scarf, self.size, self.color)
+        shoppers = [User.objects.create_user(name) for name in 'abc']
+        for user in shoppers[:2]:
+            self.product.liked_by.add(user)
+            boots.liked_by.add(user)
+        scarf.liked_by.add(shoppers[2])
+        self.product.liked_by.add(shoppers[2])
+
+        self.assertEqual(build_also_liked(), 2)  # shirt <-> boots, the scarf only shares one shopper
+        self.assertEqual(build_also_liked(), 0)
+        with self.assertNumQueries(1):
+            cards = _related_cards(self.product, kind=RelatedProduct.ALSO_LIKED)
+            self.assertEqual([c.product for c in cards], [boots])
+        response = self.client.get(reverse('products:product_details', args=[boots.id]))
+        self.assertEqual([c.product for c in response.context['also_liked']], [self.product])
+
+        newcomer = User.objects.create_user('d')
+        self.product.liked_by.add(newcomer)
+        self.client.force_login(newcomer)
+        response = self.client.get(reverse('products:user_wishlist', args=[newcomer.id]))
+        self.assertEqual([c.product for c in response.context['also_liked']], [boots])
+        self.assertEqual(_also_liked_cards(shoppers[0].id, [self.product.id, boots.id]), [])
+
+        stamp = Product.objects.get(id=boots.id).updated_at
+        self.product.liked_by.clear()
+        build_also_liked()
+        self.assertFalse(RelatedProduct.objects.filter(kind=RelatedProduct.ALSO_LIKED).exists())
+        self.assertGreater(Product.objects.get(id=boots.id).updated_at, stamp)
+
+
+class CartTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        ProductVariant.objects.filter(id=self.variant.id).update(stock=5)
+        call_command('rebuild_product_cards', stdout=StringIO())
+        self.cart = Cart.objects.create()
+        add_item(self.cart, self.variant.id, 2)
+
+    def stock(self):
+        return ProductVariant.objects.get(id=self.variant.id).stock
+
+    def test_checkout_reserves_and_confirms(self):
+        checkout(self.cart)
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(ProductCard.objects.get(product=self.product).stock, 3)
+        # checking out again replaces the hold instead of taking more
+        checkout(self.cart)
+        self.assertEqual(self.stock(), 3)
+
+        Discount.objects.create(name='Sale', amount=Decimal('33.33'), variant=self.variant)
+        order = confirm_checkout(self.cart)
+        self.assertEqual(order.total, Decimal('133.34'))
+        self.assertEqual(
+            list(order.lines.values_list('variant', 'product_name', 'quantity', 'unit_price', 'original_price')),
+            [(self.variant.id, self.product.name, 2, Decimal('66.67'), Decimal('100.00'))],
+        )
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(self.stock(), 3)
+
+    def test_card_stock_is_counted_from_the_variants(self):
+        make_variant(self.product, Size.objects.create(select='L'), self.color, stock=4)
+        # the card is off (an import that skipped the signals); the next stock change sets it right
+        ProductCard.objects.filter(product=self.product).update(stock=1)
+        checkout(self.cart)
+        self.assertEqual(ProductCard.objects.get(product=self.product).stock, 3 + 4)
+        release(list(StockReservation.objects.all()))
+        self.assertEqual(ProductCard.objects.get(product=self.product).stock, 5 + 4)
+
+    def test_short_checkout_reserves_nothing(self):
+        other = make_variant(self.product, Size.objects.create(select='L'), self.color, stock=1)
+        add_item(self.cart, other.id, 3)
+        with self.assertRaises(OutOfStock):
+            checkout(self.cart)
+        self.assertEqual(self.stock(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_holds_go_back_on_sale(self):
+        checkout(self.cart, now=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(confirm_checkout(self.cart))
+        self.assertFalse(Order.objects.exists())
+
+        # a buyer wanting the last units frees the expired hold on the way
+        buyer = Cart.objects.create()
+        add_item(buyer, self.variant.id, 5)
+        checkout(buyer)
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(list(StockReservation.objects.values_list('cart', flat=True)), [buyer.id])
+
+    def test_expired_holds_are_released_even_when_still_short(self):
+        checkout(self.cart, now=timezone.now() - timedelta(hours=1))
+        buyer = Cart.objects.create()
+        add_item(buyer, self.variant.id, 6)
+        with self.assertRaises(OutOfStock):
+            checkout(buyer)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.stock(), 5)
+
+    def test_cart_changed_after_checkout_is_reserved_again(self):
+        checkout(self.cart)
+        other = make_variant(self.product, Size.objects.create(select='L'), self.color, stock=4)
+        add_item(self.cart, other.id, 1)
+        add_item(self.cart, self.variant.id, 1)
+
+        with self.assertRaises(CartChanged):
+            confirm_checkout(self.cart)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(ProductVariant.objects.get(id=other.id).stock, 3)
+        self.assertFalse(StockReservation.objects.filter(status=StockReservation.CONFIRMED).exists())
+        self.assertFalse(Order.objects.exists())
+
+        # the new hold matches the cart, so the next confirmation goes through
+        self.assertEqual(confirm_checkout(self.cart).lines.count(), 2)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_anonymous_cart_follows_login(self):
+        self.client.post(reverse('products:cart_add', args=[self.variant.id]), {'quantity': '3'})
+        user = User.objects.create_user('shopper', password='pw')
+        Cart.objects.create(user=user).items.create(variant=self.variant, quantity=1)
+        self.client.force_login(user)
+        self.assertEqual(Cart.objects.count(), 2)  # merged at login: self.cart plus the shopper's
+        self.assertNotIn(CART_SESSION_KEY, self.client.session)
+
+        # pages only read the cart
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products:cart'))
+        self.assertFalse([q for q in queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))])
+        self.assertEqual([line.quantity for line in response.context['cart_lines']], [4])
+
+        response = self.client.post(reverse('products:checkout'))
+        self.assertEqual(response.context['held_until'], StockReservation.objects.get().expires_at)
+        self.client.post(reverse('products:checkout_confirm'))
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(Order.objects.get().user, user)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """Many buyers checking out the last few units at once; needs a database with real concurrent connections."""
+    BUYERS = 20
+    UNITS = 3
+
+    def test_parallel_buyers_never_oversell(self):
+        product = Product.objects.create(name='Limited sneaker')
+        variant = make_variant(product, Size.objects.create(select='M'), Color.objects.create(name='Red', color='#f00'),
+                               stock=self.UNITS)
+        carts = []
+        for _ in range(self.BUYERS):
+            cart = Cart.objects.create()
+            add_item(cart, variant.id, 1)
+            carts.append(cart)
+
+        start = threading.Barrier(self.BUYERS)
+        results = []
+
+        def buy(cart):
+            try:
+                start.wait()
+                try:
+                    checkout(cart)
+                    results.append(True)
+                except OutOfStock:
+                    results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=[cart]) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.BUYERS)
+        self.assertEqual(results.count(True), self.UNITS)
+        self.assertEqual(ProductVariant.objects.get(id=variant.id).stock, 0)
+        self.assertEqual(StockReservation.objects.aggregate(n=models.Sum('quantity'))['n'], self.UNITS)
+
+
+class EffectivePriceTests(CatalogTestMixin, TestCase):
+
+    def price(self, variant=None):
+        return ProductVariant.objects.get(id=(variant or self.variant).id).effective_price
+
+    def shop_ids(self, **filters):
+        result = facet_index().search(**filters)
+        return result.page(result.total)
+
+    def test_follows_discount_changes(self):
+        self.assertEqual(self.price(), Decimal('100.00'))
+        discount = Discount.objects.create(name='Sale', amount=Decimal('33.33'), product=self.product)
+        self.assertEqual(self.price(), Decimal('66.67'))
+        self.assertEqual(ProductCard.objects.get(product=self.product).effective_price, Decimal('66.67'))
+        self.assertEqual(self.shop_ids(max_price=Decimal('70')), [self.product.id])
+        self.assertEqual(facet_index().price_range(), (Decimal('66.67'), Decimal('66.67')))
+
+        # moving the discount elsewhere reprices the product it left
+        other = Product.objects.create(name='Polo', category=Category.objects.create(name='Polos', slug='polos'))
+        other_variant = make_variant(other, self.size, self.color, price='50.00')
+        discount.product, discount.category = None, other.category
+        discount.save()
+        self.assertEqual((self.price(), self.price(other_variant)), (Decimal('100.00'), Decimal('33.34')))
+
+        discount.delete()
+        self.assertEqual(self.price(other_variant), Decimal('50.00'))
+        self.assertEqual(self.shop_ids(min_price=Decimal('60')), [self.product.id])
+
+    def test_schedule_boundaries(self):
+        now = timezone.now()
+        start, end = now + timedelta(hours=1), now + timedelta(hours=2)
+        Discount.objects.create(name='Flash', amount=50, variant=self.variant, start_date=start, end_date=end)
+        self.assertEqual(self.price(), Decimal('100.00'))
+        self.assertEqual(next_boundary(now), start)
+
+        self.assertEqual(apply_schedule(now, now=start), {self.product.id})
+        self.assertEqual(self.price(), Decimal('50.00'))
+        self.assertEqual(next_boundary(start), end)
+        self.assertEqual(apply_schedule(start, now=end), set())  # still on at end_date
+        self.assertEqual(apply_schedule(end, now=end + timedelta(seconds=1)), {self.product.id})
+        self.assertEqual(self.price(), Decimal('100.00'))
+        self.assertIsNone(next_boundary(end + timedelta(seconds=1)))
+
+    def test_schedule_makes_cached_pages_stale(self):
+        start = timezone.now() + timedelta(hours=1)
+        Discount.objects.create(name='Flash', amount=50, category=self.category, start_date=start)
+        Product.objects.filter(id=self.product.id).update(updated_at=start - timedelta(days=1))
+        Category.objects.filter(id=self.category.id).update(updated_at=start - timedelta(days=1))
+        catalog = get_version(CATALOG_TAG)
+
+        apply_schedule(start - timedelta(minutes=5), now=start)
+        self.assertGreater(get_version(CATALOG_TAG), catalog)
+        self.product.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertGreater(self.product.updated_at, start - timedelta(days=1))
+        self.assertGreater(self.category.updated_at, start - timedelta(days=1))
+
+    def test_bulk_refresh_is_batched(self):
+        for n in range(4):
+            make_variant(self.product, Size.objects.create(select=f'S{n}'), self.color)
+        Discount.objects.create(name='All', amount=10, category=self.category)
+        ProductVariant.objects.update(effective_price=None)
+        # one streamed read of the variants, then per batch of 2 the discounts and the bulk update
+        with self.assertNumQueries(1 + 3 * 2):
+            self.assertEqual(refresh_effective_prices(batch_size=2), {self.product.id})
+        self.assertEqual(set(ProductVariant.objects.values_list('effective_price', flat=True)), {Decimal('90.00')})
+
+
+class VariantSwitchingTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.red = Color.objects.create(name='Red', color='#ff0000')
+        self.red_variant = make_variant(self.product, self.size, self.red, price='80.00', stock=0)
+
+    def test_matrix_covers_every_variant(self):
+        response = self.client.get(reverse('products:product_details', args=[self.product.id]))
+        matrix = response.context['variant_matrix']
+        self.assertEqual(set(matrix), {f'{self.color.id}:{self.size.id}', f'{self.red.id}:{self.size.id}'})
+        red = matrix[f'{self.red.id}:{self.size.id}']
+        self.assertEqual((red['id'], red['price'], red['stock']), (self.red_variant.id, '80.00', 0))
+        self.assertEqual(len(red['images']), 2)
+        self.assertContains(response, 'id="variant-matrix"')
+
+    def test_query_string_selects_variant(self):
+        url = reverse('products:product_details', args=[self.product.id])
+        response = self.client.get(url, {'color': self.red.id, 'size': self.size.id})
+        self.assertEqual(response.context['variant'], self.red_variant)
+        # an unknown combination falls back to the first variant of that color
+        response = self.client.get(url, {'color': self.red.id, 'size': 999})
+        self.assertEqual(response.context['variant'], self.red_variant)
+
+    def test_fragment_renders_only_the_variant_parts(self):
+        url = reverse('products:product_variant', args=[self.product.id])
+        self.client.get(url)  # warm the cached header/footer context
+        with self.assertNumQueries(5):
+            # product, variants, their images, then the variant's category and discounts
+            response = self.client.get(url, {'color': self.red.id, 'size': self.size.id})
+        self.assertEqual(response.context['variant'], self.red_variant)
+        self.assertContains(response, 'id="variant-gallery"')
+        self.assertContains(response, 'id="variant-price" hx-swap-oob="true"')
+        self.assertContains(response, 'Out of Stock')
+        self.assertNotContains(response, 'mn-single-title')
+
+
+class ConditionalGetTests(CatalogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('products:product_details', args=[self.product.id])
+        self.client.get(self.url)  # warm the cached header/footer context
+
+    def test_unchanged_product_page_is_not_rendered_again(self):
+        response = self.client.get(self.url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response['Last-Modified'])
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_variant_and_review_changes_touch_the_product(self):
+        etag = self.client.get(self.url)['ETag']
+        ProductVariant.objects.get(id=self.variant.id).save()
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 200)
+
+        Reviews.objects.create(product=self.product, name='Ana', rating=5, detail='Great')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=second['ETag']).status_code, 200)
+
+    def test_category_follows_its_products(self):
+        url = reverse('products:category_products', args=[self.category.slug])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Discount.objects.create(name='Sale', amount=10, product=self.product, start_date=timezone.now())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_differs_per_visitor_state(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('products:cart_add', args=[self.variant.id]))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ProductCardTagTests(CatalogTestMixin, TestCase):
+    template = Template("{% load product_cards %}{% product_card card %}")
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        forget_versions()
+        call_command('rebuild_product_cards', stdout=StringIO())
+
+    def card(self):
+        return ProductCard.objects.select_related('product__category').get(product=self.product)
+
+    def render(self, card, liked=()):
+        return self.template.render(Context({'card': card, 'liked_product_ids': set(liked)}))
+
+    def test_html_is_cached_and_heart_filled_per_visitor(self):
+        card = self.card()
+        html = self.render(card)
+        self.assertIn('Oxford shirt', html)
+        self.assertIn('ri-heart-line', html)
+        self.assertEqual(cache.get(card_key(card)), html)
+        self.assertIn('ri-heart-fill', self.render(card, liked=[self.product.id]))
+
+    def test_product_and_category_changes_render_a_new_card(self):
+        key = card_key(self.card())
+        self.product.name = 'Linen shirt'
+        self.product.save()
+        self.assertNotEqual(card_key(self.card()), key)
+        self.assertIn('Linen shirt', self.render(self.card()))
+
+        key = card_key(self.card())
+        self.category.name = 'Tops'
+        self.category.save()
+        self.assertNotEqual(card_key(self.card()), key)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Query budgets for every URL in products/urls.py, for a signed-in shopper with
+    likes and a cart and with the caches cleared (worst case). A budget that
+    starts failing is an N+1 creeping in.
+    """
+    BUDGETS = {
+        'shop': 21,
+        'shop_cards': 13,
+        'product_details': 26,
+        'product_variant': 15,
+        'category_products': 22,
+        'category_cards': 14,
+        'toggle_like': 12,
+        'submit_review': 15,
+        'product_reviews': 11,
+        'user_wishlist': 16,
+        'cart': 18,
+        'cart_add': 11,
+        'cart_update': 9,
+        # three conditional UPDATEs per cart line (variant, card, product), by design
+        'checkout': 33,
+        # the order and its lines are written at the prices of the moment (cart_lines)
+        'checkout_confirm': 16,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = add_catalog()[0]
+        cls.user = User.objects.create_user('shopper', password='pw')
+        cls.products = list(Product.objects.order_by('id'))
+        for product in cls.products[:4]:
+            toggle_like(product.id, cls.user)
+        build_related_products()
+        cart = Cart.objects.create(user=cls.user)
+        for variant in ProductVariant.objects.order_by('id')[:3]:
+            add_item(cart, variant.id, 1)
+        cls.variant = ProductVariant.objects.order_by('id').first()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        forget_versions()
+        facet_index().invalidate()
+        self.client.force_login(self.user)
+
+    def test_every_url_has_a_budget(self):
+        from . import urls
+        self.assertEqual({p.name for p in urls.urlpatterns}, set(self.BUDGETS))
+
+    def test_budgets(self):
+        product = self.products[0]
+        requests = {
+            'shop': (reverse('products:shop'), 'get', None),
+            'shop_cards': (reverse('products:shop_cards'), 'get', None),
+            'product_details': (reverse('products:product_details', args=[product.id]), 'get', None),
+            'product_variant': (reverse('products:product_variant', args=[product.id]), 'get', None),
+            'category_products': (reverse('products:category_products', args=[self.category.slug]), 'get', None),
+            'category_cards': (reverse('products:category_cards', args=[self.category.slug]), 'get', None),
+            'toggle_like': (reverse('products:toggle_like', args=[product.id]), 'post', None),
+            'submit_review': (reverse('products:submit_review', args=[product.id]), 'post',
+                              {'your-name': 'Bo', 'your-commemt': 'Fits well', 'rating': '5'}),
+            'product_reviews': (reverse('products:product_reviews', args=[product.id]), 'get', None),
+            'user_wishlist': (reverse('products:user_wishlist', args=[self.user.id]), 'get', None),
+            'cart': (reverse('products:cart'), 'get', None),
+            'cart_add': (reverse('products:cart_add', args=[self.variant.id]), 'post', {'quantity': '1'}),
+            'cart_update': (reverse('products:cart_update', args=[self.variant.id]), 'post', {'quantity': '2'}),
+            'checkout': (reverse('products:checkout'), 'post', None),
+            'checkout_confirm': (reverse('products:checkout_confirm'), 'post', None),
+        }
+        for name, (url, method, data) in requests.items():
+            with self.subTest(name):
+                cache.clear()
+                forget_versions()
+                facet_index().invalidate()
+                response = self.assertMaxQueries(url, self.BUDGETS[name], method, data)
+                self.assertLess(response.status_code, 400)
+
+
+class BackfillMigrationTests(TransactionTestCase):
+    """Existing catalogs get their cards and discounted prices when the migrations run."""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('products')[0])
+
+    def test_cards_and_effective_prices_are_backfilled(self):
+        apps = self.migrate(('products', '0001_initial'))
+        Product = apps.get_model('products', 'Product')
+        Variant = apps.get_model('products', 'ProductVariant')
+        Discount = apps.get_model('products', 'Discount')
+        Size, Color = apps.get_model('products', 'Size'), apps.get_model('products', 'Color')
+        product = Product.objects.create(name='Old shirt')
+        Variant.objects.create(
+            product=product, size=Size.objects.create(select='M', size='Medium'),
+            color=Color.objects.create(name='Red', color='#f00'),
+            price=Decimal('40.00'), image='v.jpg', image_hover='v.jpg', stock=3,
+        )
+        Discount.objects.create(name='Sale', amount=25, product=product)
+
+        apps = self.migrate(('products', '0002_productcard'))
+        card = apps.get_model('products', 'ProductCard').objects.get(product_id=product.id)
+        self.assertEqual((card.price, card.effective_price, card.sizes), (Decimal('40.00'), Decimal('30.00'), ['Medium']))
+
+        apps = self.migrate(('products', '0012_variant_effective_price'))
+        variant = apps.get_model('products', 'ProductVariant').objects.get()
+        self.assertEqual(variant.effective_price, Decimal('30.00'))
@@ -0,0 +1,165 @@
+"""
+Off-request processing of user-uploaded images (review photos, blog comment and
+reply pictures).
+
+Views call stage_upload(), which streams the upload into STAGING_DIR, queues a
+PendingUpload row and returns; the review/comment is saved without its image and
+the response goes out straight away. Once the transaction commits, the job is
+handed to a single background thread in the same process, which validates the
+image, applies its EXIF rotation and drops the metadata, downscales and
+re-encodes it, then attaches the result to the row.
+
+`manage.py process_uploads` drains whatever a restarted worker left behind. Set
+UPLOAD_PROCESS_IN_THREAD = False to leave all the work to that command.
+"""
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from PIL import Image
+
+from .images import DERIVATIVE_FIELDS, build_derivatives, encode_image, open_image
+from .models import PendingUpload
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = 'uploads/staging'
+MAX_UPLOAD_SIZE = getattr(settings, 'MAX_IMAGE_UPLOAD_SIZE', 10 * 1024 * 1024)
+MAX_PIXELS = 40_000_000
+MAX_DIMENSION = 1600
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF'}
+STALE_AFTER = timedelta(minutes=10)
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def validate_upload(uploaded_file):
+    """Cheap checks done in the request, before anything is saved."""
+    if uploaded_file.size > MAX_UPLOAD_SIZE:
+        raise UploadRejected(f"Images must be smaller than {MAX_UPLOAD_SIZE // (1024 * 1024)} MB.")
+    if not (uploaded_file.content_type or '').startswith('image/'):
+        raise UploadRejected("Only image files can be uploaded.")
+
+
+def stage_upload(uploaded_file, instance, field):
+    """Park `uploaded_file` for `instance.<field>`; it is attached once processed."""
+    validate_upload(uploaded_file)
+    ext = os.path.splitext(uploaded_file.name)[1].lower()[:10]
+    # storage.save() copies the upload chunk by chunk, it is never read into memory whole
+    staged_name = default_storage.save(f'{STAGING_DIR}/{uuid.uuid4().hex}{ext}', uploaded_file)
+    job = PendingUpload.objects.create(
+        model_label=instance._meta.label,
+        object_id=instance.pk,
+        field=field,
+        staged_name=staged_name,
+        original_name=uploaded_file.name[:255],
+    )
+    transaction.on_commit(lambda: submit(job.id))
+    return job
+
+
+# --- worker --------------------------------------------------------------
+
+_executor = None
+
+
+def submit(job_id):
+    global _executor
+    if not getattr(settings, 'UPLOAD_PROCESS_IN_THREAD', True):
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='uploads')
+    _executor.submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        process_job(job_id)
+    except Exception:
+        logger.exception("Upload job %s crashed", job_id)
+    finally:
+        # this thread's connections, not the request threads'
+        connections.close_all()
+
+
+def clean_image(name):
+    """Validated, rotated, metadata-free and downscaled JPEG bytes of a staged image."""
+    with default_storage.open(name, 'rb') as f:
+        with Image.open(f) as probe:
+            if probe.format not in ALLOWED_FORMATS:
+                raise UploadRejected(f"Unsupported image format {probe.format}.")
+            if probe.width * probe.height > MAX_PIXELS:
+                raise UploadRejected("Image dimensions are too large.")
+    image = open_image(name)
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    # encode_image() writes no EXIF/XMP, so location and camera data are dropped here
+    return encode_image(image, 'jpg')
+
+
+def attach(job, data):
+    model = apps.get_model(job.model_label)
+    instance = model.objects.filter(pk=job.object_id).first()
+    if instance is None:
+        return None  # the review/comment was deleted in the meantime
+    file_field = model._meta.get_field(job.field)
+    stem = os.path.splitext(get_valid_filename(job.original_name or 'upload'))[0] or 'upload'
+    name = file_field.storage.save(file_field.generate_filename(instance, f'{stem}.jpg'), ContentFile(data))
+    setattr(instance, job.field, name)
+    # a save, not update(): the signals move the page's updated_at (ETag, cached
+    # cards) and bump the page cache tags
+    instance.save(update_fields=[job.field])
+    if job.field in DERIVATIVE_FIELDS.get(job.model_label, []):
+        build_derivatives(name, file_field.storage)
+    return name
+
+
+def process_job(job_id):
+    """Process one queued upload; returns its final status (None if another worker has it)."""
+    claimed = PendingUpload.objects.filter(id=job_id, status=PendingUpload.PENDING).update(
+        status=PendingUpload.PROCESSING, attempts=F('attempts') + 1,
+    )
+    if not claimed:
+        return None
+    job = PendingUpload.objects.get(id=job_id)
+
+    try:
+        attach(job, clean_image(job.staged_name))
+    except (UploadRejected, OSError, Image.DecompressionBombError) as exc:
+        job.status, job.error = PendingUpload.FAILED, str(exc)
+    else:
+        job.status, job.error = PendingUpload.DONE, ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+    if default_storage.exists(job.staged_name):
+        default_storage.delete(job.staged_name)
+    return job.status
+
+
+def process_pending(limit=None):
+    """Process queued uploads oldest first; returns {status: count}."""
+    # jobs left "processing" by a worker that died are picked up again
+    PendingUpload.objects.filter(
+        status=PendingUpload.PROCESSING, updated_at__lt=timezone.now() - STALE_AFTER,
+    ).update(status=PendingUpload.PENDING)
+
+    ids = PendingUpload.objects.filter(status=PendingUpload.PENDING).order_by('created_at').values_list('id', flat=True)
+    if limit:
+        ids = ids[:limit]
+    results = {}
+    for job_id in list(ids):
+        status = process_job(job_id)
+        if status:
+            results[status] = results.get(status, 0) + 1
+    return results
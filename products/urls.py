@@ -5,9 +5,18 @@ app_name = "products"
 
 urlpatterns = [
     path('shop', views.shop, name="shop"),
+    path('shop/cards/', views.shop_cards, name="shop_cards"),
     path('product/<int:id>/', views.product_details, name='product_details'),
+    path('product/<int:id>/variant/', views.product_variant, name='product_variant'),
     path('category/<slug:slug>/', views.category_products, name='category_products'),
+    path('category/<slug:slug>/cards/', views.category_cards, name='category_cards'),
     path('product/<int:product_id>/like/', views.toggle_like, name='toggle_like'),
     path('product/<int:product_id>/review/', views.submit_review, name='submit_review'),
+    path('product/<int:product_id>/reviews/', views.product_reviews, name='product_reviews'),
     path('user/<int:user_id>/wishlist/', views.user_wishlist, name='user_wishlist'),
+    path('cart/', views.cart_detail, name='cart'),
+    path('cart/add/<int:variant_id>/', views.cart_add, name='cart_add'),
+    path('cart/update/<int:variant_id>/', views.cart_update, name='cart_update'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('checkout/confirm/', views.checkout_confirm, name='checkout_confirm'),
 ]
\ No newline at end of file
@@ -1,355 +1,509 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from .models import *
 from django.contrib.sites.shortcuts import get_current_site
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Min, Max
+from django.contrib.auth.views import redirect_to_login
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
+from django_htmx.http import HttpResponseClientRedirect
+from home.conditional import conditional_page, viewer_changed
+from home.page_cache import CATALOG_TAG, cache_anonymous_page
+from django.db import transaction
+from django.db.models import Q, Min, Max, Sum
+from decimal import Decimal, InvalidOperation
+from .facets import PRICE_BUCKETS, facet_index
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from . import cart as carts, services, uploads
+from .services import DiscountResolver
 # Create your views here.
 
+PRODUCTS_PER_PAGE = 24
+RELATED_PRODUCTS_LIMIT = 8
+ALSO_LIKED_LIMIT = 8
+FILTER_KEYS = ('category', 'size', 'color', 'price_bucket', 'min_price', 'max_price')
+
+
+def _filter_params(request):
+    """Listing filters come from GET (bookmarkable, paginated) or the old POST forms."""
+    return request.POST if request.method == "POST" else request.GET
+
+
+def _int_list(params, key):
+    return [int(x) for x in params.getlist(key) if x.isdigit()]
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+
+
+def _facet_search(params, category=None):
+    """Filter the catalog through the in-memory facet index (no SQL)."""
+    return facet_index().search(
+        categories=[category.id] if category else _int_list(params, 'category'),
+        sizes=_int_list(params, 'size'),
+        colors=_int_list(params, 'color'),
+        price_buckets=_int_list(params, 'price_bucket'),
+        min_price=_decimal(params.get('min_price')),
+        max_price=_decimal(params.get('max_price')),
+    )
+
+
+def _card_page(result, params, page_url):
+    """
+    One page of ProductCards for a facet result, newest product first.
+    The cursor is the last product id shown; the page is cut straight from the bitmap.
+    """
+    cursor = params.get('cursor')
+    below = decode_cursor(cursor, 1)[0] if cursor else None
+    # the cursor sizes a bit mask, so anything outside the indexed ids is refused
+    if below is not None and (
+        isinstance(below, bool) or not isinstance(below, int) or not 0 < below <= facet_index().id_limit()
+    ):
+        raise InvalidCursor(cursor)
+
+    ids = result.page(PRODUCTS_PER_PAGE + 1, below=below)
+    page_ids = ids[:PRODUCTS_PER_PAGE]
+    cards = ProductCard.objects.filter(product_id__in=page_ids).select_related('product__category').order_by('-product_id')
+
+    next_url = None
+    if len(ids) > PRODUCTS_PER_PAGE:
+        query = params.copy()
+        query.pop('csrfmiddlewaretoken', None)
+        query['cursor'] = encode_cursor([page_ids[-1]])
+        next_url = f"{page_url}?{query.urlencode()}"
+    return cards, next_url
+
+
+def _with_counts(objects, counts):
+    for obj in objects:
+        obj.facet_count = counts.get(obj.id, 0)
+    return objects
+
+
+def _price_buckets(counts, selected):
+    return [
+        {'id': i, 'label': label, 'count': counts.get(i, 0), 'selected': i in selected}
+        for i, (label, _, _) in enumerate(PRICE_BUCKETS)
+    ]
+
+
+@cache_anonymous_page(CATALOG_TAG, query=(*FILTER_KEYS, 'cursor'))
 def shop(request):
-    products = Product.objects.prefetch_related('variants__color', 'variants__size').all()
-    is_filter = None
-    categories = Category.objects.all()
-    sizes = Size.objects.all()
-    colors = Color.objects.all()
-    price_range = products.aggregate(min_price=Min('variants__price'), max_price=Max('variants__price'))
-
-    # Handle filters
-    if request.method == "POST":
-        category_ids = request.POST.getlist("category")
-        size_ids = request.POST.getlist("size")
-        color_ids = request.POST.getlist("color")
-        min_price = request.POST.get("min_price")
-        max_price = request.POST.get("max_price")
-
-        filters = Q()
-
-        # 🎯 Step 1 — Apply price filter (main condition)
-        if min_price and max_price:
-            filters &= Q(variants__price__gte=min_price, variants__price__lte=max_price)
-        elif min_price:
-            filters &= Q(variants__price__gte=min_price)
-        elif max_price:
-            filters &= Q(variants__price__lte=max_price)
-
-        # Step 2 — Apply other filters *only inside* the price range (optional)
-        products = products.filter(filters).distinct()
-        is_filter = True
-
-        # Optional refinements
-        if category_ids:
-            products = products.filter(category__id__in=category_ids)
-        if size_ids:
-            products = products.filter(variants__size__id__in=size_ids)
-        if color_ids:
-            products = products.filter(variants__color__id__in=color_ids)
-
-        products = products.distinct()
-
-    # Prepare product data
-    product_data = []
-    for product in products:
-        variants = product.variants.all()
-        if not variants.exists():
-            continue
-
-        first_variant = variants.first()
-        colors_list = [{
-            'id': v.color.id,
-            'color_name': v.color.name,
-            'color_code': v.color.color,
-            'image': v.image.url,
-            'image_hover': v.image_hover.url,
-        } for v in variants]
-
-        sizes_list = list(set(v.size for v in variants))
-
-        product_data.append({
-            'product': product,
-            'first_variant': first_variant,
-            'colors': colors_list,
-            'sizes': sizes_list,
-        })
+    params = _filter_params(request)
+    is_filter = any(params.get(key) for key in FILTER_KEYS) or None
+    result = _facet_search(params)
+    min_price, max_price = facet_index().price_range()
+
+    try:
+        products, next_url = _card_page(result, params, reverse('products:shop_cards'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
 
     context = {
-        'products': product_data,
-        'categories': categories,
-        'sizes': sizes,
-        'colors': colors,
-        'price_range': price_range,
-        'selected_categories': [int(x) for x in request.POST.getlist("category")],
-        'selected_sizes': [int(x) for x in request.POST.getlist("size")],
-        'selected_colors': [int(x) for x in request.POST.getlist("color")],
-        'selected_min_price': request.POST.get("min_price", ""),
-        'selected_max_price': request.POST.get("max_price", ""),
+        'products': products,
+        'next_url': next_url,
+        'total_products': result.total,
+        'categories': _with_counts(list(Category.objects.all()), result.counts['category']),
+        'sizes': _with_counts(list(Size.objects.all()), result.counts['size']),
+        'colors': _with_counts(list(Color.objects.all()), result.counts['color']),
+        'price_buckets': _price_buckets(result.counts['price'], _int_list(params, 'price_bucket')),
+        'price_range': {'min_price': min_price, 'max_price': max_price},
+        'selected_categories': _int_list(params, "category"),
+        'selected_sizes': _int_list(params, "size"),
+        'selected_colors': _int_list(params, "color"),
+        'selected_min_price': params.get("min_price", ""),
+        'selected_max_price': params.get("max_price", ""),
         'is_filter': is_filter,
     }
 
     return render(request, 'products/shop.html', context)
 
-def product_details(request, id):
-    product = get_object_or_404(Product, id=id)
-    try:
-        product_reviews = Reviews.objects.filter(product=product)
-    except:
-        product_reviews = Reviews.objects.none()
 
-    variants = ProductVariant.objects.filter(product=product).select_related('color', 'size')
-    default_variant = variants.first()
+def shop_cards(request):
+    """HTMX endpoint: the next page of shop cards only."""
+    params = request.GET
+    try:
+        products, next_url = _card_page(_facet_search(params), params, reverse('products:shop_cards'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+    return render(request, 'products/partials/product_cards.html', {'products': products, 'next_url': next_url})
+
+def _product_variants(product):
+    """All variants with their swatches and gallery images, in two queries."""
+    return list(
+        ProductVariant.objects.filter(product=product)
+        .select_related('color', 'size').prefetch_related('images').order_by('id')
+    )
 
-    product_colors = Color.objects.filter(productvariant__product=product).distinct()
-    product_sizes = sorted(set(v.size for v in variants), key=lambda s: s.size)
 
-    # --- Handle POST request ---
-    if request.method == 'POST':
-        color_id = request.POST.get('color_id')
-        size_id = request.POST.get('size_id')
-
-        selected_color = Color.objects.filter(id=color_id).first() if color_id else None
-        selected_size = Size.objects.filter(id=size_id).first() if size_id else None
-
-        # Determine variant based on selections
-        main_variant = None
-        if selected_color and selected_size:
-            main_variant = variants.filter(color=selected_color, size=selected_size).first()
-        elif selected_color:
-            main_variant = variants.filter(color=selected_color).first()
-        elif selected_size:
-            main_variant = variants.filter(size=selected_size).first()
-        else:
-            main_variant = default_variant
-    else:
-        # GET request or initial load
-        main_variant = default_variant
-        selected_color = main_variant.color if main_variant else None
-        selected_size = main_variant.size if main_variant else None
-
-    # --- Collect variant images ---
-    variant_images = []
-    if main_variant:
-        if main_variant.image:
-            variant_images.append({'url': main_variant.image.url, 'alt': f"{product.name} main image"})
-        if getattr(main_variant, 'image_hover', None):
-            variant_images.append({'url': main_variant.image_hover.url, 'alt': f"{product.name} hover image"})
-        for img in main_variant.images.all():
-            variant_images.append({'url': img.image.url, 'alt': img.alt_text or product.name})
-
-    # --- Discount & price ---
-    main_discount = (
-        Discount.objects.filter(variant=main_variant, active=True).first()
-        or Discount.objects.filter(product=product, active=True).first()
-        or Discount.objects.filter(category=product.category, active=True).first()
+def _pick_variant(variants, color_id=None, size_id=None):
+    """The exact color+size match, else the first of that color, else of that size, else the first variant."""
+    color_id = int(color_id) if str(color_id or '').isdigit() else None
+    size_id = int(size_id) if str(size_id or '').isdigit() else None
+    candidates = (
+        [v for v in variants if v.color_id == color_id and v.size_id == size_id],
+        [v for v in variants if v.color_id == color_id],
+        [v for v in variants if v.size_id == size_id],
+        variants,
     )
+    return next((found[0] for found in candidates if found), None)
+
+
+def _variant_images(product, variant):
+    images = []
+    if variant is None:
+        return images
+    if variant.image:
+        images.append({'url': variant.image.url, 'alt': f"{product.name} main image"})
+    if variant.image_hover:
+        images.append({'url': variant.image_hover.url, 'alt': f"{product.name} hover image"})
+    for img in variant.images.all():
+        images.append({'url': img.image.url, 'alt': img.alt_text or product.name})
+    return images
+
+
+def _variant_matrix(product, variants):
+    """
+    Every variant keyed "color_id:size_id", rendered with json_script so the page
+    switches variants without a request (static/assets/js/variant-matrix.js).
+    """
+    return {
+        f'{v.color_id}:{v.size_id}': {
+            'id': v.id,
+            'price': str(v.price),
+            'effective_price': str(v.effective_price if v.effective_price is not None else v.price),
+            'stock': v.stock,
+            'images': [img['url'] for img in _variant_images(product, v)],
+        }
+        for v in variants
+    }
+
 
-    original_price = main_variant.price if main_variant else 0
-    final_price = original_price
-    discount_percent = 0
+def _variant_context(product, variant):
+    """Gallery, price and stock of the shown variant (the parts the variant fragment re-renders)."""
+    price = DiscountResolver().resolve_one(variant)
     discount_end = None
+    if price.discount and price.discount.end_date:
+        discount_end = price.discount.end_date.isoformat()
+    return {
+        'product': product,
+        'variant': variant,
+        'variant_images': _variant_images(product, variant),
+        'original_price': price.original_price,
+        'final_price': price.final_price,
+        'discount_percent': price.discount_percent,
+        'discount_end': discount_end,
+    }
+
 
-    if main_discount:
-        if getattr(main_discount, 'end_date', None):
-            discount_end = main_discount.end_date.isoformat()
-        discount_percent = main_discount.amount
-        final_price = original_price - (original_price * main_discount.amount / 100)
+def _product_changed(id):
+    return Product.objects.filter(id=id).values_list('updated_at', flat=True).first()
+
+
+@conditional_page('product', _product_changed)
+@cache_anonymous_page(CATALOG_TAG, query=('color', 'size'))
+def product_details(request, id):
+    product = get_object_or_404(Product, id=id)
+    reviews, reviews_next_url = _review_page(product.id)
+
+    variants = _product_variants(product)
+    product_colors = list({v.color_id: v.color for v in variants}.values())
+    product_sizes = sorted({v.size_id: v.size for v in variants}.values(), key=lambda s: s.size)
+
+    # picking a swatch is done client-side from the variant matrix; the POST forms
+    # (and ?color=&size=) remain for browsers without JavaScript
+    params = request.POST if request.method == 'POST' else request.GET
+    main_variant = _pick_variant(variants, params.get('color_id') or params.get('color'), params.get('size_id') or params.get('size'))
+    selected_color = main_variant.color if main_variant else None
+    selected_size = main_variant.size if main_variant else None
 
     # --- Related products ---
-    related_variants = ProductVariant.objects.filter(
-        product__category=product.category
-    ).exclude(product=product).select_related('product', 'color', 'size')
-
-    related_products = []
-    seen_ids = set()
-
-    for rel_var in related_variants:
-        rel_prod = rel_var.product
-        if rel_prod.id not in seen_ids:
-            all_variants = ProductVariant.objects.filter(product=rel_prod)
-
-            # Colors for related product
-            rel_colors = [{
-                'name': v.color.name,
-                'code': getattr(v.color, 'color', '#000'),
-                'image': v.image.url if v.image else '',
-                'image_hover': v.image_hover.url if getattr(v, 'image_hover', None) else ''
-            } for v in all_variants]
-
-            # Sizes for related product
-            rel_sizes = [v.size.size for v in all_variants if v.size]
-
-            # Price & discount for related product
-            rel_discount = (
-                Discount.objects.filter(variant=rel_var, active=True).first()
-                or Discount.objects.filter(product=rel_prod, active=True).first()
-                or Discount.objects.filter(category=rel_prod.category, active=True).first()
-            )
-            rel_original_price = rel_var.price
-            rel_final_price = rel_original_price
-            if rel_discount:
-                rel_final_price = rel_original_price - (rel_original_price * rel_discount.amount / 100)
-
-            related_products.append({
-                'product': rel_prod,
-                'first_variant': rel_var,
-                'colors': rel_colors,
-                'sizes': rel_sizes,
-                'original_price': rel_original_price,
-                'final_price': rel_final_price,
-                'has_discount': rel_discount is not None,
-            })
-
-            seen_ids.add(rel_prod.id)
+    related_products = _related_cards(product)
+    also_liked = _related_cards(product, ALSO_LIKED_LIMIT, kind=RelatedProduct.ALSO_LIKED)
 
     # get absolute URL for share
     current_site = get_current_site(request)
     product_url = f"http://{current_site.domain}{product.get_absolute_url()}"
 
     context = {
-        'product': product,
+        **_variant_context(product, main_variant),
         'variants': variants,
+        'variant_matrix': _variant_matrix(product, variants),
         'colors': product_colors,
         'sizes': product_sizes,
-        'variant_images': variant_images,
         'selected_color': selected_color,
         'selected_size': selected_size,
-        'original_price': original_price,
-        'final_price': final_price,
-        'discount_percent': discount_percent,
-        'discount_end': discount_end,
         'product_url': product_url,
-        'variant': main_variant,
-        'product_reviews': product_reviews,
+        'product_reviews': reviews,
+        'reviews_next_url': reviews_next_url,
+        'rating_bars': _rating_bars(product),
         'related_products': related_products,
+        'also_liked': also_liked,
     }
 
     return render(request, 'products/product_detail.html', context)
 
+def product_variant(request, id):
+    """HTMX: gallery, price and cart form of one variant, for when the page can't switch it in place."""
+    product = get_object_or_404(Product.objects.only('id', 'name'), id=id)
+    variant = _pick_variant(_product_variants(product), request.GET.get('color'), request.GET.get('size'))
+    return render(request, 'products/partials/variant_fragment.html', _variant_context(product, variant))
+
+
+def _related_cards(product, limit=RELATED_PRODUCTS_LIMIT, kind=RelatedProduct.SIMILAR):
+    """Cards of the precomputed related products of one kind, best first, in one query."""
+    cards = list(
+        ProductCard.objects.filter(product__related_from__product=product, product__related_from__kind=kind)
+        .select_related('product__category')
+        .order_by('-product__related_from__score')[:limit]
+    )
+    if not cards and kind == RelatedProduct.SIMILAR:
+        # build_related_products hasn't run for this product yet
+        cards = list(
+            ProductCard.objects.filter(product__category=product.category)
+            .exclude(product=product).select_related('product__category')
+            .order_by('-product_id')[:limit]
+        )
+    return cards
+
+
+def _also_liked_cards(user_id, product_ids, limit=ALSO_LIKED_LIMIT):
+    """Cards liked together with `product_ids`, summed over them, minus what the user already liked."""
+    if not product_ids:
+        return []
+    return list(
+        ProductCard.objects.filter(
+            product__related_from__product__in=product_ids,
+            product__related_from__kind=RelatedProduct.ALSO_LIKED,
+        )
+        .exclude(product__liked_by=user_id)
+        .annotate(also_liked_score=Sum('product__related_from__score'))
+        .select_related('product__category')
+        .order_by('-also_liked_score', '-product_id')[:limit]
+    )
+
+
+def _review_page(product_id, cursor=None):
+    page = services.review_page(product_id, cursor)
+    next_url = None
+    if page.has_next:
+        next_url = f"{reverse('products:product_reviews', args=[product_id])}?cursor={page.next_cursor}"
+    return page.items, next_url
+
+
+def _rating_bars(product):
+    """[(stars, count, percent)] from 5 stars down, for the review summary."""
+    histogram = product.rating_histogram or [0] * 5
+    total = product.rating_count or 1
+    return [(star, histogram[star - 1], histogram[star - 1] * 100 // total) for star in range(5, 0, -1)]
+
+
+def product_reviews(request, product_id):
+    """HTMX endpoint: the next page of a product's reviews."""
+    try:
+        reviews, next_url = _review_page(product_id, request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+    return render(request, 'products/partials/reviews.html', {'product_reviews': reviews, 'reviews_next_url': next_url})
+
+
 def submit_review(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = get_object_or_404(Product.objects.only('id'), id=product_id)
 
     if request.method == 'POST':
         name = request.POST.get('your-name')
         comment = request.POST.get('your-commemt')
-        rating = int(request.POST.get('rating', 5))
+        rating = request.POST.get('rating', '5')
+        rating = min(max(int(rating), 1), 5) if rating.isdigit() else 5
         image = request.FILES.get('your-image')  # 🖼️ Get uploaded image
 
-        Reviews.objects.create(
-            product=product,
-            name=name,
-            detail=comment,
-            rating=rating,
-            image=image
-        )
+        try:
+            if image:
+                uploads.validate_upload(image)
+        except uploads.UploadRejected as exc:
+            messages.error(request, str(exc))
+            return redirect('products:product_details', id=product.id)
+
+        with transaction.atomic():
+            review = services.add_review(
+                product.id,
+                name=name,
+                detail=comment,
+                rating=rating,
+            )
+            if image:
+                # resized and attached in the background, see products/uploads.py
+                uploads.stage_upload(image, review, 'image')
         messages.success(request, "Your review has been submitted successfully!")
-        return redirect('products:product_details', id=product.id)
+    return redirect('products:product_details', id=product.id)
     
+def _category_changed(slug):
+    return Category.objects.filter(slug=slug).values_list('updated_at', flat=True).first()
+
+
+@conditional_page('category', _category_changed)
+@cache_anonymous_page(CATALOG_TAG, query=(*FILTER_KEYS, 'cursor'))
 def category_products(request, slug):
     category = get_object_or_404(Category, slug=slug)
-    products = category.products.all()  # initial queryset
+    params = _filter_params(request)
+    result = _facet_search(params, category=category)
 
-    if request.method == 'POST':
-    
-        size_ids = request.POST.get('size')
-        print(size_ids)
-        color_ids = request.POST.get('color')
-        print(color_ids)
-        min_price = request.POST.get('min_price')
-        print(min_price)
-        max_price = request.POST.get('max_price')
-        print(max_price)
-
-        if size_ids:
-            products = products.filter(variants__size__id__in=size_ids).distinct()
-        if color_ids:
-            products = products.filter(variants__color__id__in=color_ids).distinct()
-        if min_price:
-            products = products.filter(variants__price__gte=min_price).distinct()
-        if max_price:
-            products = products.filter(variants__price__lte=max_price).distinct()
-
-    # Prepare product data
-    product_data = []
-    for product in products:
-        variants = product.variants.all()
-        if not variants.exists():
-            continue
-        first_variant = variants.all().first() or variants.first()
-
-        colors = [{
-            'color_name': v.color.name,
-            'color_code': getattr(v.color, 'color', '#000'),
-            'image': v.image.url,
-            'image_hover': v.image_hover.url
-        } for v in variants]
-
-        sizes = [v.size.size for v in variants]
-
-        discount = (
-            Discount.objects.filter(variant=first_variant, active=True).first()
-            or Discount.objects.filter(product=product, active=True).first()
-            or Discount.objects.filter(category=category, active=True).first()
+    try:
+        products, next_url = _card_page(
+            result, params, reverse('products:category_cards', args=[category.slug]),
         )
-        original_price = first_variant.price
-        final_price = original_price
-        if discount:
-            final_price = original_price - (original_price * discount.amount / 100)
-
-        product_data.append({
-            'product': product,
-            'first_variant': first_variant,
-            'colors': colors,
-            'sizes': sizes,
-            'original_price': original_price,
-            'final_price': final_price,
-            'has_discount': discount is not None,
-        })
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
 
     context = {
         'category': category,
-        'products': product_data,
-        'sizes': Size.objects.all(),
-        'colors': Color.objects.all(),
+        'products': products,
+        'next_url': next_url,
+        'total_products': result.total,
+        'sizes': _with_counts(list(Size.objects.all()), result.counts['size']),
+        'colors': _with_counts(list(Color.objects.all()), result.counts['color']),
+        'selected_size': params.get('size', ''),
+        'selected_color': params.get('color', ''),
+        'selected_min_price': params.get('min_price', ''),
+        'selected_max_price': params.get('max_price', ''),
     }
 
     return render(request, 'category/products.html', context)
 
-@login_required
-def toggle_like(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    user = request.user
 
-    if user in product.liked_by.all():
-        product.liked_by.remove(user)
-        liked = False
-    else:
-        product.liked_by.add(user)
-        liked = True
+def category_cards(request, slug):
+    """HTMX endpoint: the next page of category cards only."""
+    category = get_object_or_404(Category, slug=slug)
+    params = request.GET
+    try:
+        products, next_url = _card_page(
+            _facet_search(params, category=category), params,
+            reverse('products:category_cards', args=[category.slug]),
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+    return render(request, 'products/partials/product_cards.html', {'products': products, 'next_url': next_url})
 
+@require_POST
+def toggle_like(request, product_id):
+    product = get_object_or_404(Product.objects.only('id'), id=product_id)
+    if not request.user.is_authenticated:
+        login_url = redirect_to_login(product.get_absolute_url()).url
+        return HttpResponseClientRedirect(login_url) if request.htmx else redirect(login_url)
+
+    liked = services.toggle_like(product.id, request.user)
+    viewer_changed(request)
+
+    if request.htmx:
+        # only the heart icon is swapped, see partials/like_button.html
+        context = {'product_id': product.id, 'liked_product_ids': {product.id} if liked else set()}
+        return render(request, 'products/partials/like_icon.html', context)
+    # the wishlist's remove buttons come back to the wishlist
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
     return redirect('products:product_details', id=product.id)
 
 @login_required
 def user_wishlist(request, user_id):
-    user_wishlist_products = Product.objects.filter(liked_by=user_id).prefetch_related('variants')
-
-    wishlist_data = []
-
-    for product in user_wishlist_products:
-        # pick one variant to show
-        first_variant = product.variants.filter(show_in_main_page=True).first() or product.variants.first()
-        if not first_variant:
-            continue
-
-        wishlist_data.append({
-            'product': product,
-            'variant': first_variant,
-            'price': first_variant.price,
-            'image': first_variant.image.url,
-            'stock': first_variant.stock,
-            'size': first_variant.size.size if first_variant.size else None,
-            'color': first_variant.color.name if first_variant.color else None,
-        })
+    try:
+        page = services.wishlist_page(user_id, cursor=request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    next_url = None
+    if page.has_next:
+        next_url = f"{reverse('products:user_wishlist', args=[user_id])}?cursor={page.next_cursor}"
 
     context = {
-        'wishlist_data': wishlist_data,
+        'wishlist_data': page.items,
+        'next_url': next_url,
+        'also_liked': _also_liked_cards(user_id, [item.product.id for item in page.items]),
+    }
+    return render(request, 'products/user_product_wishlist.html', context)
+
+
+# --- cart & checkout ---
+
+def _quantity(value, default=1):
+    return int(value) if value and value.isdigit() else default
+
+
+def _cart_context(cart):
+    lines = carts.cart_lines(cart)
+    return {
+        'cart': cart,
+        'cart_lines': lines,
+        'cart_total': carts.cart_total(lines),
+        'held_until': carts.held_until(cart),
     }
-    return render(request, 'products/user_product_wishlist.html', context)
\ No newline at end of file
+
+
+def cart_detail(request):
+    cart = carts.get_cart(request)
+    return render(request, 'products/cart.html', _cart_context(cart))
+
+
+def cart_add(request, variant_id):
+    if request.method != 'POST':
+        return redirect('products:cart')
+    variant = get_object_or_404(ProductVariant.objects.only('id', 'product_id', 'stock'), id=variant_id)
+    if variant.stock <= 0:
+        messages.error(request, "Sorry, this item is sold out.")
+        return redirect('products:product_details', id=variant.product_id)
+
+    cart = carts.get_cart(request, create=True)
+    carts.add_item(cart, variant.id, _quantity(request.POST.get('quantity')))
+    viewer_changed(request)
+    if request.htmx:
+        return render(request, 'products/partials/cart_count.html', {'cart_count': carts.cart_count(cart)})
+    messages.success(request, "Added to your cart.")
+    return redirect('products:cart')
+
+
+def cart_update(request, variant_id):
+    if request.method == 'POST':
+        cart = carts.get_cart(request)
+        if cart is not None:
+            # quantity 0 (or the remove button) drops the line
+            carts.set_quantity(cart, variant_id, _quantity(request.POST.get('quantity'), default=0))
+            viewer_changed(request)
+    return redirect('products:cart')
+
+
+def checkout(request):
+    cart = carts.get_cart(request)
+    if request.method != 'POST' or cart is None or not cart.items.exists():
+        return redirect('products:cart')
+    try:
+        carts.checkout(cart)
+    except carts.OutOfStock as exc:
+        messages.error(request, f"Sorry, there isn't enough stock left of {exc.variant}. Please update your cart.")
+        return redirect('products:cart')
+    return render(request, 'products/checkout.html', _cart_context(cart))
+
+
+def checkout_confirm(request):
+    cart = carts.get_cart(request)
+    if request.method != 'POST' or cart is None:
+        return redirect('products:cart')
+    try:
+        order = carts.confirm_checkout(cart)
+    except carts.OutOfStock as exc:
+        messages.error(request, f"Sorry, there isn't enough stock left of {exc.variant}. Please update your cart.")
+        return redirect('products:cart')
+    except carts.CartChanged:
+        messages.warning(request, "Your cart has changed since you checked out. Please review your order.")
+        return render(request, 'products/checkout.html', _cart_context(cart))
+    if order is not None:
+        viewer_changed(request)
+        messages.success(request, f"Thank you! Your order #{order.id} has been placed.")
+        return redirect('home:home')
+    messages.error(request, "Your reservation has expired. Please check out again.")
+    return redirect('products:cart')
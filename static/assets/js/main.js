@@ -731,12 +731,15 @@
             $optImgMain = $optImgWrapper.find('.image img.main-img'),
             $optImgMainHover = $optImgWrapper.find('.image img.hover-img');
         // alert();
+        // swapPicture (responsive-images.js) also rewrites the <picture> srcsets
         if ($opImg.length) {
-            $optImgMain.attr('src', $opImg);
+            $optImgMain.each(function () { swapPicture(this, $opImg); });
         }
         if ($opImg.length) {
             var checkDisable = $optImgMainHover.closest('img.hover-img');
-            $optImgMainHover.attr('src', $opImgHover);
+            if ($opImgHover) {
+                $optImgMainHover.each(function () { swapPicture(this, $opImgHover); });
+            }
             if (checkDisable.hasClass('disable')) {
                 checkDisable.removeClass('disable');
             }
@@ -0,0 +1,12 @@
+// Point an <img> rendered by {% picture %} at another image, keeping its srcsets.
+// Rendition names mirror products/images.py: photo.jpg -> photo.w320.webp, photo.w320.jpg ...
+function swapPicture(img, url) {
+    img.src = url;
+    const picture = img.closest("picture");
+    if (!picture || !picture.dataset.widths) return;
+    const widths = picture.dataset.widths.split(",");
+    const srcset = ext => widths.map(w => url.replace(/\.[^./]+$/, ".w" + w + "." + ext) + " " + w + "w").join(", ");
+    const source = picture.querySelector('source[type="image/webp"]');
+    if (source) source.srcset = srcset("webp");
+    img.srcset = srcset("jpg");
+}
@@ -0,0 +1,109 @@
+// Switch the shown variant on the product page without reloading it.
+// The page renders every variant as {"color_id:size_id": {id, price, effective_price, stock, images}}
+// into #variant-matrix (products.views._variant_matrix). When the new variant has a different
+// number of images the gallery is fetched from products:product_variant instead.
+(function () {
+    const data = document.getElementById("variant-matrix");
+    const picker = document.getElementById("variant-picker");
+    if (!data || !picker) return;
+    const matrix = JSON.parse(data.textContent);
+
+    // the exact color+size, else the first of the picked color, else of the picked size
+    function pick(color, size, changed) {
+        if (matrix[color + ":" + size]) return [color, size];
+        const key = Object.keys(matrix).find(k => changed === "color" ? k.startsWith(color + ":") : k.endsWith(":" + size));
+        return key ? key.split(":") : null;
+    }
+
+    function money(value) {
+        return "€" + Number(value).toFixed(2);
+    }
+
+    function showPrice(variant) {
+        const price = document.querySelector("#variant-price .mn-price");
+        const stock = document.querySelector("#variant-price .mn-single-stoke");
+        const original = Number(variant.price), final = Number(variant.effective_price);
+        if (final < original) {
+            const percent = Math.round((original - final) / original * 100);
+            price.innerHTML = '<div class="mn-price-old">' + money(original) + '</div>' +
+                '<div class="final-price">' + money(final) + ' <span class="price-des">-' + percent + '%</span></div>';
+        } else {
+            price.innerHTML = '<div class="final-price">' + money(original) + '</div>';
+        }
+        stock.innerHTML = variant.stock > 0
+            ? '<span class="mn-single-ps-title text-success">IN STOCK</span>'
+            : '<span class="mn-single-ps-title text-danger">OUT OF STOCK</span>';
+    }
+
+    // retarget the add-to-cart form; false when it has to be rendered by the server
+    function showCart(variant) {
+        const form = document.querySelector("#variant-cart form");
+        if (!form || variant.stock <= 0) return false;
+        const url = picker.dataset.cartUrl.replace(/\/0\/$/, "/" + variant.id + "/");
+        form.action = url;
+        form.setAttribute("hx-post", url);
+        htmx.process(form);
+        return true;
+    }
+
+    // point the gallery at the variant's images; false when the number of slides differs
+    function showImages(variant) {
+        const slots = document.querySelectorAll("#variant-gallery img[data-slot]");
+        const count = new Set(Array.from(slots, img => img.dataset.slot)).size;
+        if (count !== variant.images.length) return false;
+        slots.forEach(img => swapPicture(img, variant.images[img.dataset.slot]));
+        return true;
+    }
+
+    function showSelection(color, size) {
+        picker.dataset.color = color;
+        picker.dataset.size = size;
+        picker.querySelectorAll("button[data-size]").forEach(button => {
+            const on = button.dataset.size === size;
+            button.style.fontWeight = on ? "bold" : "";
+            button.style.textDecoration = on ? "underline" : "";
+        });
+        picker.querySelectorAll("button[data-color]").forEach(button => {
+            button.style.border = button.dataset.color === color ? "2px solid black" : "1px solid #ccc";
+        });
+        const url = new URL(window.location);
+        url.searchParams.set("color", color);
+        url.searchParams.set("size", size);
+        history.replaceState(null, "", url);
+    }
+
+    function fetchFragment(color, size) {
+        const url = picker.dataset.fragmentUrl + "?color=" + color + "&size=" + size;
+        htmx.ajax("GET", url, {target: "#variant-gallery", swap: "outerHTML"}).then(function () {
+            $(".single-product-cover").slick({
+                slidesToShow: 1, slidesToScroll: 1, arrows: false, fade: false,
+                asNavFor: ".single-nav-thumb", adaptiveHeight: true
+            });
+            $(".single-nav-thumb").slick({
+                slidesToShow: 4, slidesToScroll: 1, asNavFor: ".single-product-cover",
+                dots: false, arrows: true, focusOnSelect: true
+            });
+        });
+    }
+
+    picker.addEventListener("click", function (event) {
+        const button = event.target.closest("button[data-size], button[data-color]");
+        if (!button) return;
+        const changed = button.dataset.color ? "color" : "size";
+        const picked = pick(
+            button.dataset.color || picker.dataset.color,
+            button.dataset.size || picker.dataset.size,
+            changed
+        );
+        if (!picked) return;
+        event.preventDefault();
+        const [color, size] = picked;
+        const variant = matrix[color + ":" + size];
+
+        showSelection(color, size);
+        showPrice(variant);
+        const cartShown = showCart(variant);
+        const imagesShown = showImages(variant);
+        if (!cartShown || !imagesShown) fetchFragment(color, size);
+    });
+})();